@@ -0,0 +1,107 @@
+"""added unique constraints for natural keys
+
+Revision ID: 810151ad637e
+Revises: 69b153928676
+Create Date: 2026-10-18 15:00:50.006971
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '810151ad637e'
+down_revision: Union[str, None] = '69b153928676'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def duplicates(table, key_columns):
+    # maps every row of a duplicated natural key to the oldest row with that key
+    return f"""
+        SELECT id, min(id) OVER (PARTITION BY {", ".join(key_columns)}) AS keep_id
+        FROM tsu.{table}
+    """
+
+
+def merge_duplicates(table, key_columns, references):
+    for referencing_table, column in references:
+        op.execute(
+            f"""
+            WITH dup AS ({duplicates(table, key_columns)})
+            UPDATE tsu.{referencing_table} t SET {column} = dup.keep_id
+            FROM dup WHERE t.{column} = dup.id AND dup.id <> dup.keep_id
+            """
+        )
+
+    op.execute(
+        f"""
+        WITH dup AS ({duplicates(table, key_columns)})
+        DELETE FROM tsu.{table} t
+        USING dup WHERE t.id = dup.id AND dup.id <> dup.keep_id
+        """
+    )
+
+
+def upgrade() -> None:
+    # rows created twice by concurrent ingests have to be merged before the constraints can be added
+    merge_duplicates(
+        "drivers",
+        ["steam_id"],
+        [("event_results", "driver_id"), ("elo", "driver_id"), ("elo_heat", "driver_id")],
+    )
+
+    # event_car_association has (event_id, car_id) as primary key, so merged cars are inserted once
+    op.execute(
+        f"""
+        WITH dup AS ({duplicates("cars", ["guid"])})
+        INSERT INTO tsu.event_car_association (event_id, car_id)
+        SELECT DISTINCT a.event_id, dup.keep_id
+        FROM tsu.event_car_association a JOIN dup ON a.car_id = dup.id
+        WHERE dup.id <> dup.keep_id
+        ON CONFLICT DO NOTHING
+        """
+    )
+    op.execute(
+        f"""
+        WITH dup AS ({duplicates("cars", ["guid"])})
+        DELETE FROM tsu.event_car_association a
+        USING dup WHERE a.car_id = dup.id AND dup.id <> dup.keep_id
+        """
+    )
+    merge_duplicates("cars", ["guid"], [("event_results", "car_id")])
+
+    merge_duplicates("tracks", ["guid"], [("events", "track_id")])
+
+    merge_duplicates(
+        "event_results",
+        ["event_id", "driver_id", "car_id", "driven_at"],
+        [("lap_results", "event_result_id")],
+    )
+
+    # checkpoint and sector results of a duplicated lap are the same as the ones of the kept lap
+    for results_table in ["checkpoint_results", "sector_results"]:
+        op.execute(
+            f"""
+            WITH dup AS ({duplicates("lap_results", ["event_result_id", "lap_time", "cflags"])})
+            DELETE FROM tsu.{results_table} t
+            USING dup WHERE t.lap_result_id = dup.id AND dup.id <> dup.keep_id
+            """
+        )
+    merge_duplicates("lap_results", ["event_result_id", "lap_time", "cflags"], [])
+
+    op.create_unique_constraint(op.f('uq_drivers_steam_id'), 'drivers', ['steam_id'], schema='tsu')
+    op.create_unique_constraint(op.f('uq_cars_guid'), 'cars', ['guid'], schema='tsu')
+    op.create_unique_constraint(op.f('uq_tracks_guid'), 'tracks', ['guid'], schema='tsu')
+    op.create_unique_constraint(op.f('uq_event_results_event_id'), 'event_results', ['event_id', 'driver_id', 'car_id', 'driven_at'], schema='tsu')
+    op.create_unique_constraint(op.f('uq_lap_results_event_result_id'), 'lap_results', ['event_result_id', 'lap_time', 'cflags'], schema='tsu')
+
+
+def downgrade() -> None:
+    op.drop_constraint(op.f('uq_lap_results_event_result_id'), 'lap_results', schema='tsu', type_='unique')
+    op.drop_constraint(op.f('uq_event_results_event_id'), 'event_results', schema='tsu', type_='unique')
+    op.drop_constraint(op.f('uq_tracks_guid'), 'tracks', schema='tsu', type_='unique')
+    op.drop_constraint(op.f('uq_cars_guid'), 'cars', schema='tsu', type_='unique')
+    op.drop_constraint(op.f('uq_drivers_steam_id'), 'drivers', schema='tsu', type_='unique')
@@ -1,13 +1,58 @@
-import sys
+import os
+import argparse
 from src.tsu_analyzer.db.Saver import Saver
+from src.tsu_analyzer.db.batch import run_batch
+from src.tsu_analyzer.db.async_pipeline import run_async_batch
 
-# Check if a file path is provided as a command-line argument
-if len(sys.argv) < 2:
-    print("Usage: pdm run python run.py <path_to_json_file>")
-    sys.exit(1)
+parser = argparse.ArgumentParser(
+    usage="pdm run python run.py <path_to_json_file> [--bulk] [--force] | <directory_or_glob>... [--workers N] [--writers N] [--asyncio [--queue-size N]] [--force]"
+)
+parser.add_argument("paths", nargs="+", help="eventstats json file, directory or glob")
+parser.add_argument(
+    "--bulk",
+    action="store_true",
+    help="write the whole file in one transaction instead of one commit per row",
+)
+parser.add_argument(
+    "--workers", type=int, default=None, help="processes reading files (batch only)"
+)
+parser.add_argument(
+    "--writers", type=int, default=1, help="parallel database writers (batch only)"
+)
+parser.add_argument(
+    "--asyncio",
+    dest="use_asyncio",
+    action="store_true",
+    help="write with async sessions (asyncpg) while the next files are parsed (batch only)",
+)
+parser.add_argument(
+    "--queue-size",
+    type=int,
+    default=None,
+    help="files parsed ahead of the writers at most (asyncio only)",
+)
+parser.add_argument(
+    "--force",
+    action="store_true",
+    help="save files again even if they were saved before",
+)
+args = parser.parse_args()
 
-# The first argument is always the script name, so the second argument (index 1) is the file path
-file_path = sys.argv[1]
+# a single file keeps the old behaviour, everything else is a batch
+if len(args.paths) == 1 and os.path.isfile(args.paths[0]):
+    saver = Saver(args.paths[0])
 
-saver = Saver(file_path)
-saver.run()
+    if args.bulk:
+        saver.run_bulk(force=args.force)
+    else:
+        saver.run(force=args.force)
+elif args.use_asyncio:
+    run_async_batch(
+        args.paths,
+        parsers=args.workers,
+        writers=args.writers,
+        queue_size=args.queue_size,
+        force=args.force,
+    )
+else:
+    run_batch(args.paths, workers=args.workers, writers=args.writers, force=args.force)
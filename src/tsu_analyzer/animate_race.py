@@ -1,26 +1,42 @@
 import sys
+import argparse
 
 sys.path.append(".")
 from src.tsu_analyzer.helpers import *
 
-if len(sys.argv) < 5:
-    print(
-        "Usage: pdm run python src/tsu_analyzer/animate_race.py <path_to_track_csv_file> <name_of_track> <author> <path_to_result_file>"
-    )
-    sys.exit(1)
+parser = argparse.ArgumentParser(
+    usage="pdm run python src/tsu_analyzer/animate_race.py <path_to_track_csv_file> <name_of_track> <author> <path_to_result_file> [--workers N] [--max-buffer-mb MB]"
+)
+parser.add_argument("track_file_path")
+parser.add_argument("name_of_track")
+parser.add_argument("author")
+parser.add_argument("result_file_path")
+parser.add_argument(
+    "--workers",
+    type=int,
+    default=None,
+    help="render the frames in N processes and pipe them to one ffmpeg process",
+)
+parser.add_argument(
+    "--max-buffer-mb",
+    type=float,
+    default=MAX_BUFFER_MB,
+    help="memory for rendered frames waiting for ffmpeg (with --workers): at most 2 frames per worker "
+    "and never more than this, a frame at dpi 300 is ~27 MB (default: %(default)s)",
+)
+args = parser.parse_args()
 
-# The first argument is always the script name, so the second argument (index 1) is the file path
-track_file_path = sys.argv[1]
-name_of_track = sys.argv[2]
-author = sys.argv[3]
-result_file_path = sys.argv[4]
+track_file_path = args.track_file_path
+name_of_track = args.name_of_track
+author = args.author
+result_file_path = args.result_file_path
 
 ## using track csv file
 df_track = get_track_data(track_file_path)
 df_track.to_csv("track.csv", index=False)
 
-## using result json file
-result_dict = get_result_data(result_file_path)
+## using result json file (parsed once into columnar tables, cached as parquet if pyarrow is installed)
+result_dict = load_event_tables(result_file_path)
 df_drivers = get_drivers_df(result_dict)
 df_drivers.to_csv("driver.csv", index=False)
 df_results = get_results_df(result_dict)
@@ -38,4 +54,12 @@ df = pd.merge(
     right_on="cp",
 )
 
-animate_race(df, df_track, "animations/race_animation.mp4", name_of_track, author)
+animate_race(
+    df,
+    df_track,
+    "animations/race_animation.mp4",
+    name_of_track,
+    author,
+    workers=args.workers,
+    max_buffer_mb=args.max_buffer_mb,
+)
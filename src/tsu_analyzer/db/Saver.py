@@ -1,98 +1,96 @@
-import os
 import json
+import hashlib
 import pandas as pd
 from datetime import datetime
-from sqlalchemy import create_engine, select, desc, and_
+from functools import cached_property
+from sqlalchemy import select, insert, update, delete, desc, func
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.orm import Session
-from dotenv import load_dotenv
 import sys
 
 sys.path.append(".")
 from src.tsu_analyzer.db.models import *
+from src.tsu_analyzer.db.identity_cache import identity_cache, get_detached
+from src.tsu_analyzer.db.copy_writer import copy_rows
+from src.tsu_analyzer.db.engine import get_engine as get_shared_engine
+from src.tsu_analyzer.stream_parser import iter_event
+from src.tsu_analyzer.db.ledger import (
+    PROCESSOR_SAVER,
+    get_path_hash,
+    get_ingested_file,
+    is_ingested,
+    claim_file,
+)
 
 
 class Saver:
     def __init__(self, file_name) -> None:
-        with open(file_name, "r", encoding="utf-8") as file:
-            self.data = json.load(file)
+        self.file_name = file_name
 
-    def get_engine(self):
-        load_dotenv()
+        # the file is only parsed when needed, already saved files are recognized by their hash
+        # (read in chunks, the file is never held in memory as a whole)
+        self.file_hash = get_path_hash(file_name)
 
-        return create_engine(os.environ.get("TSU_HOTLAPPING_POSTGRES_URL"), echo=True)
-
-    @staticmethod
-    def get_or_create_driver(engine, driver_dict):
+    @cached_property
+    def data(self):
+        # the whole document, only used by the legacy run(), the bulk paths stream the file
+        with open(self.file_name, "rb") as file:
+            return json.load(file)
 
+    def is_saved(self, engine):
         with Session(engine) as session:
-            try:
-                driver = session.scalars(
-                    select(Driver).where(Driver.steam_id == driver_dict["id"])
-                ).first()
-
-                if not driver:
-                    driver = Driver(
-                        name=driver_dict["name"],
-                        steam_id=driver_dict["id"],
-                        clan=driver_dict["clan"],
-                        flag=driver_dict["flag"],
-                    )
-                    session.add(driver)
-                    session.commit()
-            except Exception as e:
-                print("Error:", e)
-                session.rollback()
+            return is_ingested(session, PROCESSOR_SAVER, self.file_hash)
 
-        return driver
+    @staticmethod
+    def get_engine():
+        # the process wide engine, no longer a new one with echo=True for every call
+        return get_shared_engine()
 
     @staticmethod
-    def get_or_create_car(engine, car_dict):
+    def get_or_create_driver(engine, driver_dict):
+        with Session(engine) as session, session.begin():
+            driver_id = Saver.get_or_create_driver_ids(session, [driver_dict])[
+                driver_dict["id"]
+            ]
 
-        with Session(engine) as session:
-            try:
-                car = session.scalars(
-                    select(Car).where(Car.guid == car_dict["guid"])
-                ).first()
+        return get_detached(
+            Driver,
+            driver_id,
+            name=driver_dict["name"],
+            steam_id=driver_dict["id"],
+            clan=driver_dict["clan"],
+            flag=driver_dict["flag"],
+        )
 
-                if not car:
-                    car = Car(name=car_dict["name"], guid=car_dict["guid"])
-                    session.add(car)
-                    session.commit()
-            except Exception as e:
-                print("Error:", e)
-                session.rollback()
+    @staticmethod
+    def get_or_create_car(engine, car_dict):
+        with Session(engine) as session, session.begin():
+            car_id = Saver.get_or_create_car_ids(session, [car_dict])[car_dict["guid"]]
 
-        return car
+        return get_detached(Car, car_id, name=car_dict["name"], guid=car_dict["guid"])
 
     @staticmethod
     def get_or_create_track(engine, track_dict):
-
-        with Session(engine) as session:
-            try:
-                track = session.scalars(
-                    select(Track).where(Track.guid == track_dict["guid"])
-                ).first()
-
-                if not track:
-                    track = Track(
-                        name=track_dict["name"],
-                        guid=track_dict["guid"],
-                        maker_id=track_dict["makerId"],
-                        level_type=track_dict["levelType"],
-                    )
-                    session.add(track)
-                    session.commit()
-            except Exception as e:
-                print("Error:", e)
-                session.rollback()
-
-        return track
+        with Session(engine) as session, session.begin():
+            track_id = Saver.get_or_create_track_id(session, track_dict)
+
+        return get_detached(
+            Track,
+            track_id,
+            name=track_dict["name"],
+            guid=track_dict["guid"],
+            maker_id=track_dict["makerId"],
+            level_type=track_dict["levelType"],
+        )
 
     @staticmethod
     def get_create_or_update_event(engine, event_dict):
         with Session(engine) as session:
             session.add(event_dict["track"])
 
+            # events have no natural key, so concurrent ingests of the same track are serialized
+            session.execute(select(func.pg_advisory_xact_lock(event_dict["track"].id)))
+
             event = session.scalars(
                 select(Event)
                 .where(Event.track_id == event_dict["track"].id)
@@ -116,136 +114,662 @@ class Saver:
     @staticmethod
     def get_or_create_event_result(engine, event_result_dict):
 
-        with Session(engine) as session:
+        with Session(engine) as session, session.begin():
             session.add(event_result_dict["event"])
             session.add(event_result_dict["driver"])
             session.add(event_result_dict["car"])
 
-            try:
-                event_result = session.scalars(
-                    select(EventResult).where(
-                        and_(
-                            EventResult.event_id == event_result_dict["event"].id,
-                            EventResult.driver_id == event_result_dict["driver"].id,
-                            EventResult.car_id == event_result_dict["car"].id,
-                            EventResult.driven_at == event_result_dict["driven_at"],
-                        )
-                    )
-                ).first()
-
-                if not event_result:
-                    event_result = EventResult(
-                        event_id=event_result_dict["event"].id,
-                        driver_id=event_result_dict["driver"].id,
-                        car_id=event_result_dict["car"].id,
-                        driven_at=event_result_dict["driven_at"],
-                    )
-                    session.add(event_result)
-                    session.commit()
-            except Exception as e:
-                print("Error:", e)
-                session.rollback()
+            event_id = event_result_dict["event"].id
+            driver_car_id = (
+                event_result_dict["driver"].id,
+                event_result_dict["car"].id,
+            )
 
-        return event_result
+            event_result_id = Saver.get_or_create_event_result_ids(
+                session, event_id, event_result_dict["driven_at"], [driver_car_id]
+            )[driver_car_id]
+
+        return get_detached(
+            EventResult,
+            event_result_id,
+            event_id=event_id,
+            driver_id=driver_car_id[0],
+            car_id=driver_car_id[1],
+            driven_at=event_result_dict["driven_at"],
+        )
 
     @staticmethod
     def get_or_create_lap_result(engine, lap_result_dict):
 
-        with Session(engine) as session:
+        with Session(engine) as session, session.begin():
             session.add(lap_result_dict["event_result"])
 
-            try:
-                lap_result = session.scalars(
-                    select(LapResult).where(
-                        and_(
-                            LapResult.event_result_id
-                            == lap_result_dict["event_result"].id,
-                            LapResult.lap_time == lap_result_dict["lap_time"],
-                            LapResult.cflags == lap_result_dict["cflags"],
-                        )
-                    )
-                ).first()
+            lap_key = (
+                lap_result_dict["event_result"].id,
+                lap_result_dict["lap_time"],
+                lap_result_dict["cflags"],
+            )
 
-                if not lap_result:
-                    lap_result = LapResult(
-                        event_result_id=lap_result_dict["event_result"].id,
-                        lap_time=lap_result_dict["lap_time"],
-                        cflags=lap_result_dict["cflags"],
-                    )
-                    session.add(lap_result)
-                    session.commit()
-            except Exception as e:
-                print("Error:", e)
-                session.rollback()
+            lap_result_id, checkpoint_hash = Saver.get_or_create_lap_result_rows(
+                session, [lap_key]
+            )[lap_key]
+
+            event_result = lap_result_dict["event_result"]
+            Saver.update_best_laps(
+                session,
+                [
+                    {
+                        "event_id": event_result.event_id,
+                        "driver_id": event_result.driver_id,
+                        "car_id": event_result.car_id,
+                        "lap_result_id": lap_result_id,
+                        "lap_time": lap_key[1],
+                    }
+                ],
+            )
 
-        return lap_result
+        return get_detached(
+            LapResult,
+            lap_result_id,
+            event_result_id=lap_key[0],
+            lap_time=lap_key[1],
+            cflags=lap_key[2],
+            checkpoint_hash=checkpoint_hash,
+        )
 
+    # the statements for the checkpoint and sector results of a lap do not commit,
+    # save_lap_details runs them in one transaction so the hash is only saved together with the results
     @staticmethod
     def delete_existing_cp_results(session, lap_result_id):
-        try:
-            session.query(CheckpointResult).filter(
-                CheckpointResult.lap_result_id == lap_result_id
-            ).delete()
-            session.commit()
-        except Exception as e:
-            print(
-                f"Error deleting existing Checkpoint Results for lap_result_id: {lap_result_id}",
-                e,
-            )
-            session.rollback()
+        session.query(CheckpointResult).filter(
+            CheckpointResult.lap_result_id == lap_result_id
+        ).delete()
 
     @staticmethod
     def insert_new_cp_results(session, lap_result_id, cp_results):
-        try:
-            mappings = [
-                {
-                    "lap_result_id": lap_result_id,
-                    "time": cp_result["time"],
-                    "is_sector": cp_result["is_sector"],
-                    "number": cp_result["number"],
-                }
-                for cp_result in cp_results
-            ]
-            session.bulk_insert_mappings(CheckpointResult, mappings)
-            session.commit()
-        except Exception as e:
-            print("Error inserting new checkpoint times:", e)
-            session.rollback()
+        mappings = [
+            {
+                "lap_result_id": lap_result_id,
+                "time": cp_result["time"],
+                "is_sector": cp_result["is_sector"],
+                "number": cp_result["number"],
+            }
+            for cp_result in cp_results
+        ]
+        session.bulk_insert_mappings(CheckpointResult, mappings)
 
     @staticmethod
     def delete_existing_sector_results(session, lap_result_id):
+        session.query(SectorResult).filter(
+            SectorResult.lap_result_id == lap_result_id
+        ).delete()
+
+    @staticmethod
+    def insert_new_sector_results(session, lap_result_id, sector_results):
+        mappings = [
+            {
+                "lap_result_id": lap_result_id,
+                "time": sector_result["time"],
+                "number": sector_result["number"],
+            }
+            for sector_result in sector_results
+        ]
+        session.bulk_insert_mappings(SectorResult, mappings)
+
+    @staticmethod
+    def update_checkpoint_hash(session, lap_result_id, checkpoint_hash):
+        session.execute(
+            update(LapResult)
+            .where(LapResult.id == lap_result_id)
+            .values(checkpoint_hash=checkpoint_hash)
+        )
+
+    @staticmethod
+    def save_lap_details(engine, lap_result_id, cp_results, sector_results, checkpoint_hash):
+        # replaces the checkpoint and sector results of a lap and records their hash,
+        # either all of it is saved or nothing (the hash stays as it was and the lap is redone next time)
         try:
-            session.query(SectorResult).filter(
-                SectorResult.lap_result_id == lap_result_id
-            ).delete()
-            session.commit()
+            with Session(engine) as session, session.begin():
+                Saver.delete_existing_cp_results(session, lap_result_id)
+                Saver.insert_new_cp_results(session, lap_result_id, cp_results)
+                Saver.delete_existing_sector_results(session, lap_result_id)
+                Saver.insert_new_sector_results(session, lap_result_id, sector_results)
+                Saver.update_checkpoint_hash(session, lap_result_id, checkpoint_hash)
         except Exception as e:
             print(
-                f"Error deleting existing Sector Results for lap_result_id: {lap_result_id}",
+                f"Error saving checkpoint and sector results for lap_result_id: {lap_result_id}",
                 e,
             )
-            session.rollback()
 
     @staticmethod
-    def insert_new_sector_results(session, lap_result_id, sector_results):
-        try:
-            mappings = [
+    def get_or_create_driver_ids(session, driver_dicts):
+        driver_dicts = {driver_dict["id"]: driver_dict for driver_dict in driver_dicts}
+
+        identity_cache.warm(session.get_bind())
+        driver_ids = identity_cache.get_many(Driver, driver_dicts)
+
+        missing_drivers = [
+            {
+                "name": driver_dict["name"],
+                "steam_id": steam_id,
+                "clan": driver_dict["clan"],
+                "flag": driver_dict["flag"],
+            }
+            # sorted so concurrent ingests lock the same rows in the same order
+            for steam_id, driver_dict in sorted(driver_dicts.items())
+            if steam_id not in driver_ids
+        ]
+
+        if missing_drivers:
+            # existing drivers are left untouched, the no-op update makes RETURNING include them
+            statement = pg_insert(Driver)
+            statement = statement.on_conflict_do_update(
+                index_elements=[Driver.steam_id],
+                set_={"steam_id": statement.excluded.steam_id},
+            ).returning(Driver.steam_id, Driver.id)
+
+            new_driver_ids = dict(session.execute(statement, missing_drivers).all())
+            driver_ids.update(new_driver_ids)
+            identity_cache.put_after_commit(session, Driver, new_driver_ids)
+
+        return driver_ids
+
+    @staticmethod
+    def get_or_create_car_ids(session, car_dicts):
+        car_dicts = {car_dict["guid"]: car_dict for car_dict in car_dicts}
+
+        identity_cache.warm(session.get_bind())
+        car_ids = identity_cache.get_many(Car, car_dicts)
+
+        missing_cars = [
+            {"name": car_dict["name"], "guid": guid}
+            for guid, car_dict in sorted(car_dicts.items())
+            if guid not in car_ids
+        ]
+
+        if missing_cars:
+            statement = pg_insert(Car)
+            statement = statement.on_conflict_do_update(
+                index_elements=[Car.guid],
+                set_={"guid": statement.excluded.guid},
+            ).returning(Car.guid, Car.id)
+
+            new_car_ids = dict(session.execute(statement, missing_cars).all())
+            car_ids.update(new_car_ids)
+            identity_cache.put_after_commit(session, Car, new_car_ids)
+
+        return car_ids
+
+    @staticmethod
+    def get_or_create_track_id(session, track_dict):
+        identity_cache.warm(session.get_bind())
+        track_id = identity_cache.get(Track, track_dict["guid"])
+
+        if track_id is not None:
+            return track_id
+
+        statement = pg_insert(Track).values(
+            name=track_dict["name"],
+            guid=track_dict["guid"],
+            maker_id=track_dict["makerId"],
+            level_type=track_dict["levelType"],
+        )
+        statement = statement.on_conflict_do_update(
+            index_elements=[Track.guid],
+            set_={"guid": statement.excluded.guid},
+        ).returning(Track.id)
+
+        track_id = session.scalars(statement).one()
+        identity_cache.put_after_commit(session, Track, {track_dict["guid"]: track_id})
+
+        return track_id
+
+    @staticmethod
+    def get_create_or_update_event_id(session, track_id, car_ids):
+        # events have no natural key, so concurrent ingests of the same track are serialized
+        session.execute(select(func.pg_advisory_xact_lock(track_id)))
+
+        event_id = session.scalars(
+            select(Event.id)
+            .where(Event.track_id == track_id)
+            .order_by(desc(Event.created_at))
+        ).first()
+
+        if event_id is None:
+            event_id = session.scalars(
+                insert(Event).returning(Event.id), [{"track_id": track_id}]
+            ).one()
+
+        if car_ids:
+            session.execute(
+                pg_insert(event_car_association).on_conflict_do_nothing(),
+                [{"event_id": event_id, "car_id": car_id} for car_id in set(car_ids)],
+            )
+
+        return event_id
+
+    @staticmethod
+    def get_or_create_event_result_ids(session, event_id, driven_at, driver_car_ids):
+        statement = pg_insert(EventResult)
+        statement = statement.on_conflict_do_update(
+            index_elements=[
+                EventResult.event_id,
+                EventResult.driver_id,
+                EventResult.car_id,
+                EventResult.driven_at,
+            ],
+            set_={"event_id": statement.excluded.event_id},
+        ).returning(EventResult.id, EventResult.driver_id, EventResult.car_id)
+
+        rows = session.execute(
+            statement,
+            [
                 {
-                    "lap_result_id": lap_result_id,
-                    "time": sector_result["time"],
-                    "number": sector_result["number"],
+                    "event_id": event_id,
+                    "driver_id": driver_id,
+                    "car_id": car_id,
+                    "driven_at": driven_at,
                 }
-                for sector_result in sector_results
+                for driver_id, car_id in dict.fromkeys(driver_car_ids)
+            ],
+        ).all()
+
+        return {
+            (driver_id, car_id): event_result_id
+            for event_result_id, driver_id, car_id in rows
+        }
+
+    @staticmethod
+    def get_or_create_lap_result_rows(session, lap_keys):
+        # returns id and saved checkpoint hash (None for new laps) by natural key
+        statement = pg_insert(LapResult)
+        statement = statement.on_conflict_do_update(
+            index_elements=[LapResult.event_result_id, LapResult.lap_time, LapResult.cflags],
+            set_={"event_result_id": statement.excluded.event_result_id},
+        ).returning(
+            LapResult.id,
+            LapResult.event_result_id,
+            LapResult.lap_time,
+            LapResult.cflags,
+            LapResult.checkpoint_hash,
+        )
+
+        rows = session.execute(
+            statement,
+            [
+                {"event_result_id": event_result_id, "lap_time": lap_time, "cflags": cflags}
+                for event_result_id, lap_time, cflags in dict.fromkeys(lap_keys)
+            ],
+        ).all()
+
+        return {
+            (event_result_id, lap_time, cflags): (lap_result_id, checkpoint_hash)
+            for lap_result_id, event_result_id, lap_time, cflags, checkpoint_hash in rows
+        }
+
+    @staticmethod
+    def update_best_laps(session, best_laps):
+        # a driver's personal best of the event is only replaced by a faster lap (or the same time set earlier)
+        best_laps = sorted(best_laps, key=lambda best_lap: best_lap["driver_id"])
+
+        if not best_laps:
+            return
+
+        statement = pg_insert(EventBestLap)
+        session.execute(
+            statement.on_conflict_do_update(
+                index_elements=[EventBestLap.event_id, EventBestLap.driver_id],
+                set_={
+                    "car_id": statement.excluded.car_id,
+                    "lap_result_id": statement.excluded.lap_result_id,
+                    "lap_time": statement.excluded.lap_time,
+                    "modified_at": statement.excluded.modified_at,
+                },
+                where=(EventBestLap.lap_time > statement.excluded.lap_time)
+                | (
+                    (EventBestLap.lap_time == statement.excluded.lap_time)
+                    & (EventBestLap.lap_result_id > statement.excluded.lap_result_id)
+                ),
+            ),
+            best_laps,
+        )
+
+    @staticmethod
+    def get_checkpoint_hash(cp_times_this_lap, first_cp_time_next_lap, indices_sectors):
+        # checkpoint and sector results of a lap are derived from exactly these values
+        content = json.dumps([cp_times_this_lap, first_cp_time_next_lap, indices_sectors])
+        return hashlib.sha1(content.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def get_lap_results(all_checkpoint_times, number_checkpoints, indices_sectors):
+        lap_results = []
+
+        for j, lap_checkpoint_times in enumerate(all_checkpoint_times):
+            cp_times_this_lap = lap_checkpoint_times["times"]
+
+            # last lap_checkpoint_times entry consists of one checkpoint time, namely finish line time
+            if len(cp_times_this_lap) == 1 or j + 1 == len(all_checkpoint_times):
+                continue
+
+            # double check if driver passed all checkpoints
+            if len(cp_times_this_lap) != number_checkpoints:
+                continue
+
+            first_cp_time_next_lap = all_checkpoint_times[j + 1]["times"][0]
+
+            # each checkpoint time is the difference to the next checkpoint,
+            # for the last one it is the difference to the start and finish line
+            cp_times_closed = cp_times_this_lap + [first_cp_time_next_lap]
+            cp_results = [
+                {
+                    "time": (cp_times_closed[k + 1] - cp_times_closed[k]) / 10000.0,
+                    "is_sector": k + 1 in indices_sectors or k + 1 == number_checkpoints,
+                    "number": k + 1,
+                }
+                for k in range(len(cp_times_this_lap))
             ]
-            session.bulk_insert_mappings(SectorResult, mappings)
-            session.commit()
-        except Exception as e:
-            print("Error inserting new sector times:", e)
-            session.rollback()
 
-    def run(self):
+            sector_times_closed = [cp_times_this_lap[ind] for ind in indices_sectors] + [
+                first_cp_time_next_lap
+            ]
+            sector_results = [
+                {
+                    "time": (sector_times_closed[l + 1] - sector_times_closed[l])
+                    / 10000.0,
+                    "number": l + 1,
+                }
+                for l in range(len(sector_times_closed) - 1)
+            ]
+
+            lap_results.append(
+                {
+                    "lap_time": (first_cp_time_next_lap - cp_times_this_lap[0]) / 10000.0,
+                    "cflags": lap_checkpoint_times["cFlags"],
+                    "checkpoint_hash": Saver.get_checkpoint_hash(
+                        cp_times_this_lap, first_cp_time_next_lap, indices_sectors
+                    ),
+                    "cp_results": cp_results,
+                    "sector_results": sector_results,
+                }
+            )
+
+        return lap_results
+
+    def iter_rows(self):
+        # Single pass over the file, yields
+        # - ("event", rows) once, the rows of the event with lap_results None for every player
+        # - ("player", (player_index, lap_results)) for every player with stats, as soon as they are parsed
+        # so only the checkpoint times of one player are in memory at a time
+        with open(self.file_name, "rb") as file:
+            for kind, value in iter_event(file):
+                if kind == "event":
+                    event = value
+
+                    number_checkpoints = len(
+                        event["raceStats"]["checkpoints"]["checkpointToSector"]
+                    )
+
+                    if event["level"]["levelType"] == "SpecialStage":
+                        number_checkpoints -= 1
+
+                    indices_sectors = event["raceStats"]["checkpoints"]["sectorToCheckpoint"]
+
+                    # players without stats only get registered as drivers of the event
+                    players = [
+                        {
+                            "driver": player["player"],
+                            "car": player["vehicle"],
+                            "lap_results": None,
+                        }
+                        for player in event["players"]
+                    ]
+
+                    yield "event", {
+                        "ingested_file": get_ingested_file(
+                            self.file_name, self.file_hash, event
+                        ),
+                        "track": event["level"],
+                        "driven_at": datetime.strptime(
+                            event["utcStartTime"], "%Y-%m-%dT%H:%M:%S%z"
+                        ),
+                        "players": players,
+                    }
+                else:
+                    i, player_stat = value
+
+                    if i < len(players):
+                        yield "player", (
+                            i,
+                            self.get_lap_results(
+                                player_stat["checkpointTimes"],
+                                number_checkpoints,
+                                indices_sectors,
+                            ),
+                        )
+
+    def get_rows(self):
+        # all rows of the file in one dict, for the batch and async pipelines that parse in another process
+        for kind, value in self.iter_rows():
+            if kind == "event":
+                rows = value
+            else:
+                i, lap_results = value
+                rows["players"][i]["lap_results"] = lap_results
+
+        return rows
+
+    @staticmethod
+    def write_event(session, rows, force=False):
+        # drivers, cars, track and event of a file, returns the ids needed to write the players
+        # or None if the file was already saved
+        # the file is recorded in the same transaction, so it is either saved and recorded or neither
+        if not claim_file(session, PROCESSOR_SAVER, rows["ingested_file"]) and not force:
+            print(f"Skipping {rows['ingested_file']['file_name']}, it was already saved")
+            return None
+
+        players = rows["players"]
+
+        ### DRIVERS, CARS & TRACK ###
+        driver_ids = Saver.get_or_create_driver_ids(
+            session, [player["driver"] for player in players]
+        )
+        car_ids = Saver.get_or_create_car_ids(
+            session, [player["car"] for player in players]
+        )
+        track_id = Saver.get_or_create_track_id(session, rows["track"])
+
+        ### EVENT ###
+        event_id = Saver.get_create_or_update_event_id(
+            session, track_id, [car_ids[player["car"]["guid"]] for player in players]
+        )
+
+        return {
+            "event_id": event_id,
+            "driven_at": rows["driven_at"],
+            "driver_ids": driver_ids,
+            "car_ids": car_ids,
+        }
+
+    @staticmethod
+    def write_players(session, event_ids, players, use_copy=True):
+        # event results, lap results, best laps and checkpoint and sector results of players with stats,
+        # called once with all players of a file or once per player while the file is streamed
+        event_id = event_ids["event_id"]
+
+        ### EVENT RESULTS ###
+        players = [
+            (
+                event_ids["driver_ids"][player["driver"]["id"]],
+                event_ids["car_ids"][player["car"]["guid"]],
+                player["lap_results"],
+            )
+            for player in players
+            if player["lap_results"] is not None
+        ]
+
+        if not players:
+            return
+
+        event_result_ids = Saver.get_or_create_event_result_ids(
+            session,
+            event_id,
+            event_ids["driven_at"],
+            [(driver_id, car_id) for driver_id, car_id, _ in players],
+        )
+
+        ### LAP RESULTS ###
+        # laps with the same natural key are the same lap result, the last one wins
+        lap_results = {}
+        for driver_id, car_id, player_lap_results in players:
+            event_result_id = event_result_ids[(driver_id, car_id)]
+            for lap_result in player_lap_results:
+                lap_key = (event_result_id, lap_result["lap_time"], lap_result["cflags"])
+                lap_results[lap_key] = lap_result
+
+        if not lap_results:
+            return
+
+        lap_result_rows = Saver.get_or_create_lap_result_rows(session, lap_results.keys())
+
+        ### BEST LAPS ###
+        driver_car_ids = {
+            event_result_id: driver_car_id
+            for driver_car_id, event_result_id in event_result_ids.items()
+        }
+
+        best_laps = {}
+        for lap_key in lap_results:
+            event_result_id, lap_time, _ = lap_key
+            driver_id, car_id = driver_car_ids[event_result_id]
+            lap_result_id = lap_result_rows[lap_key][0]
+
+            best_lap = best_laps.get(driver_id)
+            if best_lap is None or (lap_time, lap_result_id) < (
+                best_lap["lap_time"],
+                best_lap["lap_result_id"],
+            ):
+                best_laps[driver_id] = {
+                    "event_id": event_id,
+                    "driver_id": driver_id,
+                    "car_id": car_id,
+                    "lap_result_id": lap_result_id,
+                    "lap_time": lap_time,
+                }
+
+        Saver.update_best_laps(session, best_laps.values())
+
+        # laps whose checkpoint times are already saved are skipped entirely
+        changed_laps = {
+            lap_result_rows[lap_key][0]: lap_result
+            for lap_key, lap_result in lap_results.items()
+            if lap_result_rows[lap_key][1] != lap_result["checkpoint_hash"]
+        }
+
+        if not changed_laps:
+            return
+
+        ### CHECKPOINT & SECTOR RESULTS ###
+        cp_mappings = []
+        sector_mappings = []
+
+        for lap_result_id, lap_result in changed_laps.items():
+            cp_mappings.extend(
+                {"lap_result_id": lap_result_id, **cp_result}
+                for cp_result in lap_result["cp_results"]
+            )
+            sector_mappings.extend(
+                {"lap_result_id": lap_result_id, **sector_result}
+                for sector_result in lap_result["sector_results"]
+            )
+
+        session.execute(
+            delete(CheckpointResult).where(
+                CheckpointResult.lap_result_id.in_(list(changed_laps))
+            )
+        )
+        session.execute(
+            delete(SectorResult).where(SectorResult.lap_result_id.in_(list(changed_laps)))
+        )
+
+        # checkpoint results are by far the largest table, COPY is a lot faster than INSERT
+        if use_copy:
+            copy_rows(session, CheckpointResult, cp_mappings)
+            copy_rows(session, SectorResult, sector_mappings)
+        else:
+            if cp_mappings:
+                session.execute(insert(CheckpointResult), cp_mappings)
+            if sector_mappings:
+                session.execute(insert(SectorResult), sector_mappings)
+
+        session.execute(
+            update(LapResult),
+            [
+                {"id": lap_result_id, "checkpoint_hash": lap_result["checkpoint_hash"]}
+                for lap_result_id, lap_result in changed_laps.items()
+            ],
+        )
+
+    @staticmethod
+    def write_rows(session, rows, use_copy=True, force=False):
+        # all rows of a file from get_rows
+        event_ids = Saver.write_event(session, rows, force=force)
+
+        if event_ids is None:
+            return False
+
+        Saver.write_players(session, event_ids, rows["players"], use_copy=use_copy)
+
+        return True
+
+    @staticmethod
+    def save_rows(engine, rows, use_copy=True, force=False):
+        # everything of one file is written in a single transaction
+        with Session(engine) as session, session.begin():
+            return Saver.write_rows(session, rows, use_copy=use_copy, force=force)
+
+    def stream_rows(self, engine, use_copy=True, force=False):
+        # writes every player as soon as it is parsed, all in a single transaction,
+        # returns the rows with only lap time and cflags of every lap (for the watcher's leaderboards)
+        # or None if the file was already saved
+        with Session(engine) as session, session.begin():
+            for kind, value in self.iter_rows():
+                if kind == "event":
+                    rows = value
+                    event_ids = self.write_event(session, rows, force=force)
+
+                    if event_ids is None:
+                        return None
+                else:
+                    i, lap_results = value
+                    player = {**rows["players"][i], "lap_results": lap_results}
+
+                    self.write_players(session, event_ids, [player], use_copy=use_copy)
+
+                    rows["players"][i]["lap_results"] = [
+                        {"lap_time": lap_result["lap_time"], "cflags": lap_result["cflags"]}
+                        for lap_result in lap_results
+                    ]
+
+        return rows
+
+    def run_bulk(self, force=False, engine=None):
+        # long running processes (watcher) pass their own engine to keep the connections warm
+        engine = engine or self.get_engine()
+
+        if not force and self.is_saved(engine):
+            print(f"Skipping {self.file_name}, it was already saved")
+            return
+
+        # the saved rows are returned for the watcher's leaderboards
+        return self.stream_rows(engine, force=force)
+
+    def run(self, force=False):
         engine = self.get_engine()
 
+        if not force and self.is_saved(engine):
+            print(f"Skipping {self.file_name}, it was already saved")
+            return
+
         # start time of hotlapping event
         self.start_time = self.data["utcStartTime"]
 
@@ -331,67 +855,75 @@ class Saver:
                     lap_result = self.get_or_create_lap_result(engine, lap_result_dict)
                     print(lap_result)
 
-                    ### Checkpoint Result ###
-
-                    with Session(engine) as session:
-                        session.add(lap_result)
-                        self.delete_existing_cp_results(session, lap_result.id)
-
-                        cp_results = []
-
-                        for k, cp_time in enumerate(cp_times_this_lap):
-                            cp_result = {}
-
-                            # calculate time difference between next sector time and this one
-                            # this is relevant for the last checkpoint time before start and finish line
-                            if k + 1 == len(cp_times_this_lap):
-                                cp_result["time"] = (
-                                    first_cp_time_next_lap - cp_time
-                                ) / 10000.0
-                            else:
-                                # this is valid for all others
-                                cp_result["time"] = (
-                                    cp_times_this_lap[k + 1] - cp_time
-                                ) / 10000.0
+                    checkpoint_hash = self.get_checkpoint_hash(
+                        cp_times_this_lap, first_cp_time_next_lap, indices_sectors
+                    )
 
-                            # the very first cp is flagged as a
-                            cp_result["is_sector"] = (
-                                k + 1 in indices_sectors or k + 1 == number_checkpoints
-                            )
-                            cp_result["number"] = k + 1
+                    # checkpoint and sector results of this lap are already saved
+                    if lap_result.checkpoint_hash == checkpoint_hash:
+                        continue
 
-                            cp_results.append(cp_result)
+                    ### Checkpoint Result ###
+                    cp_results = []
+
+                    for k, cp_time in enumerate(cp_times_this_lap):
+                        cp_result = {}
+
+                        # calculate time difference between next sector time and this one
+                        # this is relevant for the last checkpoint time before start and finish line
+                        if k + 1 == len(cp_times_this_lap):
+                            cp_result["time"] = (
+                                first_cp_time_next_lap - cp_time
+                            ) / 10000.0
+                        else:
+                            # this is valid for all others
+                            cp_result["time"] = (
+                                cp_times_this_lap[k + 1] - cp_time
+                            ) / 10000.0
+
+                        # the very first cp is flagged as a
+                        cp_result["is_sector"] = (
+                            k + 1 in indices_sectors or k + 1 == number_checkpoints
+                        )
+                        cp_result["number"] = k + 1
 
-                        self.insert_new_cp_results(session, lap_result.id, cp_results)
+                        cp_results.append(cp_result)
 
-                        ### SECTOR RESULTS ###
-                        self.delete_existing_sector_results(session, lap_result.id)
+                    ### SECTOR RESULTS ###
+                    sector_times_this_lap = [
+                        cp_times_this_lap[ind] for ind in indices_sectors
+                    ]
 
-                        sector_times_this_lap = [
-                            cp_times_this_lap[ind] for ind in indices_sectors
-                        ]
+                    sector_results = []
 
-                        sector_results = []
+                    for l, sector_time in enumerate(sector_times_this_lap):
+                        sector_result = dict()
 
-                        for l, sector_time in enumerate(sector_times_this_lap):
-                            sector_result = dict()
+                        if l + 1 == len(sector_times_this_lap):
+                            sector_result["time"] = (
+                                first_cp_time_next_lap - sector_time
+                            ) / 10000.0
+                        else:
+                            sector_result["time"] = (
+                                sector_times_this_lap[l + 1] - sector_time
+                            ) / 10000.0
 
-                            if l + 1 == len(sector_times_this_lap):
-                                sector_result["time"] = (
-                                    first_cp_time_next_lap - sector_time
-                                ) / 10000.0
-                            else:
-                                sector_result["time"] = (
-                                    sector_times_this_lap[l + 1] - sector_time
-                                ) / 10000.0
+                        sector_result["number"] = l + 1
 
-                            sector_result["number"] = l + 1
+                        sector_results.append(sector_result)
 
-                            sector_results.append(sector_result)
+                    # replaced together with the hash, a failed lap is redone on the next reingest
+                    self.save_lap_details(
+                        engine, lap_result.id, cp_results, sector_results, checkpoint_hash
+                    )
 
-                        self.insert_new_sector_results(
-                            session, lap_result.id, sector_results
-                        )
+        ### INGESTED FILE ###
+        with Session(engine) as session, session.begin():
+            claim_file(
+                session,
+                PROCESSOR_SAVER,
+                get_ingested_file(self.file_name, self.file_hash, self.data),
+            )
 
 
 if __name__ == "__main__":
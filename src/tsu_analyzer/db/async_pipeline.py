@@ -0,0 +1,201 @@
+import os
+import sys
+import time
+import asyncio
+from datetime import datetime, timedelta
+from concurrent.futures import ProcessPoolExecutor
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+# asyncpg is optional (pdm install -G async), the sqlalchemy async engine needs it as driver
+try:
+    import asyncpg
+    from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+except ImportError:
+    asyncpg = None
+
+sys.path.append(".")
+from src.tsu_analyzer.db.Saver import Saver
+from src.tsu_analyzer.db.batch import get_file_paths, get_rows
+from src.tsu_analyzer.db.engine import (
+    get_database_url,
+    get_engine_settings,
+    get_statement_timeout,
+)
+from src.tsu_analyzer.db.ledger import PROCESSOR_SAVER, get_path_hash, get_ingested_hashes
+
+# Async version of run_batch for many files arriving at once (several dedicated servers after scheduled events):
+# read -> parse (process pool) -> write (async sessions) stages connected by bounded queues,
+# so the next files are parsed while the current ones are written.
+
+POSTGRES_EPOCH = datetime(2000, 1, 1)
+
+
+def encode_timestamp(value):
+    # the model defaults and driven_at are aware datetimes (utc) while the columns are timestamp without time zone,
+    # psycopg2 sends them as strings and postgres ignores the offset, asyncpg would refuse them
+    return ((value.replace(tzinfo=None) - POSTGRES_EPOCH) // timedelta(microseconds=1),)
+
+
+def decode_timestamp(value):
+    return POSTGRES_EPOCH + timedelta(microseconds=value[0])
+
+
+async def set_timestamp_codec(connection):
+    await connection.set_type_codec(
+        "timestamp",
+        schema="pg_catalog",
+        encoder=encode_timestamp,
+        decoder=decode_timestamp,
+        format="tuple",
+    )
+
+
+def get_async_engine(pool_size):
+    if asyncpg is None:
+        raise RuntimeError("asyncpg is not installed, run pdm install -G async")
+
+    # same database and settings as the sync engine, only with the asyncpg driver
+    url = make_url(get_database_url()).set(drivername="postgresql+asyncpg")
+
+    connect_args = {}
+
+    statement_timeout = get_statement_timeout()
+    if statement_timeout:
+        connect_args["server_settings"] = {"statement_timeout": str(statement_timeout)}
+
+    engine = create_async_engine(
+        url, connect_args=connect_args, **get_engine_settings(pool_size)
+    )
+
+    @event.listens_for(engine.sync_engine, "connect")
+    def on_connect(dbapi_connection, connection_record):
+        dbapi_connection.run_async(set_timestamp_codec)
+
+    return engine
+
+
+async def get_new_file_paths(engine, file_paths):
+    loop = asyncio.get_running_loop()
+
+    file_hashes = {
+        file_path: await loop.run_in_executor(None, get_path_hash, file_path)
+        for file_path in file_paths
+    }
+
+    async with AsyncSession(engine) as session:
+        ingested_hashes = await session.run_sync(
+            get_ingested_hashes, PROCESSOR_SAVER, file_hashes.values()
+        )
+
+    return [
+        file_path
+        for file_path in file_paths
+        if file_hashes[file_path] not in ingested_hashes
+    ]
+
+
+async def parse_files(path_queue, rows_queue, parse_pool, failed):
+    loop = asyncio.get_running_loop()
+
+    while True:
+        file_path = await path_queue.get()
+
+        if file_path is None:
+            return
+
+        try:
+            rows = await loop.run_in_executor(parse_pool, get_rows, file_path)
+        except Exception as e:
+            print(f"Error reading {file_path}:", e)
+            failed.append(file_path)
+            continue
+
+        # waits while the writers are behind, so only a few parsed files are held in memory
+        await rows_queue.put((file_path, rows))
+
+
+async def write_files(engine, rows_queue, force, failed):
+    while True:
+        item = await rows_queue.get()
+
+        if item is None:
+            return
+
+        file_path, rows = item
+
+        try:
+            # everything of one file is written in a single transaction, like Saver.save_rows
+            async with AsyncSession(engine) as session, session.begin():
+                saved = await session.run_sync(Saver.write_rows, rows, force=force)
+        except Exception as e:
+            print(f"Error saving {file_path}:", e)
+            failed.append(file_path)
+            continue
+
+        if saved:
+            print(f"Saved {file_path}")
+
+
+async def run_pipeline(file_paths, parsers, writers, queue_size, force):
+    engine = get_async_engine(pool_size=writers)
+
+    try:
+        # already saved files are skipped before they are parsed, unless everything should be reprocessed
+        if not force:
+            new_file_paths = await get_new_file_paths(engine, file_paths)
+            print(f"Skipping {len(file_paths) - len(new_file_paths)} already saved files")
+            file_paths = new_file_paths
+
+        print(
+            f"Saving {len(file_paths)} files with {parsers} parsers and {writers} writers"
+        )
+
+        path_queue = asyncio.Queue(maxsize=queue_size)
+        rows_queue = asyncio.Queue(maxsize=queue_size)
+        failed = []
+
+        with ProcessPoolExecutor(max_workers=parsers) as parse_pool:
+            parse_tasks = [
+                asyncio.create_task(parse_files(path_queue, rows_queue, parse_pool, failed))
+                for _ in range(parsers)
+            ]
+            write_tasks = [
+                asyncio.create_task(write_files(engine, rows_queue, force, failed))
+                for _ in range(writers)
+            ]
+
+            for file_path in file_paths:
+                await path_queue.put(file_path)
+
+            # every stage is stopped with one None per task once the previous stage is done
+            for _ in parse_tasks:
+                await path_queue.put(None)
+            await asyncio.gather(*parse_tasks)
+
+            for _ in write_tasks:
+                await rows_queue.put(None)
+            await asyncio.gather(*write_tasks)
+    finally:
+        await engine.dispose()
+
+    return file_paths, failed
+
+
+def run_async_batch(paths, parsers=None, writers=4, queue_size=None, force=False):
+    parsers = parsers or os.cpu_count()
+    queue_size = queue_size or 2 * (parsers + writers)
+
+    start = time.time()
+
+    file_paths, failed = asyncio.run(
+        run_pipeline(get_file_paths(paths), parsers, writers, queue_size, force)
+    )
+
+    print(
+        f"Saved {len(file_paths) - len(failed)} of {len(file_paths)} files in {time.time() - start:.1f}s"
+    )
+    for file_path in failed:
+        print(f"Failed: {file_path}")
+
+    return failed
@@ -0,0 +1,120 @@
+import os
+import sys
+import glob
+import time
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    wait,
+)
+
+from sqlalchemy.orm import Session
+
+sys.path.append(".")
+from src.tsu_analyzer.db.Saver import Saver
+from src.tsu_analyzer.db.ledger import PROCESSOR_SAVER, get_path_hash, get_ingested_hashes
+
+
+def get_file_paths(paths):
+    file_paths = []
+
+    for path in paths:
+        path = os.path.expanduser(path)
+
+        if os.path.isdir(path):
+            file_paths.extend(glob.glob(os.path.join(path, "*.json")))
+        else:
+            file_paths.extend(glob.glob(path) or [path])
+
+    # sorted by name, which starts with the timestamp for files from move_stat_files.sh
+    return sorted(set(file_paths))
+
+
+def get_rows(file_path):
+    # runs in a worker process, the rows are plain dicts so they can be pickled back
+    return Saver(file_path).get_rows()
+
+
+def get_new_file_paths(engine, file_paths):
+    file_hashes = {file_path: get_path_hash(file_path) for file_path in file_paths}
+
+    with Session(engine) as session:
+        ingested_hashes = get_ingested_hashes(
+            session, PROCESSOR_SAVER, file_hashes.values()
+        )
+
+    return [
+        file_path
+        for file_path in file_paths
+        if file_hashes[file_path] not in ingested_hashes
+    ]
+
+
+def run_batch(paths, workers=None, writers=1, force=False):
+    engine = Saver.get_engine()
+    file_paths = get_file_paths(paths)
+    workers = workers or os.cpu_count()
+
+    # already saved files are skipped before they are parsed, unless everything should be reprocessed
+    if not force:
+        new_file_paths = get_new_file_paths(engine, file_paths)
+        print(f"Skipping {len(file_paths) - len(new_file_paths)} already saved files")
+        file_paths = new_file_paths
+
+    print(f"Saving {len(file_paths)} files with {workers} workers and {writers} writers")
+
+    start = time.time()
+    failed = []
+
+    def save(file_path, rows):
+        if Saver.save_rows(engine, rows, force=force):
+            print(f"Saved {file_path}")
+
+    with ProcessPoolExecutor(max_workers=workers) as parse_pool, ThreadPoolExecutor(
+        max_workers=writers
+    ) as write_pool:
+        pending_files = iter(file_paths)
+        parsing = {}
+        writing = {}
+
+        while True:
+            # only keep a few files per worker in flight so memory stays bounded
+            while len(parsing) + len(writing) < 2 * (workers + writers):
+                file_path = next(pending_files, None)
+                if file_path is None:
+                    break
+                parsing[parse_pool.submit(get_rows, file_path)] = file_path
+
+            if not parsing and not writing:
+                break
+
+            done, _ = wait(
+                list(parsing) + list(writing), return_when=FIRST_COMPLETED
+            )
+
+            for future in done:
+                if future in parsing:
+                    file_path = parsing.pop(future)
+                    try:
+                        rows = future.result()
+                    except Exception as e:
+                        print(f"Error reading {file_path}:", e)
+                        failed.append(file_path)
+                        continue
+                    writing[write_pool.submit(save, file_path, rows)] = file_path
+                else:
+                    file_path = writing.pop(future)
+                    try:
+                        future.result()
+                    except Exception as e:
+                        print(f"Error saving {file_path}:", e)
+                        failed.append(file_path)
+
+    print(
+        f"Saved {len(file_paths) - len(failed)} of {len(file_paths)} files in {time.time() - start:.1f}s"
+    )
+    for file_path in failed:
+        print(f"Failed: {file_path}")
+
+    return failed
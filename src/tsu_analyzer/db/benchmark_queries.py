@@ -0,0 +1,140 @@
+import sys
+import argparse
+import statistics
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+sys.path.append(".")
+from src.tsu_analyzer.db.engine import get_engine
+
+# Runs the lookups and deletes of the Saver with EXPLAIN ANALYZE for a sample of laps, event results and tracks
+# and prints the median execution time and the scan used. With --without-indexes the same queries run again
+# after dropping the lap result indexes inside a transaction that is rolled back, to show their effect.
+
+QUERIES = {
+    "checkpoint results of a lap": (
+        "lap_result_id",
+        "SELECT * FROM tsu.checkpoint_results WHERE lap_result_id = :id",
+    ),
+    "delete checkpoint results of a lap": (
+        "lap_result_id",
+        "DELETE FROM tsu.checkpoint_results WHERE lap_result_id = :id",
+    ),
+    "sector results of a lap": (
+        "lap_result_id",
+        "SELECT * FROM tsu.sector_results WHERE lap_result_id = :id",
+    ),
+    "delete sector results of a lap": (
+        "lap_result_id",
+        "DELETE FROM tsu.sector_results WHERE lap_result_id = :id",
+    ),
+    "laps of an event result": (
+        "event_result_id",
+        "SELECT * FROM tsu.lap_results WHERE event_result_id = :id",
+    ),
+    "event result by natural key": (
+        "event_result_id",
+        """
+        SELECT er.* FROM tsu.event_results er
+        JOIN tsu.event_results k ON k.id = :id
+        WHERE er.event_id = k.event_id AND er.driver_id = k.driver_id
+            AND er.car_id = k.car_id AND er.driven_at = k.driven_at
+        """,
+    ),
+    "latest event of a track": (
+        "track_id",
+        "SELECT id FROM tsu.events WHERE track_id = :id ORDER BY created_at DESC LIMIT 1",
+    ),
+}
+
+SAMPLES = {
+    "lap_result_id": "SELECT id FROM tsu.lap_results ORDER BY random() LIMIT :n",
+    "event_result_id": "SELECT id FROM tsu.event_results ORDER BY random() LIMIT :n",
+    "track_id": "SELECT id FROM tsu.tracks ORDER BY random() LIMIT :n",
+}
+
+# indexes added for the lookups by lap result and by track
+INDEXES = [
+    "tsu.ix_tsu_checkpoint_results_lap_result_id",
+    "tsu.ix_tsu_sector_results_lap_result_id",
+    "tsu.ix_events_track_id_created_at",
+]
+
+
+def get_scans(plan):
+    # all scan nodes of a json plan, e.g. "Index Scan on checkpoint_results"
+    scans = []
+
+    if "Scan" in plan["Node Type"]:
+        scans.append(f"{plan['Node Type']} on {plan.get('Relation Name', '?')}")
+
+    for sub_plan in plan.get("Plans", []):
+        scans.extend(get_scans(sub_plan))
+
+    return scans
+
+
+def run_queries(session, samples):
+    results = {}
+
+    for name, (sample_key, query) in QUERIES.items():
+        times = []
+        scans = set()
+
+        for id in samples[sample_key]:
+            # deletes are measured in a savepoint that is rolled back
+            with session.begin_nested() as savepoint:
+                explain = session.execute(
+                    text(f"EXPLAIN (ANALYZE, FORMAT JSON) {query}"), {"id": id}
+                ).scalar()
+                savepoint.rollback()
+
+            times.append(explain[0]["Execution Time"])
+            scans.update(get_scans(explain[0]["Plan"]))
+
+        if times:
+            results[name] = (statistics.median(times), sorted(scans))
+
+    return results
+
+
+def print_results(title, results):
+    print(f"### {title} ###")
+
+    for name, (median_ms, scans) in results.items():
+        print(f"{name:40} {median_ms:9.3f} ms  {', '.join(scans)}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        usage="pdm run python src/tsu_analyzer/db/benchmark_queries.py [--samples N] [--without-indexes]"
+    )
+    parser.add_argument("--samples", type=int, default=50, help="ids queried per query")
+    parser.add_argument(
+        "--without-indexes",
+        action="store_true",
+        help="compare with the same queries without the lap result indexes (locks the tables while running)",
+    )
+    args = parser.parse_args()
+
+    engine = get_engine()
+
+    with Session(engine) as session, session.begin():
+        session.execute(text("ANALYZE tsu.checkpoint_results, tsu.sector_results, tsu.lap_results"))
+
+    with Session(engine) as session:
+        samples = {
+            key: session.scalars(text(query), {"n": args.samples}).all()
+            for key, query in SAMPLES.items()
+        }
+
+        print_results("with indexes", run_queries(session, samples))
+
+        if args.without_indexes:
+            for index in INDEXES:
+                session.execute(text(f"DROP INDEX IF EXISTS {index}"))
+
+            print_results("without indexes", run_queries(session, samples))
+
+        # nothing of the benchmark is kept
+        session.rollback()
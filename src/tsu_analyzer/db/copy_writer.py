@@ -0,0 +1,108 @@
+import io
+import csv
+from sqlalchemy import insert
+from sqlalchemy.util import await_only
+
+
+class _RowsFile(io.TextIOBase):
+    # file-like object that renders rows as csv lines only when COPY reads them,
+    # so the whole payload never has to be held in memory as one string
+    def __init__(self, rows):
+        self._lines = self._render(rows)
+        self._buffer = ""
+
+    @staticmethod
+    def _render(rows):
+        line = io.StringIO()
+        writer = csv.writer(line, lineterminator="\n")
+        for row in rows:
+            writer.writerow(row)
+            yield line.getvalue()
+            line.seek(0)
+            line.truncate()
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        while size < 0 or len(self._buffer) < size:
+            line = next(self._lines, None)
+            if line is None:
+                break
+            self._buffer += line
+
+        if size < 0:
+            size = len(self._buffer)
+
+        chunk, self._buffer = self._buffer[:size], self._buffer[size:]
+        return chunk
+
+
+def _csv_value(value):
+    # csv has no NULL by default, an unquoted empty field is NULL in postgres' csv format
+    if value is None:
+        return ""
+    return value
+
+
+def copy_rows(session, model, mappings):
+    # streams the mappings into the table with COPY FROM STDIN inside the session's transaction,
+    # falls back to an ORM bulk insert when the connection is neither psycopg2 nor asyncpg
+    if not mappings:
+        return
+
+    table = model.__table__
+    columns = [column for column in table.columns if not column.primary_key]
+
+    # python side defaults (created_at, modified_at) are not applied by COPY
+    defaults = {
+        column.name: column.default.arg
+        for column in columns
+        if column.default is not None and column.default.is_scalar
+    }
+
+    pool_connection = session.connection().connection
+
+    # asyncpg (async pipeline, session.run_sync): binary COPY of the records on the driver connection
+    driver_connection = pool_connection.driver_connection
+    if hasattr(driver_connection, "copy_records_to_table"):
+        await_only(
+            driver_connection.copy_records_to_table(
+                table.name,
+                schema_name=table.schema,
+                columns=[column.name for column in columns],
+                records=[
+                    tuple(
+                        mapping.get(column.name, defaults.get(column.name))
+                        for column in columns
+                    )
+                    for mapping in mappings
+                ],
+            )
+        )
+        return
+
+    cursor = pool_connection.dbapi_connection.cursor()
+
+    if not hasattr(cursor, "copy_expert"):
+        cursor.close()
+        session.execute(insert(model), mappings)
+        return
+
+    rows = (
+        [
+            _csv_value(mapping.get(column.name, defaults.get(column.name)))
+            for column in columns
+        ]
+        for mapping in mappings
+    )
+
+    column_names = ", ".join(column.name for column in columns)
+
+    try:
+        cursor.copy_expert(
+            f"COPY {table.fullname} ({column_names}) FROM STDIN WITH (FORMAT csv)",
+            _RowsFile(rows),
+        )
+    finally:
+        cursor.close()
@@ -0,0 +1,86 @@
+from sqlalchemy import select, insert, delete
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+import sys
+
+sys.path.append(".")
+from src.tsu_analyzer.db.models import Elo, EloHeat, EloCurrent, EloHeatCurrent
+from src.tsu_analyzer.elo.rating import START_ELO
+
+# every elo history table has a table with the latest row per driver
+CURRENT_MODELS = {Elo: EloCurrent, EloHeat: EloHeatCurrent}
+
+ELO_COLUMNS = [
+    "value",
+    "delta",
+    "number_races",
+    "last_track_name",
+    "last_car_name",
+    "last_timestamp",
+]
+
+
+def get_current_elos(session, model, driver_ids):
+    # current (value, number_races) of all given drivers in one query, drivers without elo start at 1000
+    current_model = CURRENT_MODELS[model]
+    driver_ids = list(driver_ids)
+
+    current_elos = {driver_id: (START_ELO, 0) for driver_id in driver_ids}
+
+    for driver_id, value, number_races in session.execute(
+        select(
+            current_model.driver_id, current_model.value, current_model.number_races
+        ).where(current_model.driver_id.in_(driver_ids))
+    ):
+        current_elos[driver_id] = (value, number_races)
+
+    return current_elos
+
+
+def upsert_current_elos(session, model, elo_rows):
+    # the latest row per driver replaces the current one unless that one is newer
+    current_model = CURRENT_MODELS[model]
+
+    latest_elo_rows = {elo_row["driver_id"]: elo_row for elo_row in elo_rows}
+
+    if not latest_elo_rows:
+        return
+
+    stmt = pg_insert(current_model).values(
+        [
+            {"driver_id": driver_id, **{column: elo_row[column] for column in ELO_COLUMNS}}
+            for driver_id, elo_row in sorted(latest_elo_rows.items())
+        ]
+    )
+
+    session.execute(
+        stmt.on_conflict_do_update(
+            index_elements=[current_model.driver_id],
+            set_={column: stmt.excluded[column] for column in ELO_COLUMNS},
+            where=current_model.last_timestamp <= stmt.excluded.last_timestamp,
+        )
+    )
+
+
+def add_elo_rows(session, model, elo_rows):
+    # new history rows and the current table are written in the same transaction
+    if not elo_rows:
+        return
+
+    session.execute(insert(model), elo_rows)
+    upsert_current_elos(session, model, elo_rows)
+
+
+def rebuild_current_elos(session, model):
+    # after the history was rewritten (replay), the current table is filled from it again
+    current_model = CURRENT_MODELS[model]
+
+    session.execute(delete(current_model))
+    session.execute(
+        insert(current_model).from_select(
+            ["driver_id", *ELO_COLUMNS],
+            select(model.driver_id, *[getattr(model, column) for column in ELO_COLUMNS])
+            .distinct(model.driver_id)
+            .order_by(model.driver_id, model.last_timestamp.desc(), model.id.desc()),
+        )
+    )
@@ -0,0 +1,65 @@
+import os
+from sqlalchemy import create_engine
+from dotenv import load_dotenv
+
+# One configured engine per process, shared by run.py, the elo scripts, the watcher and the broadcast script.
+# Settings come from the environment (or .env), all of them are optional:
+# - TSU_DB_POOL_SIZE: connections kept open (default 5)
+# - TSU_DB_MAX_OVERFLOW: extra connections while the pool is exhausted (default 10)
+# - TSU_DB_POOL_PRE_PING: check connections before using them, 0 to disable (default 1)
+# - TSU_DB_STATEMENT_TIMEOUT_MS: cancel statements running longer, 0 for no timeout (default 0)
+# - TSU_DB_ECHO: 1 to log every SQL statement (default 0, logging thousands of inserts slows down the ingest)
+
+_engines = {}
+
+
+def _get_int(name, default):
+    value = os.environ.get(name)
+    return int(value) if value else default
+
+
+def get_database_url():
+    load_dotenv()
+
+    url = os.environ.get("TSU_HOTLAPPING_POSTGRES_URL")
+    if not url:
+        raise ValueError("The environment variable TSU_HOTLAPPING_POSTGRES_URL is not set")
+
+    return url
+
+
+def get_engine_settings(pool_size=None):
+    load_dotenv()
+
+    return {
+        "pool_size": pool_size or _get_int("TSU_DB_POOL_SIZE", 5),
+        "max_overflow": _get_int("TSU_DB_MAX_OVERFLOW", 10),
+        "pool_pre_ping": bool(_get_int("TSU_DB_POOL_PRE_PING", 1)),
+        "echo": bool(_get_int("TSU_DB_ECHO", 0)),
+    }
+
+
+def get_statement_timeout():
+    load_dotenv()
+
+    return _get_int("TSU_DB_STATEMENT_TIMEOUT_MS", 0)
+
+
+def get_engine(pool_size=None):
+    # engines are reused, a long running process (watcher) asks for a pool with one connection per worker
+    key = (os.getpid(), pool_size)
+
+    if key not in _engines:
+        connect_args = {}
+
+        statement_timeout = get_statement_timeout()
+        if statement_timeout:
+            connect_args["options"] = f"-c statement_timeout={statement_timeout}"
+
+        _engines[key] = create_engine(
+            get_database_url(),
+            connect_args=connect_args,
+            **get_engine_settings(pool_size),
+        )
+
+    return _engines[key]
@@ -0,0 +1,113 @@
+import threading
+from collections import OrderedDict
+from sqlalchemy import event, select, desc
+from sqlalchemy.orm import Session, make_transient_to_detached
+
+import sys
+
+sys.path.append(".")
+from src.tsu_analyzer.db.models import Driver, Car, Track
+
+# natural key column of every cached model, drivers by steam id, cars and tracks by guid
+KEY_COLUMNS = {
+    Driver: Driver.steam_id,
+    Car: Car.guid,
+    Track: Track.guid,
+}
+
+
+# bounded LRU cache mapping steam_id / vehicle guid / level guid to primary keys
+# entries are only added for committed rows, so a rolled back ingest never leaves ids behind
+class IdentityCache:
+
+    def __init__(self, maxsize=10000):
+        self.maxsize = maxsize
+        self._ids = {model: OrderedDict() for model in KEY_COLUMNS}
+        # reentrant, warm holds it while filling the cache with put_many
+        self._lock = threading.RLock()
+        self._warmed = False
+
+    def warm(self, engine):
+        if self._warmed:
+            return
+
+        # writer threads may all start with a cold cache, only the first one runs the query
+        with self._lock:
+            if self._warmed:
+                return
+
+            with Session(engine) as session:
+                for model, key_column in KEY_COLUMNS.items():
+                    # oldest first, so the most recently created rows are kept if the table is larger
+                    rows = session.execute(
+                        select(key_column, model.id).order_by(desc(model.id)).limit(self.maxsize)
+                    ).all()
+                    self.put_many(model, dict(reversed(rows)))
+
+            self._warmed = True
+
+    def get(self, model, key):
+        with self._lock:
+            ids = self._ids[model]
+            if key not in ids:
+                return None
+            ids.move_to_end(key)
+            return ids[key]
+
+    def get_many(self, model, keys):
+        with self._lock:
+            ids = self._ids[model]
+            found = {}
+            for key in keys:
+                if key in ids:
+                    ids.move_to_end(key)
+                    found[key] = ids[key]
+            return found
+
+    def put(self, model, key, id):
+        self.put_many(model, {key: id})
+
+    def put_many(self, model, ids_by_key):
+        with self._lock:
+            ids = self._ids[model]
+            ids.update(ids_by_key)
+            for key in ids_by_key:
+                ids.move_to_end(key)
+            while len(ids) > self.maxsize:
+                ids.popitem(last=False)
+
+    def put_after_commit(self, session, model, ids_by_key):
+        # ids of rows inserted in this transaction become visible once it commits,
+        # the listeners are registered once per session and read the pending ids from session.info
+        if not session.info.get("identity_cache_listening"):
+            event.listen(session, "after_commit", self._after_commit)
+            event.listen(session, "after_soft_rollback", self._after_soft_rollback)
+            session.info["identity_cache_listening"] = True
+
+        pending = session.info.setdefault("identity_cache_pending", {})
+        pending.setdefault(model, {}).update(ids_by_key)
+
+    def _after_commit(self, session):
+        for model, ids_by_key in session.info.pop("identity_cache_pending", {}).items():
+            self.put_many(model, ids_by_key)
+
+    def _after_soft_rollback(self, session, previous_transaction):
+        session.info.pop("identity_cache_pending", None)
+
+    def clear(self):
+        with self._lock:
+            for ids in self._ids.values():
+                ids.clear()
+            self._warmed = False
+
+
+def get_detached(model, id, **values):
+    # builds an instance for a row known to exist without querying it,
+    # it can be added to a session like an object loaded from the database
+    instance = model(id=id, **values)
+    make_transient_to_detached(instance)
+    return instance
+
+
+# shared by the saver and the elo scripts for the lifetime of the process
+identity_cache = IdentityCache()
@@ -0,0 +1,89 @@
+import hashlib
+from sqlalchemy import select, or_, and_
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+import sys
+
+sys.path.append(".")
+from src.tsu_analyzer.db.models import IngestedFile
+
+# every consumer of stats files keeps its own record, a file saved by the Saver still needs its elo update
+PROCESSOR_SAVER = "saver"
+PROCESSOR_ELO = "elo"
+PROCESSOR_ELO_HEAT = "elo_heat"
+
+
+def get_file_hash(content):
+    return hashlib.sha256(content).hexdigest()
+
+
+def get_path_hash(path, chunk_size=1 << 20):
+    # same as get_file_hash of the file content, read in chunks so large files are never loaded as a whole
+    file_hash = hashlib.sha256()
+
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(chunk_size), b""):
+            file_hash.update(chunk)
+
+    return file_hash.hexdigest()
+
+
+def get_ingested_file(file_name, file_hash, data=None):
+    ingested_file = {
+        "file_name": str(file_name),
+        "file_hash": file_hash,
+        "utc_start_time_ticks": None,
+        "level_guid": None,
+    }
+
+    # stats files identify an event by its start time and track, java tool exports do not
+    if data is not None and "utcStartTimeTicks" in data:
+        ingested_file["utc_start_time_ticks"] = data["utcStartTimeTicks"]
+        ingested_file["level_guid"] = data["level"]["guid"]
+
+    return ingested_file
+
+
+def is_ingested(session, processor, file_hash, utc_start_time_ticks=None, level_guid=None):
+    conditions = [IngestedFile.file_hash == file_hash]
+
+    if utc_start_time_ticks is not None:
+        conditions.append(
+            and_(
+                IngestedFile.utc_start_time_ticks == utc_start_time_ticks,
+                IngestedFile.level_guid == level_guid,
+            )
+        )
+
+    return (
+        session.scalars(
+            select(IngestedFile.id).where(
+                IngestedFile.processor == processor, or_(*conditions)
+            )
+        ).first()
+        is not None
+    )
+
+
+def get_ingested_hashes(session, processor, file_hashes):
+    return set(
+        session.scalars(
+            select(IngestedFile.file_hash).where(
+                IngestedFile.processor == processor,
+                IngestedFile.file_hash.in_(list(file_hashes)),
+            )
+        ).all()
+    )
+
+
+def claim_file(session, processor, ingested_file):
+    # records the file in the current transaction, returns False if it was already recorded
+    # (by hash or by start time and track), also while another transaction is still writing it
+    file_id = session.scalars(
+        pg_insert(IngestedFile)
+        .values(processor=processor, **ingested_file)
+        .on_conflict_do_nothing()
+        .returning(IngestedFile.id)
+    ).first()
+
+    return file_id is not None
@@ -1,6 +1,6 @@
-from typing import List
+from typing import List, Optional
 from datetime import datetime, timezone
-from sqlalchemy import ForeignKey, MetaData, Table, Column, BigInteger, Float, Boolean
+from sqlalchemy import ForeignKey, MetaData, Table, Column, BigInteger, Float, Boolean, UniqueConstraint, Index
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
 from sqlalchemy.types import BigInteger
 
@@ -39,13 +39,16 @@ class Driver(Base):
     __tablename__ = "drivers"
 
     name: Mapped[str] = mapped_column()
-    steam_id: Mapped[int] = mapped_column(BigInteger)
+    steam_id: Mapped[int] = mapped_column(BigInteger, unique=True)
     clan: Mapped[str] = mapped_column()
     flag: Mapped[str] = mapped_column()
 
 
 class Elo(Base):
     __tablename__ = "elo"
+    __table_args__ = (
+        Index("ix_elo_driver_id_last_timestamp", "driver_id", "last_timestamp"),
+    )
 
     driver_id: Mapped[int] = mapped_column(ForeignKey("tsu.drivers.id"))
     driver: Mapped["Driver"] = relationship("Driver")
@@ -61,6 +64,9 @@ class Elo(Base):
     
 class EloHeat(Base):
     __tablename__ = "elo_heat"
+    __table_args__ = (
+        Index("ix_elo_heat_driver_id_last_timestamp", "driver_id", "last_timestamp"),
+    )
 
     driver_id: Mapped[int] = mapped_column(ForeignKey("tsu.drivers.id"))
     driver: Mapped["Driver"] = relationship("Driver")
@@ -75,11 +81,44 @@ class EloHeat(Base):
     last_timestamp: Mapped[datetime] = mapped_column(nullable=False)
 
 
+# latest row of elo / elo_heat per driver, kept up to date in the same transaction as the history
+class EloCurrent(Base):
+    __tablename__ = "elo_current"
+
+    driver_id: Mapped[int] = mapped_column(ForeignKey("tsu.drivers.id"), unique=True)
+    driver: Mapped["Driver"] = relationship("Driver")
+
+    value: Mapped[float] = mapped_column(Float(asdecimal=False), index=True)
+    delta: Mapped[float] = mapped_column(Float(asdecimal=False))
+
+    number_races: Mapped[int] = mapped_column()
+
+    last_track_name: Mapped[str] = mapped_column()
+    last_car_name: Mapped[str] = mapped_column()
+    last_timestamp: Mapped[datetime] = mapped_column(nullable=False)
+
+
+class EloHeatCurrent(Base):
+    __tablename__ = "elo_heat_current"
+
+    driver_id: Mapped[int] = mapped_column(ForeignKey("tsu.drivers.id"), unique=True)
+    driver: Mapped["Driver"] = relationship("Driver")
+
+    value: Mapped[float] = mapped_column(Float(asdecimal=False), index=True)
+    delta: Mapped[float] = mapped_column(Float(asdecimal=False))
+
+    number_races: Mapped[int] = mapped_column()
+
+    last_track_name: Mapped[str] = mapped_column()
+    last_car_name: Mapped[str] = mapped_column()
+    last_timestamp: Mapped[datetime] = mapped_column(nullable=False)
+
+
 class Car(Base):
     __tablename__ = "cars"
 
     name: Mapped[str] = mapped_column()
-    guid: Mapped[str] = mapped_column()
+    guid: Mapped[str] = mapped_column(unique=True)
 
     events: Mapped[List["Event"]] = relationship(
         "Event", secondary=event_car_association, back_populates="cars"
@@ -90,7 +129,7 @@ class Track(Base):
     __tablename__ = "tracks"
 
     name: Mapped[str] = mapped_column()
-    guid: Mapped[str] = mapped_column()
+    guid: Mapped[str] = mapped_column(unique=True)
     maker_id: Mapped[int] = mapped_column(BigInteger)
     level_type: Mapped[str] = mapped_column()
 
@@ -99,6 +138,8 @@ class Track(Base):
 
 class Event(Base):
     __tablename__ = "events"
+    # the saver adds files to the latest event of their track
+    __table_args__ = (Index("ix_events_track_id_created_at", "track_id", "created_at"),)
 
     track_id: Mapped[int] = mapped_column(ForeignKey("tsu.tracks.id"))
     track: Mapped["Track"] = relationship("Track", back_populates="events")
@@ -109,6 +150,7 @@ class Event(Base):
 
 class EventResult(Base):
     __tablename__ = "event_results"
+    __table_args__ = (UniqueConstraint("event_id", "driver_id", "car_id", "driven_at"),)
 
     event_id: Mapped[int] = mapped_column(ForeignKey("tsu.events.id"))
     driver_id: Mapped[int] = mapped_column(ForeignKey("tsu.drivers.id"))
@@ -127,10 +169,13 @@ class EventResult(Base):
 
 class LapResult(Base):
     __tablename__ = "lap_results"
+    __table_args__ = (UniqueConstraint("event_result_id", "lap_time", "cflags"),)
 
     event_result_id: Mapped[int] = mapped_column(ForeignKey("tsu.event_results.id"))
     lap_time: Mapped[float] = mapped_column(Float(asdecimal=False))
     cflags: Mapped[int] = mapped_column()
+    # hash of the checkpoint times the checkpoint and sector results were saved from
+    checkpoint_hash: Mapped[Optional[str]] = mapped_column(nullable=True)
 
     event_result: Mapped["EventResult"] = relationship(
         "EventResult", back_populates="lap_results"
@@ -143,10 +188,31 @@ class LapResult(Base):
     )
 
 
+class EventBestLap(Base):
+    # personal best lap of every driver in an event, updated by the Saver with every new lap
+    __tablename__ = "event_best_laps"
+    __table_args__ = (
+        UniqueConstraint("event_id", "driver_id"),
+        Index("ix_event_best_laps_event_id_lap_time", "event_id", "lap_time"),
+    )
+
+    event_id: Mapped[int] = mapped_column(ForeignKey("tsu.events.id"))
+    driver_id: Mapped[int] = mapped_column(ForeignKey("tsu.drivers.id"))
+    car_id: Mapped[int] = mapped_column(ForeignKey("tsu.cars.id"))
+    lap_result_id: Mapped[int] = mapped_column(ForeignKey("tsu.lap_results.id"))
+    lap_time: Mapped[float] = mapped_column(Float(asdecimal=False))
+
+    event: Mapped["Event"] = relationship("Event")
+    driver: Mapped["Driver"] = relationship("Driver")
+    car: Mapped["Car"] = relationship("Car")
+    lap_result: Mapped["LapResult"] = relationship("LapResult")
+
+
 class SectorResult(Base):
     __tablename__ = "sector_results"
 
-    lap_result_id: Mapped[int] = mapped_column(ForeignKey("tsu.lap_results.id"))
+    # checkpoint and sector results are always read and deleted by lap
+    lap_result_id: Mapped[int] = mapped_column(ForeignKey("tsu.lap_results.id"), index=True)
     time: Mapped[float] = mapped_column(Float(asdecimal=False))
     number: Mapped[int] = mapped_column()
 
@@ -158,7 +224,8 @@ class SectorResult(Base):
 class CheckpointResult(Base):
     __tablename__ = "checkpoint_results"
 
-    lap_result_id: Mapped[int] = mapped_column(ForeignKey("tsu.lap_results.id"))
+    # checkpoint and sector results are always read and deleted by lap
+    lap_result_id: Mapped[int] = mapped_column(ForeignKey("tsu.lap_results.id"), index=True)
     time: Mapped[float] = mapped_column(Float(asdecimal=False))
     is_sector: Mapped[bool] = mapped_column(Boolean)
     number: Mapped[int] = mapped_column()
@@ -168,12 +235,33 @@ class CheckpointResult(Base):
     )
 
 
+class IngestedFile(Base):
+    __tablename__ = "ingested_files"
+    __table_args__ = (
+        UniqueConstraint(
+            "processor", "file_hash", name="uq_ingested_files_processor_file_hash"
+        ),
+        UniqueConstraint(
+            "processor",
+            "utc_start_time_ticks",
+            "level_guid",
+            name="uq_ingested_files_processor_start_time_level",
+        ),
+    )
+
+    # saver, elo or elo_heat
+    processor: Mapped[str] = mapped_column()
+    file_hash: Mapped[str] = mapped_column()
+    file_name: Mapped[str] = mapped_column()
+    utc_start_time_ticks: Mapped[Optional[int]] = mapped_column(BigInteger, nullable=True)
+    level_guid: Mapped[Optional[str]] = mapped_column(nullable=True)
+
+
 if __name__ == "__main__":
-    import os
-    from sqlalchemy import create_engine
-    from dotenv import load_dotenv
+    import sys
 
-    load_dotenv()
+    sys.path.append(".")
+    from src.tsu_analyzer.db.engine import get_engine
 
-    engine = create_engine(os.environ.get("TSU_HOTLAPPING_POSTGRES_URL"), echo=True)
+    engine = get_engine()
     Base.metadata.create_all(engine)
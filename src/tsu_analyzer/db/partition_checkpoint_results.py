@@ -0,0 +1,150 @@
+import sys
+import argparse
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+sys.path.append(".")
+from src.tsu_analyzer.db.engine import get_engine
+
+# Opt-in: turns tsu.checkpoint_results into a table partitioned by ranges of lap_result_id.
+# Lap result ids grow with time, so every partition holds the checkpoint times of a period of events
+# and the deletes and lookups by lap only touch one small partition (and its index).
+# Running the script again only adds partitions for the next lap results, e.g. from cron once a week.
+# The table is locked while it is copied, so run it when no files are saved.
+
+TABLE = "tsu.checkpoint_results"
+DEFAULT_PARTITION = "tsu.checkpoint_results_default"
+
+
+def is_partitioned(session):
+    return (
+        session.scalar(text(f"SELECT relkind FROM pg_class WHERE oid = '{TABLE}'::regclass"))
+        == "p"
+    )
+
+
+def get_partition_name(lower):
+    return f"tsu.checkpoint_results_{lower}"
+
+
+def get_partition_exists(session, name):
+    return session.scalar(text("SELECT to_regclass(:name)"), {"name": name}) is not None
+
+
+def partition_table(session):
+    # the new table gets the same columns and the id sequence of the old one
+    session.execute(
+        text(
+            f"""
+            CREATE TABLE tsu.checkpoint_results_partitioned
+                (LIKE {TABLE} INCLUDING DEFAULTS)
+            PARTITION BY RANGE (lap_result_id)
+            """
+        )
+    )
+    # rows outside all ranges land here until add_partitions moves them
+    session.execute(
+        text(f"CREATE TABLE {DEFAULT_PARTITION} PARTITION OF tsu.checkpoint_results_partitioned DEFAULT")
+    )
+
+    session.execute(
+        text(f"INSERT INTO tsu.checkpoint_results_partitioned SELECT * FROM {TABLE}")
+    )
+    session.execute(
+        text("ALTER SEQUENCE tsu.checkpoint_results_id_seq OWNED BY tsu.checkpoint_results_partitioned.id")
+    )
+    session.execute(text(f"DROP TABLE {TABLE}"))
+    session.execute(
+        text("ALTER TABLE tsu.checkpoint_results_partitioned RENAME TO checkpoint_results")
+    )
+
+    # the primary key of a partitioned table has to contain the partition key
+    session.execute(
+        text(
+            f"ALTER TABLE {TABLE} ADD CONSTRAINT pk_checkpoint_results PRIMARY KEY (id, lap_result_id)"
+        )
+    )
+    session.execute(
+        text(f"CREATE INDEX ix_tsu_checkpoint_results_lap_result_id ON {TABLE} (lap_result_id)")
+    )
+    session.execute(
+        text(
+            f"""
+            ALTER TABLE {TABLE} ADD CONSTRAINT fk_checkpoint_results_lap_result_id_lap_results
+            FOREIGN KEY (lap_result_id) REFERENCES tsu.lap_results (id)
+            """
+        )
+    )
+
+
+def add_partitions(session, partition_size, partitions_ahead):
+    # partitions up to the current lap results plus some ahead, rows that are in the
+    # default partition are moved before the new partition is attached
+    max_lap_result_id = session.scalar(text("SELECT coalesce(max(id), 0) FROM tsu.lap_results"))
+    upper_limit = (max_lap_result_id // partition_size + 1 + partitions_ahead) * partition_size
+
+    added = []
+
+    for lower in range(0, upper_limit, partition_size):
+        name = get_partition_name(lower)
+
+        if get_partition_exists(session, name):
+            continue
+
+        upper = lower + partition_size
+
+        session.execute(text(f"CREATE TABLE {name} (LIKE {TABLE} INCLUDING DEFAULTS)"))
+        session.execute(
+            text(
+                f"""
+                WITH moved AS (
+                    DELETE FROM {DEFAULT_PARTITION}
+                    WHERE lap_result_id >= {lower} AND lap_result_id < {upper}
+                    RETURNING *
+                )
+                INSERT INTO {name} SELECT * FROM moved
+                """
+            )
+        )
+        session.execute(
+            text(
+                f"ALTER TABLE {TABLE} ATTACH PARTITION {name} FOR VALUES FROM ({lower}) TO ({upper})"
+            )
+        )
+        added.append(name)
+
+    return added
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        usage="pdm run python src/tsu_analyzer/db/partition_checkpoint_results.py [--partition-size N] [--partitions-ahead N]"
+    )
+    parser.add_argument(
+        "--partition-size",
+        type=int,
+        default=100000,
+        help="lap results per partition, keep it the same for every run",
+    )
+    parser.add_argument(
+        "--partitions-ahead",
+        type=int,
+        default=2,
+        help="empty partitions created for the next lap results",
+    )
+    args = parser.parse_args()
+
+    engine = get_engine()
+
+    with Session(engine) as session, session.begin():
+        session.execute(text(f"LOCK TABLE {TABLE} IN ACCESS EXCLUSIVE MODE"))
+
+        if not is_partitioned(session):
+            print(f"Partitioning {TABLE} by lap_result_id")
+            partition_table(session)
+
+        added = add_partitions(session, args.partition_size, args.partitions_ahead)
+
+    print(f"Added {len(added)} partitions")
+    for name in added:
+        print(name)
@@ -18,8 +18,8 @@ result_file_path = sys.argv[4]
 df_track = get_track_data(track_file_path)
 df_track.to_csv("track.csv", index=False)
 
-## using result json file
-result_dict = get_result_data(result_file_path)
+## using result json file (parsed once into columnar tables, cached as parquet if pyarrow is installed)
+result_dict = load_event_tables(result_file_path)
 df_drivers = get_drivers_df(result_dict)
 df_drivers.to_csv("driver.csv", index=False)
 df_results = get_results_df(result_dict)
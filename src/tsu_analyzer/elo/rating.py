@@ -0,0 +1,52 @@
+import numpy as np
+
+# Multiplayer elo shared by the elo scripts and the replay engine
+# https://towardsdatascience.com/developing-a-generalized-elo-rating-system-for-multiplayer-games-b9b495e87802
+
+K_FACTOR = 20
+
+# D=400 is a general default value
+# it means that someone with 1500 ELO wins against someone with 1000 ELO with a likelihood of 95% which seems reasonable
+D = 400
+
+START_ELO = 1000.0
+MIN_ELO = 100
+
+
+def calc_expected_scores(elo_values, D=D):
+    # matrix of the expected score of every driver (row) against every opponent (column)
+    elo_values = np.asarray(elo_values, dtype=np.float64)
+
+    return 1.0 / (1 + np.power(10.0, (elo_values[None, :] - elo_values[:, None]) / D))
+
+
+def calc_elo_changes(elo_values, positions, k_factor=K_FACTOR, D=D):
+    # elo values and finishing positions (starting at 1) of all drivers of one race,
+    # returns the elo change of every driver, a race with less than two drivers changes nothing
+    elo_values = np.asarray(elo_values, dtype=np.float64)
+    positions = np.asarray(positions, dtype=np.float64)
+
+    overall_players = len(elo_values)
+    opponents = overall_players - 1
+
+    if opponents < 1:
+        return np.zeros(overall_players)
+
+    expected_scores = calc_expected_scores(elo_values, D)
+
+    # a driver does not race against himself
+    np.fill_diagonal(expected_scores, 0.0)
+
+    expected_score = expected_scores.sum(axis=1) / (overall_players * opponents / 2.0)
+    scoring = (overall_players - positions) / (overall_players * opponents / 2.0)
+
+    return k_factor * opponents * (scoring - expected_score)
+
+
+def calc_new_elo_values(elo_values, positions, k_factor=K_FACTOR, D=D):
+    # add elo change to previous elo, can never go below 100
+    return np.maximum(
+        np.asarray(elo_values, dtype=np.float64)
+        + calc_elo_changes(elo_values, positions, k_factor, D),
+        MIN_ELO,
+    )
@@ -0,0 +1,236 @@
+import os
+import sys
+import glob
+import time
+import argparse
+import numpy as np
+from datetime import datetime
+from sqlalchemy import delete
+from sqlalchemy.orm import Session
+
+sys.path.append(".")
+from src.tsu_analyzer.db.models import *
+from src.tsu_analyzer.db.Saver import Saver
+from src.tsu_analyzer.db.copy_writer import copy_rows
+from src.tsu_analyzer.stream_parser import load_event, iter_dbjson
+from src.tsu_analyzer.db.ledger import PROCESSOR_ELO, get_path_hash, get_ingested_file, claim_file
+from src.tsu_analyzer.db.current_elo import rebuild_current_elos
+from src.tsu_analyzer.elo.rating import K_FACTOR, START_ELO, calc_new_elo_values
+
+# Rebuilds the whole elo history in memory: all stats files and java tool exports are read,
+# their races are replayed in chronological order and the elo table is rewritten in one transaction.
+
+DEFAULT_PATHS = ["result_files_for_elo", "whiplash_java_tool_exports"]
+
+
+def get_file_paths(paths):
+    file_paths = []
+
+    for path in paths:
+        path = os.path.expanduser(path)
+
+        if os.path.isdir(path):
+            file_paths.extend(glob.glob(os.path.join(path, "*.json")))
+            file_paths.extend(glob.glob(os.path.join(path, "*.dbjson")))
+        else:
+            file_paths.extend(glob.glob(path) or [path])
+
+    return sorted(set(file_paths))
+
+
+def get_stats_file_races(data):
+    # one race per stats file, positions from the race ranking
+    players = data.get("players", [])
+
+    race = {
+        "track_name": data["level"]["name"],
+        # timestamp without time zone, like postgres stores the utcStartTime string
+        "timestamp": datetime.strptime(
+            data["utcStartTime"], "%Y-%m-%dT%H:%M:%S%z"
+        ).replace(tzinfo=None),
+        "results": [],
+    }
+
+    for pos, entry in enumerate(data["raceStats"]["raceRanking"]["entries"], start=1):
+        row = players[entry["playerIndex"]]
+        race["results"].append((row["player"]["id"], pos, row["vehicle"]["name"]))
+
+    drivers = [row["player"] for row in players]
+
+    return drivers, [race]
+
+
+def get_java_tool_export_races(file_path):
+    # one race per "Normal race" event, drivers who did not play an event have position 0
+    # one pass over the players (only their results are kept) and one over the events
+    drivers = []
+    results_by_event = {}
+
+    for player in iter_dbjson(file_path, "players"):
+        # the java tool export uses other keys than the stats files
+        drivers.append(
+            {
+                "id": player["ID"],
+                "name": player["name"],
+                "clan": player["clan"],
+                "flag": player["country"],
+            }
+        )
+
+        for player_event in player.get("events", []):
+            if player_event.get("position"):
+                results_by_event.setdefault(player_event["eventIndex"], []).append(
+                    (player["ID"], player_event["position"], player_event["vehicle"])
+                )
+
+    races = []
+
+    for event in iter_dbjson(file_path, "events"):
+        if event["eventType"] != "Normal race":
+            continue
+
+        races.append(
+            {
+                "track_name": event["eventName"],
+                "timestamp": datetime.strptime(event["datePlayed"], "%Y-%m-%dT%H:%M:%S"),
+                "results": results_by_event.get(event["eventIndex"], []),
+            }
+        )
+
+    return drivers, races
+
+
+def load_races(file_paths):
+    drivers = {}
+    races = []
+    ingested_files = []
+
+    for file_path in file_paths:
+        file_hash = get_path_hash(file_path)
+
+        if file_path.endswith(".dbjson"):
+            file_drivers, file_races = get_java_tool_export_races(file_path)
+            ingested_files.append(get_ingested_file(file_path, file_hash))
+        else:
+            data = load_event(file_path)
+            file_drivers, file_races = get_stats_file_races(data)
+            ingested_files.append(get_ingested_file(file_path, file_hash, data))
+
+        for driver_dict in file_drivers:
+            drivers[driver_dict["id"]] = driver_dict
+
+        races.extend(file_races)
+
+    # chronological order, races at the same time keep the order of the files
+    races.sort(key=lambda race: race["timestamp"])
+
+    return list(drivers.values()), races, ingested_files
+
+
+def replay(steam_ids, races, k_factor=K_FACTOR):
+    # ratings are held in arrays, one entry per driver
+    index_by_steam_id = {steam_id: i for i, steam_id in enumerate(steam_ids)}
+
+    elo_values = np.full(len(steam_ids), START_ELO)
+    number_races = np.zeros(len(steam_ids), dtype=np.int64)
+
+    elo_rows = []
+
+    for race in races:
+        # a race needs at least two drivers, a driver listed twice counts once (last entry wins)
+        results = {steam_id: (pos, car) for steam_id, pos, car in race["results"]}
+
+        if len(results) < 2:
+            continue
+
+        indices = np.array([index_by_steam_id[steam_id] for steam_id in results])
+        positions = np.array([pos for pos, _ in results.values()], dtype=np.float64)
+        cars = [car for _, car in results.values()]
+
+        old_values = elo_values[indices]
+
+        new_values = calc_new_elo_values(old_values, positions, k_factor)
+        deltas = new_values - old_values
+
+        # like the update scripts, a driver's elo only changes (and counts the race) when there is a new elo row
+        changed = deltas != 0
+        elo_values[indices[changed]] = new_values[changed]
+        number_races[indices[changed]] += 1
+
+        for i in np.flatnonzero(changed):
+            elo_rows.append(
+                {
+                    "steam_id": steam_ids[indices[i]],
+                    "value": float(new_values[i]),
+                    "delta": float(deltas[i]),
+                    "number_races": int(number_races[indices[i]]),
+                    "last_track_name": race["track_name"],
+                    "last_car_name": cars[i],
+                    "last_timestamp": race["timestamp"],
+                }
+            )
+
+    return elo_rows
+
+
+def write_elo_rows(session, drivers, elo_rows, ingested_files):
+    driver_ids = Saver.get_or_create_driver_ids(session, drivers)
+
+    # the whole history is replaced, so are the records which files were used for elo updates
+    session.execute(delete(Elo))
+    session.execute(delete(IngestedFile).where(IngestedFile.processor == PROCESSOR_ELO))
+
+    copy_rows(
+        session,
+        Elo,
+        [
+            {
+                "driver_id": driver_ids[elo_row["steam_id"]],
+                **{key: val for key, val in elo_row.items() if key != "steam_id"},
+            }
+            for elo_row in elo_rows
+        ],
+    )
+
+    rebuild_current_elos(session, Elo)
+
+    for ingested_file in ingested_files:
+        claim_file(session, PROCESSOR_ELO, ingested_file)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        usage="pdm run python src/tsu_analyzer/elo/replay.py [<directory_or_file>...] [--k-factor K] [--dry-run]"
+    )
+    parser.add_argument(
+        "paths",
+        nargs="*",
+        default=DEFAULT_PATHS,
+        help="stats files, java tool exports or directories containing them",
+    )
+    parser.add_argument("--k-factor", type=float, default=K_FACTOR)
+    parser.add_argument(
+        "--dry-run", action="store_true", help="only print the resulting elo values"
+    )
+    args = parser.parse_args()
+
+    start = time.time()
+
+    drivers, races, ingested_files = load_races(get_file_paths(args.paths))
+    print(f"Loaded {len(races)} races with {len(drivers)} drivers from {len(ingested_files)} files")
+
+    elo_rows = replay([driver["id"] for driver in drivers], races, args.k_factor)
+
+    if not args.dry_run:
+        engine = Saver.get_engine()
+
+        with Session(engine) as session, session.begin():
+            write_elo_rows(session, drivers, elo_rows, ingested_files)
+
+    latest_elo_rows = {elo_row["steam_id"]: elo_row for elo_row in elo_rows}
+    names = {driver["id"]: driver["name"] for driver in drivers}
+
+    for elo_row in sorted(latest_elo_rows.values(), key=lambda row: -row["value"]):
+        print(f"{names[elo_row['steam_id']]}: {elo_row['value']:.1f} ({elo_row['number_races']} races)")
+
+    print(f"{'Calculated' if args.dry_run else 'Wrote'} {len(elo_rows)} elo rows in {time.time() - start:.1f}s")
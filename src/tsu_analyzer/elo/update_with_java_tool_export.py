@@ -1,89 +1,66 @@
 import os
 import sys
-import json
 import pandas as pd
 import numpy as np
-from sqlalchemy import create_engine, select, desc, and_
+from sqlalchemy import select, desc, and_
 from sqlalchemy.orm import Session
-from dotenv import load_dotenv
 
 sys.path.append(".")
 from src.tsu_analyzer.db.models import *
+from src.tsu_analyzer.db.Saver import Saver
+from src.tsu_analyzer.db.engine import get_engine
+from src.tsu_analyzer.elo import rating
+from src.tsu_analyzer.db.current_elo import get_current_elos, add_elo_rows
+from src.tsu_analyzer.stream_parser import iter_dbjson
+from src.tsu_analyzer.db.ledger import (
+    PROCESSOR_ELO,
+    get_path_hash,
+    get_ingested_file,
+    is_ingested,
+    claim_file,
+)
+
+K_FACTOR = rating.K_FACTOR
+
+def get_driver_dict(player):
+    # the java tool export uses other keys than the stats files
+    return {
+        "id": player["ID"],
+        "name": player["name"],
+        "clan": player["clan"],
+        "flag": player["country"],
+    }
+
+
+def get_drivers_dict(players):
+    # one pass over the players of the export, of their events only the position and car are kept
+    driver_dicts = []
+    results_by_id = {}
 
-K_FACTOR = 20
-
-def get_or_create_driver(engine, driver_dict):
-
-    with Session(engine) as session:
-        try:
-            driver = session.scalars(
-                select(Driver).where(Driver.steam_id == driver_dict["ID"])
-            ).first()
-
-            if not driver:
-                driver = Driver(
-                    name=driver_dict["name"],
-                    steam_id=driver_dict["ID"],
-                    clan=driver_dict["clan"],
-                    flag=driver_dict["country"],
-                )
-                session.add(driver)
-                session.commit()
-            
-            driver_id = driver.id
-        except Exception as e:
-            print("Error:", e)
-            session.rollback()
-
-    return driver, driver_id
-
-
-def get_or_create_elo(engine, driver_id):
+    for player in players:
+        driver_dicts.append(get_driver_dict(player))
+        results_by_id[player['ID']] = {
+            player_event['eventIndex']: (player_event.get('position', None), player_event['vehicle'])
+            for player_event in player.get('events', [])
+        }
 
-    with Session(engine) as session:
-        try:
-            elo = session.scalars(
-                select(Elo).where(Elo.driver_id == driver_id).order_by(desc(Elo.last_timestamp)
-                )
-            ).first()
-
-            if elo:
-                value = elo.value
-                number_races = elo.number_races
-                print("TRUE")
-            else:
-                value = 1000.0
-                number_races = 0
-                print("FALSE")
-            
-            print(driver_id)
-            print(value, number_races)      
-            
-            
-        except Exception as e:
-            print("Error:", e)
-            session.rollback()
-
-    return value, number_races
-
-
-
-def get_drivers_dict(data):
-    players = data.get('players', [])
+    # all drivers of the export and their current elo in one transaction
+    with Session(engine) as session, session.begin():
+        driver_ids = Saver.get_or_create_driver_ids(session, driver_dicts)
+        current_elos = get_current_elos(session, Elo, driver_ids.values())
 
     drivers_by_id = {}
 
     # Über die Liste der Spieler (players) iterieren, um die Zuordnung zu erstellen
-    for player in players:
-        player_id = player.get('ID')  # Verwende den Key "ID" für die Fahrer-ID
-        player_name = player.get('name')  # Verwende den Key "name" für den Fahrernamen
-        
-        driver, driver_id = get_or_create_driver(engine, player)
-        elo_value, elo_number_races = get_or_create_elo(engine, driver_id)
+    for driver_dict in driver_dicts:
+        player_id = driver_dict['id']  # Verwende den Key "ID" für die Fahrer-ID
+        player_name = driver_dict['name']  # Verwende den Key "name" für den Fahrernamen
+
+        elo_value, elo_number_races = current_elos[driver_ids[player_id]]
 
         drivers_by_id[player_id] = {
             "name":player_name,
-            "driver_db_object":driver,
+            "driver_id":driver_ids[player_id],
             "elo_value_before":elo_value,
             "elo_number_races_before":elo_number_races,
             "elo_value_new":elo_value,
@@ -92,14 +69,12 @@ def get_drivers_dict(data):
         }
     print(drivers_by_id)
     
-    return drivers_by_id
+    return drivers_by_id, results_by_id
         
     
    
-def get_events_df(data, drivers_by_id):
-
-    events = data.get('events', [])
-    players = data.get('players', [])
+def get_events_df(events, drivers_by_id, results_by_id):
+    # one pass over the events of the export, the positions come from the players pass (get_drivers_dict)
 
     # Erstelle ein neues Dictionary für die Events, um die Positionen der Fahrer zu sammeln
     event_results = {}
@@ -117,92 +92,41 @@ def get_events_df(data, drivers_by_id):
         event_timestamps.append(event['datePlayed'])
         event_indices.append(event['eventIndex'])
 
-        event_results[event_index] = {}
-
-        # Initialisiere die Positionen der Fahrer für dieses Event als leer
-        for driver_id in drivers_by_id.keys():
-            event_results[event_index][driver_id] = None
-
-        # Gehe über alle Spieler und sammle die Positionen für das Event
-        for player in players:
-            player_events = player.get('events', [])
-            player_id = player.get('ID')
-            for player_event in player_events:
-                if player_event['eventIndex'] == event_index:
-                    # Finde die Position des Fahrers für dieses Event
-                    position = player_event.get('position', None)
-                    if player_id in drivers_by_id:
-                        event_results[event_index][player_id] = position
+        # Positionen der Fahrer für dieses Event, leer wenn sie es nicht gefahren sind
+        event_results[event_index] = {
+            driver_id: results_by_id[driver_id].get(event_index, (None, None))[0]
+            for driver_id in drivers_by_id.keys()
+        }
 
     
     return pd.DataFrame.from_dict(event_results, orient='index'), event_names, event_timestamps, event_indices
 
 
 
-def calc_expected_score(driver_elo, opponent_elo, D=400):
-    # https://towardsdatascience.com/developing-a-generalized-elo-rating-system-for-multiplayer-games-b9b495e87802
-    # D=400 is a general default value
-    # it means that someone with 1500 ELO wins against someone with 1000 ELO with a likelihood of 95% which seems reasonable
-    return 1./(1+np.power(10., (opponent_elo-driver_elo)/D))
-
-
-def calc_elo_changes(drivers_by_id, df_events, event_names, event_timestamps, event_indices):
-    cars_by_player_and_event = {}
-
-    for player in data.get('players', []):
-        cars_by_player_and_event[player["name"]] = {}
-        for event in player["events"]:             
-             cars_by_player_and_event[player["name"]][event["eventIndex"]]= event["vehicle"]
-    
-
+def calc_elo_changes(session, drivers_by_id, results_by_id, df_events, event_names, event_timestamps, event_indices):
     for i, (_, event_results) in enumerate(df_events.iterrows()):
-        for driver_id, driver_result in event_results.items():
-            if driver_result == 0:
-                continue
+        # only drivers with a result take part in the race
+        driver_ids = [driver_id for driver_id, driver_result in event_results.items() if driver_result != 0]
 
-            print(drivers_by_id[driver_id]["name"], " with elo ", drivers_by_id[driver_id]["elo_value_before"])
+        elo_changes = rating.calc_elo_changes(
+            [drivers_by_id[driver_id]["elo_value_before"] for driver_id in driver_ids],
+            [event_results[driver_id] for driver_id in driver_ids],
+            K_FACTOR,
+        )
 
-            expected_score_nominator = 0
-            opponents = 0
-
-            for opponent_id, opponent_result in event_results.items():
-                if driver_id == opponent_id or opponent_result == 0:
-                    continue
-
-                single_expected_score = calc_expected_score(drivers_by_id[driver_id]["elo_value_before"], drivers_by_id[opponent_id]["elo_value_before"], D=400)
-
-                expected_score_nominator += single_expected_score
-                opponents += 1
-            
-            overall_players = opponents + 1
-                
-            expected_score = expected_score_nominator / (overall_players * opponents / 2)
-
-            scoring = (overall_players-driver_result) / (overall_players * opponents / 2)
-
-            elo_change = K_FACTOR * opponents * (scoring - expected_score)
-            print(f"Overall elo change: {elo_change} (had {opponents} opponents)")
+        for driver_id, elo_change in zip(driver_ids, elo_changes):
+            print(drivers_by_id[driver_id]["name"], " with elo ", drivers_by_id[driver_id]["elo_value_before"])
+            print(f"Overall elo change: {elo_change} (had {len(driver_ids) - 1} opponents)")
 
             # add elo change to previous elo, can never go below 100
-            new_elo = max(drivers_by_id[driver_id]["elo_value_before"] + elo_change, 100)
+            new_elo = max(drivers_by_id[driver_id]["elo_value_before"] + float(elo_change), rating.MIN_ELO)
             print(f"New ELO: {new_elo}")
 
-            drivers_by_id[driver_id]["last_car"] = cars_by_player_and_event[drivers_by_id[driver_id]["name"]][event_indices[i]]
+            drivers_by_id[driver_id]["last_car"] = results_by_id[driver_id][event_indices[i]][1]
             drivers_by_id[driver_id]["elo_value_new"] = new_elo
             drivers_by_id[driver_id]["elo_number_races_new"] = drivers_by_id[driver_id]["elo_number_races_before"] + 1
-                
-            # apply elo changes for all drivers
-            print(cars_by_player_and_event)
-
-            print(drivers_by_id[driver_id]["name"])
-
-            print(event_indices)
-
-            print(i)
-
-            print(cars_by_player_and_event[drivers_by_id[driver_id]["name"]][event_indices[i]])
 
-        apply_elo_changes(drivers_by_id, track_name=event_names[i], race_timestamp=event_timestamps[i])
+        apply_elo_changes(session, drivers_by_id, track_name=event_names[i], race_timestamp=event_timestamps[i])
 
         # after calculations for all drivers for that specific events are done, we need to update the before values for the next event
         # to make sure the updated elo values are used for the next event
@@ -214,37 +138,35 @@ def calc_elo_changes(drivers_by_id, df_events, event_names, event_timestamps, ev
     return drivers_by_id
 
 
-def apply_elo_changes(drivers_by_id, track_name, race_timestamp):
-    with Session(engine) as session:
-        try:
-            for driver_dict in drivers_by_id.values():
-                elo_change = driver_dict["elo_value_new"]-driver_dict["elo_value_before"]
-                
-                if elo_change == 0:
-                    continue
-                
-                new_elo_entry = Elo(
-                    driver_id=driver_dict["driver_db_object"].id,
-                    value=driver_dict["elo_value_new"],
-                    delta=elo_change,
-                    number_races=driver_dict["elo_number_races_new"],
-                    last_track_name=track_name,
-                    last_car_name=driver_dict["last_car"],
-                    last_timestamp=race_timestamp
-                )
-                session.add(new_elo_entry)
-            session.commit()
-        except Exception as e:
-            print("Error:", e)
-            session.rollback()
+def apply_elo_changes(session, drivers_by_id, track_name, race_timestamp):
+    # runs in the transaction of the whole export, errors roll back all events
+    elo_rows = []
 
+    for driver_dict in drivers_by_id.values():
+        elo_change = driver_dict["elo_value_new"]-driver_dict["elo_value_before"]
+        
+        if elo_change == 0:
+            continue
+        
+        elo_rows.append(
+            {
+                "driver_id": driver_dict["driver_id"],
+                "value": driver_dict["elo_value_new"],
+                "delta": elo_change,
+                "number_races": driver_dict["elo_number_races_new"],
+                "last_track_name": track_name,
+                "last_car_name": driver_dict["last_car"],
+                "last_timestamp": race_timestamp,
+            }
+        )
+
+    # the history and the current elo of every driver are written together
+    add_elo_rows(session, Elo, elo_rows)
 
-if __name__ == "__main__":
-    # load env vars from .env file
-    load_dotenv()
 
-    # create postgres engine
-    engine = create_engine(os.environ.get("TSU_HOTLAPPING_POSTGRES_URL"), echo=True)
+if __name__ == "__main__":
+    # shared postgres engine, configured in .env
+    engine = get_engine()
 
     # Check if a file path is provided as a command-line argument
     if len(sys.argv) < 2:
@@ -254,15 +176,26 @@ if __name__ == "__main__":
     # The first argument is always the script name, so the second argument (index 1) is the file path
     file_path = sys.argv[1]
 
-    # read file
-    with open(file_path, 'r', encoding='utf-8') as file:
-        data = json.load(file)
+    # the hash is read in chunks, players and events are parsed one at a time
+    file_hash = get_path_hash(file_path)
+
+    # skip exports that were already used for an elo update before parsing them
+    with Session(engine) as session:
+        if is_ingested(session, PROCESSOR_ELO, file_hash):
+            print(f"Skipping {file_path}, elo was already updated")
+            sys.exit(0)
 
-    # get drivers dict
-    drivers_by_id = get_drivers_dict(data)
+    # get drivers dict (only players and events are needed, teams are never parsed)
+    drivers_by_id, results_by_id = get_drivers_dict(iter_dbjson(file_path, "players"))
         
     # get events dataframe
-    df_events,event_names,event_timestamps,event_indices = get_events_df(data, drivers_by_id)
-
-    # calc elo changes for all events and all drivers
-    drivers_by_id = calc_elo_changes(drivers_by_id, df_events,event_names,event_timestamps,event_indices)
+    df_events,event_names,event_timestamps,event_indices = get_events_df(iter_dbjson(file_path, "events"), drivers_by_id, results_by_id)
+
+    # all events of the export and its ledger entry are written in one transaction,
+    # so a crash or an error in any event leaves the export unclaimed and nothing applied
+    with Session(engine) as session, session.begin():
+        if claim_file(session, PROCESSOR_ELO, get_ingested_file(file_path, file_hash)):
+            # calc elo changes for all events and all drivers
+            drivers_by_id = calc_elo_changes(session, drivers_by_id, results_by_id, df_events,event_names,event_timestamps,event_indices)
+        else:
+            print(f"Skipping {file_path}, elo was already updated")
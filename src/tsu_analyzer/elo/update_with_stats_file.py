@@ -1,68 +1,35 @@
 import os
 import sys
-import json
 import pandas as pd
 import numpy as np
-from sqlalchemy import create_engine, select, desc, and_
+from sqlalchemy import select, desc, and_
 from sqlalchemy.orm import Session
-from dotenv import load_dotenv
 
 sys.path.append(".")
 from src.tsu_analyzer.db.models import *
-
-K_FACTOR = 20
-
-def get_or_create_driver(engine, driver_dict):
-
-    with Session(engine) as session:
-        try:
-            driver = session.scalars(
-                select(Driver).where(Driver.steam_id == driver_dict["id"])
-            ).first()
-
-            if not driver:
-                driver = Driver(
-                    name=driver_dict["name"],
-                    steam_id=driver_dict["id"],
-                    clan=driver_dict["clan"],
-                    flag=driver_dict["flag"],
-                )
-                session.add(driver)
-                session.commit()
-            driver_id = driver.id
-        except Exception as e:
-            print("Error:", e)
-            session.rollback()
-
-    return driver, driver_id
-
-
-def get_or_create_elo(engine, driver_id):
-
-    with Session(engine) as session:
-        try:
-            elo = session.scalars(
-                select(Elo).where(Elo.driver_id == driver_id).order_by(desc(Elo.last_timestamp)
-                )
-            ).first()
-
-            if elo:
-                value = elo.value
-                number_races = elo.number_races
-            else:
-                value = 1000.0
-                number_races = 0
-        except Exception as e:
-            print("Error:", e)
-            session.rollback()
-    
-    return value, number_races
-
-
+from src.tsu_analyzer.db.Saver import Saver
+from src.tsu_analyzer.db.engine import get_engine
+from src.tsu_analyzer.elo import rating
+from src.tsu_analyzer.db.current_elo import get_current_elos, add_elo_rows
+from src.tsu_analyzer.stream_parser import load_event
+from src.tsu_analyzer.db.ledger import (
+    PROCESSOR_ELO,
+    get_path_hash,
+    get_ingested_file,
+    is_ingested,
+    claim_file,
+)
+
+K_FACTOR = rating.K_FACTOR
 
 def get_drivers_dict(data):
     players = data.get('players', [])
 
+    # all drivers of the race and their current elo in one transaction
+    with Session(engine) as session, session.begin():
+        driver_ids = Saver.get_or_create_driver_ids(session, [row["player"] for row in players])
+        current_elos = get_current_elos(session, Elo, driver_ids.values())
+
     drivers_by_id = {}
 
     # Über die Liste der Spieler (players) iterieren, um die Zuordnung zu erstellen
@@ -70,15 +37,13 @@ def get_drivers_dict(data):
         player = row["player"]
         player_id = player.get('id')  # Verwende den Key "ID" für die Fahrer-ID
         player_name = player.get('name')  # Verwende den Key "name" für den Fahrernamen
-        
-        driver, driver_id = get_or_create_driver(engine, player)
-        
-        elo_value, elo_number_races = get_or_create_elo(engine, driver_id)
-        
+
+        elo_value, elo_number_races = current_elos[driver_ids[player_id]]
+
         drivers_by_id[player_id] = {
             "index":i,
             "name":player_name,
-            "driver_db_object":driver,
+            "driver_id":driver_ids[player_id],
             "elo_value_before":elo_value,
             "elo_number_races_before":elo_number_races,
             "elo_value_new":elo_value,
@@ -112,43 +77,22 @@ def get_event_results(data, drivers_by_id):
 
 
 
-def calc_expected_score(driver_elo, opponent_elo, D=400):
-    # https://towardsdatascience.com/developing-a-generalized-elo-rating-system-for-multiplayer-games-b9b495e87802
-    # D=400 is a general default value
-    # it means that someone with 1500 ELO wins against someone with 1000 ELO with a likelihood of 95% which seems reasonable
-    return 1./(1+np.power(10., (opponent_elo-driver_elo)/D))
-
-
 def calc_elo_changes(drivers_by_id, event_data):
-    for driver_id, driver_result in event_data.items():
-        if driver_result == 0:
-            continue
-        
-        print(drivers_by_id[driver_id]["name"], " with elo ", drivers_by_id[driver_id]["elo_value_before"])
+    # only drivers with a result take part in the race
+    driver_ids = [driver_id for driver_id, driver_result in event_data.items() if driver_result != 0]
 
-        expected_score_nominator = 0.
-        opponents = 0
+    elo_changes = rating.calc_elo_changes(
+        [drivers_by_id[driver_id]["elo_value_before"] for driver_id in driver_ids],
+        [event_data[driver_id] for driver_id in driver_ids],
+        K_FACTOR,
+    )
 
-        for opponent_id, opponent_result in event_data.items():
-            if driver_id == opponent_id or opponent_result == 0:
-                continue
-
-            single_expected_score = calc_expected_score(drivers_by_id[driver_id]["elo_value_before"], drivers_by_id[opponent_id]["elo_value_before"], D=400)
-
-            expected_score_nominator += single_expected_score
-            opponents += 1
-        
-        overall_players = opponents + 1
-            
-        expected_score = expected_score_nominator / (overall_players * opponents / 2.)
-
-        scoring = (overall_players-driver_result) / (overall_players * opponents / 2.)
-
-        elo_change = K_FACTOR * opponents * (scoring - expected_score)
-        print(f"Overall elo change: {elo_change} (had {opponents} opponents)")
+    for driver_id, elo_change in zip(driver_ids, elo_changes):
+        print(drivers_by_id[driver_id]["name"], " with elo ", drivers_by_id[driver_id]["elo_value_before"])
+        print(f"Overall elo change: {elo_change} (had {len(driver_ids) - 1} opponents)")
 
         # add elo change to previous elo, can never go below 100
-        new_elo = max(drivers_by_id[driver_id]["elo_value_before"] + elo_change, 100)
+        new_elo = max(drivers_by_id[driver_id]["elo_value_before"] + float(elo_change), rating.MIN_ELO)
         print(f"New ELO: {new_elo}")
 
         drivers_by_id[driver_id]["elo_value_new"] = new_elo
@@ -158,26 +102,37 @@ def calc_elo_changes(drivers_by_id, event_data):
     return drivers_by_id
 
 
-def apply_elo_changes(drivers_by_id,track_name,race_timestamp):
+def apply_elo_changes(drivers_by_id,track_name,race_timestamp,ingested_file):
     with Session(engine) as session:
         try:
+            # elo changes of a race must only be applied once
+            if not claim_file(session, PROCESSOR_ELO, ingested_file):
+                print(f"Skipping {ingested_file['file_name']}, elo was already updated")
+                return
+
+            elo_rows = []
+
             for driver_dict in drivers_by_id.values():
                 elo_change = driver_dict["elo_value_new"]-driver_dict["elo_value_before"]
 
                 if elo_change == 0:
                     continue
                 
-                new_elo_entry = Elo(
-                    driver_id=driver_dict["driver_db_object"].id,
-                    value=driver_dict["elo_value_new"],
-                    delta=elo_change,
-                    number_races=driver_dict["elo_number_races_new"],
-                    last_track_name=track_name,
-                    last_car_name=driver_dict["last_car"],
-                    last_timestamp=race_timestamp
+                elo_rows.append(
+                    {
+                        "driver_id": driver_dict["driver_id"],
+                        "value": driver_dict["elo_value_new"],
+                        "delta": elo_change,
+                        "number_races": driver_dict["elo_number_races_new"],
+                        "last_track_name": track_name,
+                        "last_car_name": driver_dict["last_car"],
+                        "last_timestamp": race_timestamp,
+                    }
                 )
-                session.add(new_elo_entry)
             
+            # the history and the current elo of every driver are written together
+            add_elo_rows(session, Elo, elo_rows)
+
             session.commit()
         except Exception as e:
             print("Error:", e)
@@ -185,11 +140,8 @@ def apply_elo_changes(drivers_by_id,track_name,race_timestamp):
 
 
 if __name__ == "__main__":
-    # load env vars from .env file
-    load_dotenv()
-
-    # create postgres engine
-    engine = create_engine(os.environ.get("TSU_HOTLAPPING_POSTGRES_URL"), echo=True)
+    # shared postgres engine, configured in .env
+    engine = get_engine()
 
     # Check if a file path is provided as a command-line argument
     if len(sys.argv) < 2:
@@ -199,9 +151,18 @@ if __name__ == "__main__":
     # The first argument is always the script name, so the second argument (index 1) is the file path
     file_path = sys.argv[1]
 
-    # read file
-    with open(file_path, 'r', encoding='utf-8') as file:
-        data = json.load(file)
+    # the hash is read in chunks, the file is parsed without the checkpoint times
+    file_hash = get_path_hash(file_path)
+
+    # skip files that were already used for an elo update before parsing them
+    with Session(engine) as session:
+        if is_ingested(session, PROCESSOR_ELO, file_hash):
+            print(f"Skipping {file_path}, elo was already updated")
+            sys.exit(0)
+
+    # checkpoint times are not needed for elo, they are skipped while parsing
+    data = load_event(file_path)
+    ingested_file = get_ingested_file(file_path, file_hash, data)
 
     # get drivers dict
     drivers_by_id = get_drivers_dict(data)
@@ -213,4 +174,4 @@ if __name__ == "__main__":
     drivers_by_id = calc_elo_changes(drivers_by_id, event_data)
 
     # apply elo changes for all drivers
-    apply_elo_changes(drivers_by_id,track_name,race_timestamp)
\ No newline at end of file
+    apply_elo_changes(drivers_by_id,track_name,race_timestamp,ingested_file)
\ No newline at end of file
@@ -1,69 +1,36 @@
 import os
 import sys
-import json
 import shutil
 import pandas as pd
 import numpy as np
-from sqlalchemy import create_engine, select, desc, and_
+from sqlalchemy import select, desc, and_
 from sqlalchemy.orm import Session
-from dotenv import load_dotenv
 
 sys.path.append(".")
 from src.tsu_analyzer.db.models import *
-
-K_FACTOR = 20
-
-def get_or_create_driver(engine, driver_dict):
-
-    with Session(engine) as session:
-        try:
-            driver = session.scalars(
-                select(Driver).where(Driver.steam_id == driver_dict["id"])
-            ).first()
-
-            if not driver:
-                driver = Driver(
-                    name=driver_dict["name"],
-                    steam_id=driver_dict["id"],
-                    clan=driver_dict["clan"],
-                    flag=driver_dict["flag"],
-                )
-                session.add(driver)
-                session.commit()
-            driver_id = driver.id
-        except Exception as e:
-            print("Error:", e)
-            session.rollback()
-
-    return driver, driver_id
-
-
-def get_or_create_elo(engine, driver_id):
-
-    with Session(engine) as session:
-        try:
-            elo = session.scalars(
-                select(EloHeat).where(EloHeat.driver_id == driver_id).order_by(desc(EloHeat.last_timestamp)
-                )
-            ).first()
-
-            if elo:
-                value = elo.value
-                number_races = elo.number_races
-            else:
-                value = 1000.0
-                number_races = 0
-        except Exception as e:
-            print("Error:", e)
-            session.rollback()
-    
-    return value, number_races
-
-
-
-def get_drivers_dict(data):
+from src.tsu_analyzer.db.Saver import Saver
+from src.tsu_analyzer.db.engine import get_engine
+from src.tsu_analyzer.elo import rating
+from src.tsu_analyzer.db.current_elo import get_current_elos, add_elo_rows
+from src.tsu_analyzer.stream_parser import load_event
+from src.tsu_analyzer.db.ledger import (
+    PROCESSOR_ELO_HEAT,
+    get_path_hash,
+    get_ingested_file,
+    is_ingested,
+    claim_file,
+)
+
+K_FACTOR = rating.K_FACTOR
+
+def get_drivers_dict(engine, data):
     players = data.get('players', [])
 
+    # all drivers of the race and their current elo in one transaction
+    with Session(engine) as session, session.begin():
+        driver_ids = Saver.get_or_create_driver_ids(session, [row["player"] for row in players])
+        current_elos = get_current_elos(session, EloHeat, driver_ids.values())
+
     drivers_by_id = {}
 
     # Über die Liste der Spieler (players) iterieren, um die Zuordnung zu erstellen
@@ -71,15 +38,13 @@ def get_drivers_dict(data):
         player = row["player"]
         player_id = player.get('id')  # Verwende den Key "ID" für die Fahrer-ID
         player_name = player.get('name')  # Verwende den Key "name" für den Fahrernamen
-        
-        driver, driver_id = get_or_create_driver(engine, player)
-        
-        elo_value, elo_number_races = get_or_create_elo(engine, driver_id)
-        
+
+        elo_value, elo_number_races = current_elos[driver_ids[player_id]]
+
         drivers_by_id[player_id] = {
             "index":i,
             "name":player_name,
-            "driver_db_object":driver,
+            "driver_id":driver_ids[player_id],
             "elo_value_before":elo_value,
             "elo_number_races_before":elo_number_races,
             "elo_value_new":elo_value,
@@ -113,46 +78,26 @@ def get_event_results(data, drivers_by_id):
 
 
 
-def calc_expected_score(driver_elo, opponent_elo, D=400):
-    # https://towardsdatascience.com/developing-a-generalized-elo-rating-system-for-multiplayer-games-b9b495e87802
-    # D=400 is a general default value
-    # it means that someone with 1500 ELO wins against someone with 1000 ELO with a likelihood of 95% which seems reasonable
-    return 1./(1+np.power(10., (opponent_elo-driver_elo)/D))
-
-
 def calc_elo_changes(drivers_by_id, event_data):
-    for driver_id, driver_result in event_data.items():
-        if driver_result == 0:
-            continue
-        
-        print(drivers_by_id[driver_id]["name"], " with elo ", drivers_by_id[driver_id]["elo_value_before"])
-
-        expected_score_nominator = 0.
-        opponents = 0
-
-        for opponent_id, opponent_result in event_data.items():
-            if driver_id == opponent_id or opponent_result == 0:
-                continue
+    # only drivers with a result take part in the race
+    driver_ids = [driver_id for driver_id, driver_result in event_data.items() if driver_result != 0]
 
-            single_expected_score = calc_expected_score(drivers_by_id[driver_id]["elo_value_before"], drivers_by_id[opponent_id]["elo_value_before"], D=400)
-
-            expected_score_nominator += single_expected_score
-            opponents += 1
-        
-        if opponents == 0:
-            break
-
-        overall_players = opponents + 1
-            
-        expected_score = expected_score_nominator / (overall_players * opponents / 2.)
+    # nobody to race against, nothing changes
+    if len(driver_ids) < 2:
+        return drivers_by_id
 
-        scoring = (overall_players-driver_result) / (overall_players * opponents / 2.)
+    elo_changes = rating.calc_elo_changes(
+        [drivers_by_id[driver_id]["elo_value_before"] for driver_id in driver_ids],
+        [event_data[driver_id] for driver_id in driver_ids],
+        K_FACTOR,
+    )
 
-        elo_change = K_FACTOR * opponents * (scoring - expected_score)
-        print(f"Overall elo change: {elo_change} (had {opponents} opponents)")
+    for driver_id, elo_change in zip(driver_ids, elo_changes):
+        print(drivers_by_id[driver_id]["name"], " with elo ", drivers_by_id[driver_id]["elo_value_before"])
+        print(f"Overall elo change: {elo_change} (had {len(driver_ids) - 1} opponents)")
 
         # add elo change to previous elo, can never go below 100
-        new_elo = max(drivers_by_id[driver_id]["elo_value_before"] + elo_change, 100)
+        new_elo = max(drivers_by_id[driver_id]["elo_value_before"] + float(elo_change), rating.MIN_ELO)
         print(f"New ELO: {new_elo}")
 
         drivers_by_id[driver_id]["elo_value_new"] = new_elo
@@ -162,35 +107,79 @@ def calc_elo_changes(drivers_by_id, event_data):
     return drivers_by_id
 
 
-def apply_elo_changes(drivers_by_id,track_name,race_timestamp):
+def apply_elo_changes(engine,drivers_by_id,track_name,race_timestamp,ingested_file):
     with Session(engine) as session:
         try:
+            # elo changes of a race must only be applied once
+            if not claim_file(session, PROCESSOR_ELO_HEAT, ingested_file):
+                print(f"Skipping {ingested_file['file_name']}, elo was already updated")
+                return
+
+            elo_rows = []
+
             for driver_dict in drivers_by_id.values():
                 elo_change = driver_dict["elo_value_new"]-driver_dict["elo_value_before"]
                 
-                new_elo_entry = EloHeat(
-                    driver_id=driver_dict["driver_db_object"].id,
-                    value=driver_dict["elo_value_new"],
-                    delta=elo_change,
-                    number_races=driver_dict["elo_number_races_new"],
-                    last_track_name=track_name,
-                    last_car_name=driver_dict["last_car"],
-                    last_timestamp=race_timestamp
+                elo_rows.append(
+                    {
+                        "driver_id": driver_dict["driver_id"],
+                        "value": driver_dict["elo_value_new"],
+                        "delta": elo_change,
+                        "number_races": driver_dict["elo_number_races_new"],
+                        "last_track_name": track_name,
+                        "last_car_name": driver_dict["last_car"],
+                        "last_timestamp": race_timestamp,
+                    }
                 )
-                session.add(new_elo_entry)
             
+            # the history and the current elo of every driver are written together
+            add_elo_rows(session, EloHeat, elo_rows)
+
             session.commit()
         except Exception as e:
             print("Error:", e)
             session.rollback()
 
 
-if __name__ == "__main__":
-    # load env vars from .env file
-    load_dotenv()
+def update_elo_heat(engine, file_path):
+    # the hash is read in chunks, the file is parsed without the checkpoint times
+    file_hash = get_path_hash(file_path)
+
+    # files that were already used for an elo update are skipped
+    with Session(engine) as session:
+        already_processed = is_ingested(session, PROCESSOR_ELO_HEAT, file_hash)
 
-    # create postgres engine
-    engine = create_engine(os.environ.get("TSU_HOTLAPPING_POSTGRES_URL"), echo=True)
+    if already_processed:
+        print(f"Skipping {file_path}, elo was already updated")
+        return
+
+    # checkpoint times are not needed for elo, they are skipped while parsing
+    data = load_event(file_path)
+    ingested_file = get_ingested_file(file_path, file_hash, data)
+
+    # get drivers dict
+    drivers_by_id = get_drivers_dict(engine, data)
+
+    # get events dataframe
+    event_data,track_name,race_timestamp = get_event_results(data, drivers_by_id)
+
+    # calc elo changes for all events and all drivers
+    drivers_by_id = calc_elo_changes(drivers_by_id, event_data)
+
+    # apply elo changes for all drivers
+    apply_elo_changes(engine,drivers_by_id,track_name,race_timestamp,ingested_file)
+
+
+def move_to_processed(file_path, processed_dir):
+    file_name = os.path.basename(file_path)
+
+    shutil.move(file_path, os.path.join(processed_dir, file_name))
+    print(f"Moved {file_name} to {processed_dir}")
+
+
+if __name__ == "__main__":
+    # shared postgres engine, configured in .env
+    engine = get_engine()
 
     base_dir = os.path.expanduser("~/stat_files")
     processed_dir = os.path.join(base_dir, "processed")
@@ -205,30 +194,14 @@ if __name__ == "__main__":
             print(file_path)
 
             try:
-                # read file
-                with open(file_path, 'r', encoding='utf-8') as file:
-                    data = json.load(file)
-
-                # get drivers dict
-                drivers_by_id = get_drivers_dict(data)
-
-                # get events dataframe
-                event_data,track_name,race_timestamp = get_event_results(data, drivers_by_id)
-
-                # calc elo changes for all events and all drivers
-                drivers_by_id = calc_elo_changes(drivers_by_id, event_data)
-
-                # apply elo changes for all drivers
-                apply_elo_changes(drivers_by_id,track_name,race_timestamp)
+                update_elo_heat(engine, file_path)
 
                 # Move the file to the "processed" subdirectory
-                shutil.move(file_path, os.path.join(processed_dir, file_name))
-                print(f"Moved {file_name} to {processed_dir}")
+                move_to_processed(file_path, processed_dir)
             except Exception as e:
                 print("Error! ", e)
                 print("Trying to move the file anyways")
                 try:
-                    shutil.move(file_path, os.path.join(processed_dir, file_name))
-                    print(f"Moved {file_name} to {processed_dir}")
+                    move_to_processed(file_path, processed_dir)
                 except Exception as ee:
                     print("Error moving file! ", e)
\ No newline at end of file
@@ -0,0 +1,203 @@
+import os
+import json
+import hashlib
+import shutil
+import tempfile
+import numpy as np
+import pandas as pd
+from pathlib import Path
+
+# pyarrow is optional (pdm install -G cache), without it the tables are built in memory every time
+try:
+    import pyarrow  # noqa: F401
+except ImportError:
+    pyarrow = None
+
+
+# eventstats files are converted once into these tables and stored as
+# <cache dir>/v<CACHE_VERSION>/<sha256 of the file content>/<table>.parquet
+TABLES = ("players", "checkpoint_times", "rankings", "sectors")
+
+# increase whenever the columns, dtypes or encoding of a table change, old caches are not read anymore
+CACHE_VERSION = 2
+
+CACHE_DIR = Path(os.getenv("TSU_EVENT_CACHE_DIR", "event_cache"))
+
+
+def is_event_tables(result) -> bool:
+    return isinstance(result, dict) and all(table in result for table in TABLES)
+
+
+### BUILD TABLES ###
+def get_players_table(result_dict: dict):
+    players = result_dict.get("players", [])
+    player_stats = result_dict.get("raceStats", {}).get("playerStats", [])
+
+    # start time from playerStats (same order as players), used for the time to the first checkpoint,
+    # NA for players without a stats entry
+    start_times = [player_stat["startTime"] for player_stat in player_stats[: len(players)]]
+    start_times += [None] * (len(players) - len(start_times))
+
+    return pd.DataFrame(
+        {
+            "index": np.arange(len(players), dtype=np.int64),
+            "name": [row["player"]["name"] for row in players],
+            "id": np.array([row["player"]["id"] for row in players], dtype=np.int64),
+            "clan": [row["player"]["clan"] for row in players],
+            "flag": [row["player"]["flag"] for row in players],
+            "ai": np.array([row["player"]["ai"] for row in players], dtype=bool),
+            "vehicle": [row["vehicle"]["name"] for row in players],
+            "vehicle_guid": [row["vehicle"]["guid"] for row in players],
+            "start_position": np.array(
+                [row["startPosition"] for row in players], dtype=np.int64
+            ),
+            "start_time": pd.array(start_times, dtype="Int64"),
+        }
+    )
+
+
+def get_checkpoint_times_table(result_dict: dict):
+    # one row per checkpoint time: player_index, lap (starting at 1), cp (starting at 0), raw time in ticks
+    columns = {"player_index": [], "lap": [], "cp": [], "time": []}
+
+    for player_index, player_stat in enumerate(
+        result_dict["raceStats"]["playerStats"], start=0
+    ):
+        lap_times = [lap_data["times"] for lap_data in player_stat["checkpointTimes"]]
+        lap_lengths = np.array([len(times) for times in lap_times], dtype=np.int64)
+        number_cps = int(lap_lengths.sum())
+
+        columns["player_index"].append(np.full(number_cps, player_index))
+        columns["lap"].append(np.repeat(np.arange(1, len(lap_times) + 1), lap_lengths))
+        columns["cp"].append(
+            np.arange(number_cps)
+            - np.repeat(np.cumsum(lap_lengths) - lap_lengths, lap_lengths)
+        )
+        columns["time"].append(
+            np.fromiter(
+                (cp_time for times in lap_times for cp_time in times),
+                dtype=np.int64,
+                count=number_cps,
+            )
+        )
+
+    return pd.DataFrame(
+        {
+            name: np.concatenate(values or [[]]).astype(np.int64)
+            for name, values in columns.items()
+        }
+    )
+
+
+def get_rankings_table(result_dict: dict):
+    # race and lap ranking entries in one table, position starts at 1 within each ranking
+    rows = []
+
+    race_stats = result_dict.get("raceStats", {})
+
+    for ranking, key in (("race", "raceRanking"), ("lap", "lapRanking")):
+        for position, entry in enumerate(
+            race_stats.get(key, {}).get("entries", []), start=1
+        ):
+            rows.append(
+                {
+                    "ranking": ranking,
+                    "position": position,
+                    "player_index": entry["playerIndex"],
+                    "time": entry["time"],
+                    "laps_completed": entry.get("lapsCompleted"),
+                    "last_checkpoint": entry.get("lastCheckpoint"),
+                    "lap": entry.get("lap"),
+                    "cflags": entry.get("cFlags"),
+                }
+            )
+
+    df = pd.DataFrame(
+        rows,
+        columns=[
+            "ranking",
+            "position",
+            "player_index",
+            "time",
+            "laps_completed",
+            "last_checkpoint",
+            "lap",
+            "cflags",
+        ],
+    )
+
+    return df.astype(
+        {
+            "position": "int64",
+            "player_index": "int64",
+            "time": "int64",
+            "laps_completed": "Int64",
+            "last_checkpoint": "Int64",
+            "lap": "Int64",
+            "cflags": "Int64",
+        }
+    )
+
+
+def get_sectors_table(result_dict: dict):
+    sector_to_checkpoint = result_dict["raceStats"]["checkpoints"]["sectorToCheckpoint"]
+
+    return pd.DataFrame(
+        {
+            "sector": np.arange(1, len(sector_to_checkpoint) + 1, dtype=np.int64),
+            "checkpoint": np.array(sector_to_checkpoint, dtype=np.int64),
+        }
+    )
+
+
+def get_event_tables(result_dict: dict):
+    return {
+        "players": get_players_table(result_dict),
+        "checkpoint_times": get_checkpoint_times_table(result_dict),
+        "rankings": get_rankings_table(result_dict),
+        "sectors": get_sectors_table(result_dict),
+    }
+
+
+### CACHE ###
+def _read_tables(cache_path: Path):
+    return {
+        table: pd.read_parquet(cache_path / f"{table}.parquet") for table in TABLES
+    }
+
+
+def _write_tables(cache_path: Path, tables: dict):
+    cache_path.parent.mkdir(parents=True, exist_ok=True)
+
+    # write into a temporary directory first so readers never see half written tables
+    tmp_path = Path(tempfile.mkdtemp(dir=cache_path.parent, prefix=".tmp_"))
+
+    try:
+        for table, df in tables.items():
+            df.to_parquet(tmp_path / f"{table}.parquet", index=False)
+
+        os.replace(tmp_path, cache_path)
+    except OSError:
+        # another process cached the same file in the meantime
+        shutil.rmtree(tmp_path, ignore_errors=True)
+
+
+def load_event_tables(path: Path, cache_dir: Path = None):
+    with open(path, "rb") as file:
+        content = file.read()
+
+    cache_path = (
+        Path(cache_dir or CACHE_DIR)
+        / f"v{CACHE_VERSION}"
+        / hashlib.sha256(content).hexdigest()
+    )
+
+    if pyarrow is not None and cache_path.is_dir():
+        return _read_tables(cache_path)
+
+    tables = get_event_tables(json.loads(content.decode("utf-8")))
+
+    if pyarrow is not None:
+        _write_tables(cache_path, tables)
+
+    return tables
@@ -0,0 +1,215 @@
+import os
+import time
+import subprocess
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import matplotlib as mpl
+import matplotlib.pyplot as plt
+from matplotlib import font_manager as fm
+
+# Parallel rendering of the race animation: every worker process draws the static part of the figure
+# (titles, track, legend) once, then renders its chunks of frames by restoring that background and
+# drawing only the driver points. The raw RGB frames are piped in order to a single ffmpeg process.
+
+FPS = 30
+
+# raw RGB frames that may wait for ffmpeg in the parent process, a frame at dpi 300 is ~27 MB
+MAX_BUFFER_MB = 1024
+
+# figure of the worker process, set up once by init_worker
+_worker = {}
+
+
+def draw_race_figure(font_path, name_of_track, author, x_smooth, z_smooth, driver_names):
+    # everything except the driver positions, the same for the FuncAnimation and the parallel rendering
+    impact_font = fm.FontProperties(fname=font_path)
+    colors = plt.cm.get_cmap(
+        "tab20", len(driver_names)
+    )  # Use tab20 colormap for up to 20 distinct colors
+
+    # Prepare the figure
+    fig, ax = plt.subplots(figsize=(10, 10), facecolor="dimgray")
+    ax.set_facecolor("dimgray")
+    ax.axis("equal")
+    ax.axis("off")
+
+    # Set the title and track name
+    ax.text(
+        0.5,
+        1.05,
+        f"{name_of_track.upper()} - Race Animation",
+        fontsize=24,
+        color="white",
+        fontproperties=impact_font,
+        ha="center",
+        va="top",
+        transform=ax.transAxes,
+    )
+    ax.text(
+        0.5,
+        1.02,
+        f"by {author}",
+        fontsize=16,
+        color="#8B0000",
+        fontproperties=impact_font,
+        ha="center",
+        va="top",
+        transform=ax.transAxes,
+    )
+
+    # Draw the track
+    ax.plot(x_smooth, z_smooth, color="white", linewidth=2)
+
+    # Prepare driver point placeholders
+    driver_points = [
+        ax.plot([], [], "o", color=colors(i), markersize=12)[0]
+        for i in range(len(driver_names))
+    ]
+
+    # Add legend to the plot
+    legend_handles = [
+        plt.Line2D([0], [0], color=colors(i), lw=4, label=driver)
+        for i, driver in enumerate(driver_names)
+    ]
+    ax.legend(
+        handles=legend_handles,
+        loc="upper right",
+        bbox_to_anchor=(1.15, 1),
+        title="Drivers",
+        prop=impact_font,
+    )
+
+    return fig, ax, driver_points
+
+
+def init_worker(figure_args, positions, dpi):
+    # positions: (frames, drivers, 2) array with the (x, z) of every driver in every frame
+    mpl.use("Agg")
+    fig, ax, driver_points = draw_race_figure(*figure_args)
+    fig.set_dpi(dpi)
+
+    # the static background is rendered once and restored for every frame
+    for point in driver_points:
+        point.set_animated(True)
+    fig.canvas.draw()
+
+    _worker["fig"] = fig
+    _worker["ax"] = ax
+    _worker["driver_points"] = driver_points
+    _worker["background"] = fig.canvas.copy_from_bbox(fig.bbox)
+    _worker["positions"] = positions
+
+
+def render_frames(start, stop):
+    # raw rgb24 bytes of the frames start..stop-1
+    fig = _worker["fig"]
+    ax = _worker["ax"]
+    canvas = fig.canvas
+    frames = []
+
+    for frame in range(start, stop):
+        canvas.restore_region(_worker["background"])
+
+        for point, (x, z) in zip(_worker["driver_points"], _worker["positions"][frame]):
+            point.set_data([x], [z])
+            ax.draw_artist(point)
+
+        frames.append(np.asarray(canvas.buffer_rgba())[:, :, :3].tobytes())
+
+    return b"".join(frames)
+
+
+def get_frame_size(figure_args, dpi):
+    fig, _, _ = draw_race_figure(*figure_args)
+    fig.set_dpi(dpi)
+    width, height = fig.canvas.get_width_height()
+    plt.close(fig)
+    return width, height
+
+
+def get_ffmpeg_command(output_path, width, height):
+    return [
+        mpl.rcParams["animation.ffmpeg_path"],
+        "-y",
+        "-loglevel",
+        "error",
+        "-f",
+        "rawvideo",
+        "-pix_fmt",
+        "rgb24",
+        "-s",
+        f"{width}x{height}",
+        "-r",
+        str(FPS),
+        "-i",
+        "-",
+        "-vcodec",
+        "h264",
+        "-pix_fmt",
+        "yuv420p",
+        output_path,
+    ]
+
+
+def get_frames_in_flight(workers, frame_bytes, max_buffer_mb=MAX_BUFFER_MB):
+    # at most 2 frames per worker (one rendering, one waiting to be written), fewer if they exceed the buffer budget
+    budget_frames = int(max_buffer_mb * 1024 * 1024 // frame_bytes)
+    return max(1, min(2 * workers, budget_frames))
+
+
+def render_animation(
+    figure_args, positions, output_path, dpi=300, workers=None, max_buffer_mb=MAX_BUFFER_MB
+):
+    """Render the frames in worker processes and pipe them in order to ffmpeg.
+
+    Every frame is a separate task. The finished frames wait in the parent process until
+    they are written, and the memory for them is limited. There are at most 2 frames per
+    worker in flight, and never more than max_buffer_mb of raw RGB data. A frame at dpi 300
+    is about 27 MB, so with the default of 1024 MB at most 39 frames are held. Fewer frames
+    in flight than workers leaves some workers idle.
+    """
+    # figure_args: arguments of draw_race_figure, positions: (frames, drivers, 2)
+    workers = workers or os.cpu_count()
+    frames = len(positions)
+    width, height = get_frame_size(figure_args, dpi)
+    frames_in_flight = get_frames_in_flight(workers, width * height * 3, max_buffer_mb)
+
+    print(
+        f"Rendering {frames} frames ({width}x{height}) with {workers} workers, "
+        f"at most {frames_in_flight} frames ({frames_in_flight * width * height * 3 / 1e6:.0f} MB) buffered"
+    )
+    start = time.time()
+
+    ffmpeg = subprocess.Popen(
+        get_ffmpeg_command(output_path, width, height), stdin=subprocess.PIPE
+    )
+
+    try:
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=init_worker,
+            initargs=(figure_args, positions, dpi),
+        ) as pool:
+            next_frame = 0
+            rendering = deque()
+
+            while True:
+                while len(rendering) < frames_in_flight and next_frame < frames:
+                    rendering.append(pool.submit(render_frames, next_frame, next_frame + 1))
+                    next_frame += 1
+
+                if not rendering:
+                    break
+
+                # the frames are written in order, later ones keep rendering meanwhile
+                ffmpeg.stdin.write(rendering.popleft().result())
+    finally:
+        ffmpeg.stdin.close()
+        returncode = ffmpeg.wait()
+
+    if returncode != 0:
+        raise RuntimeError(f"ffmpeg exited with code {returncode}")
+
+    print(f"Rendered {frames} frames in {time.time() - start:.1f}s")
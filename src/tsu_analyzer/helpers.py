@@ -1,5 +1,6 @@
 import os
 import json
+from functools import lru_cache
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
@@ -7,7 +8,19 @@ from pathlib import Path
 import matplotlib as mpl
 from matplotlib import font_manager as fm, cm, colors
 from matplotlib.animation import FuncAnimation
+from matplotlib.collections import LineCollection
 from scipy.interpolate import splprep, splev
+from src.tsu_analyzer.event_cache import (
+    is_event_tables,
+    load_event_tables,
+    get_checkpoint_times_table,
+)
+from src.tsu_analyzer.tracing import Tracer
+from src.tsu_analyzer.frame_render import (
+    MAX_BUFFER_MB,
+    draw_race_figure,
+    render_animation,
+)
 
 # Set the path to the ffmpeg executable explicitly
 mpl.rcParams["animation.ffmpeg_path"] = "/usr/bin/ffmpeg"
@@ -23,44 +36,37 @@ def _calculate_distance(row1, row2):
 
 
 ### READ DATA ###
-def get_track_data(path: Path):
+def get_track_data(path: Path, cumulative_distance: bool = False):
     df = pd.read_csv(path)
 
     # Move the first row to the last as the last checkpoint should be the start-finish-line
     df = pd.concat([df.iloc[1:], df.iloc[:1]], ignore_index=True)
 
-    # calculate pixel distance to previous cp (if first, then distance to first)
-    df["distance_to_last"] = [
-        (
-            _calculate_distance(df.iloc[i], df.iloc[i - 1])
-            if i > 0
-            else _calculate_distance(df.iloc[i], df.iloc[-1])
-        )
-        for i in range(len(df))
-    ]
+    # calculate pixel distance to previous cp (if first, then distance to last one)
+    coords = df[["x", "y", "z"]].to_numpy(dtype=np.float64)
+    df["distance_to_last"] = np.sqrt(
+        ((coords - np.roll(coords, 1, axis=0)) ** 2).sum(axis=1)
+    )
 
     # assign cp number to each row
-    df["cp"] = range(1, len(df) + 1)
-
-    # Initialize sector columns
-    df["sector"] = None
-    df["sector_ends"] = False
+    df["cp"] = np.arange(1, len(df) + 1)
 
-    # Set initial sector number
-    sector = 1
+    # a sector ends at every "Sector" checkpoint and at the last row (start-finish-line)
+    sector_ends = (df["Type"] == "Sector").to_numpy()
+    df["sector_ends"] = sector_ends
+    df.loc[len(df) - 1, "sector_ends"] = True
 
-    # Iterate by index to modify df directly
-    for i in range(len(df)):
-        df.at[i, "sector"] = sector
+    # sector number increases after every "Sector" checkpoint
+    df["sector"] = 1 + np.cumsum(sector_ends) - sector_ends
 
-        if df.at[i, "Type"] == "Sector":
-            sector += 1
-            df.at[i, "sector_ends"] = True
+    columns = ["cp", "sector", "sector_ends", "x", "y", "z", "distance_to_last"]
 
-    # Set sector_ends to True for the last row
-    df.at[len(df) - 1, "sector_ends"] = True
+    # optional distance from the start-finish-line along the checkpoints
+    if cumulative_distance:
+        df["cumulative_distance"] = df["distance_to_last"].cumsum()
+        columns.append("cumulative_distance")
 
-    return df[["cp", "sector", "sector_ends", "x", "y", "z", "distance_to_last"]]
+    return df[columns]
 
 
 def get_result_data(path: Path):
@@ -70,7 +76,24 @@ def get_result_data(path: Path):
 
 
 ### TRANSFORM DATA ###
+DRIVER_COLUMNS = [
+    "index",
+    "name",
+    "id",
+    "clan",
+    "flag",
+    "ai",
+    "vehicle",
+    "vehicle_guid",
+    "start_position",
+]
+
+
 def get_drivers_df(result_dict: dict):
+    # accepts the raw eventstats dict or the tables from event_cache.load_event_tables
+    if is_event_tables(result_dict):
+        return result_dict["players"][DRIVER_COLUMNS].copy()
+
     players = result_dict.get("players", [])
 
     drivers = []
@@ -137,84 +160,98 @@ def get_drivers_data_by_index(result_dict: dict):
 
 
 def get_results_df(result_dict: dict):
-    race_stats = result_dict.get("raceStats", [])
-
-    indices_of_sector_checkpoints = race_stats["checkpoints"]["sectorToCheckpoint"][1:]
-
-    result_time_data = []
-
-    for player_index, player_stat in enumerate(race_stats["playerStats"], start=0):
-        player_data = []
-
-        start_time = player_stat["startTime"]
-        last_cp_time = None
+    # accepts the raw eventstats dict or the tables from event_cache.load_event_tables
+    if is_event_tables(result_dict):
+        checkpoint_times = result_dict["checkpoint_times"]
+        # players without stats have no checkpoint times, so their (missing) start time is never used
+        start_times = result_dict["players"]["start_time"].to_numpy(
+            dtype=np.int64, na_value=0
+        )
+        sector_to_checkpoint = result_dict["sectors"]["checkpoint"].to_numpy()
+    else:
+        race_stats = result_dict.get("raceStats", [])
+
+        checkpoint_times = get_checkpoint_times_table(result_dict)
+        start_times = np.array(
+            [player_stat["startTime"] for player_stat in race_stats["playerStats"]],
+            dtype=np.int64,
+        )
+        sector_to_checkpoint = race_stats["checkpoints"]["sectorToCheckpoint"]
 
-        for lap, lap_data in enumerate(player_stat["checkpointTimes"], start=1):
-            # set sector to 1 at the beginning of the lap
-            sector = 1
+    indices_of_sector_checkpoints = np.unique(sector_to_checkpoint[1:])
 
-            for cp, cp_time in enumerate(lap_data["times"], start=0):
-                if cp in indices_of_sector_checkpoints:
-                    sector += 1
+    player_index = checkpoint_times["player_index"].to_numpy()
+    lap = checkpoint_times["lap"].to_numpy()
+    cp = checkpoint_times["cp"].to_numpy()
+    cp_times = checkpoint_times["time"].to_numpy()
 
-                player_data.append(
-                    {
-                        "lap": lap,
-                        "sector": sector,
-                        "cp": cp,
-                        "player_index": player_index,
-                        "time": (
-                            (cp_time - start_time) / 10000.0
-                            if last_cp_time is None
-                            else (cp_time - last_cp_time) / 10000.0
-                        ),
-                    }
-                )
+    # sector starts at 1 in every lap and increases at every sector checkpoint
+    sector = 1 + np.searchsorted(indices_of_sector_checkpoints, cp, side="right")
 
-                last_cp_time = cp_time
+    # time since the previous checkpoint of the same player, the very first one since the start
+    first_of_player = np.ones(len(player_index), dtype=bool)
+    first_of_player[1:] = player_index[1:] != player_index[:-1]
 
-        result_time_data.append(player_data)
+    previous_cp_times = np.roll(cp_times, 1)
+    previous_cp_times[first_of_player] = start_times[player_index[first_of_player]]
 
-    # Flatten list of lists and convert to DataFrame
-    flat_data = [item for sublist in result_time_data for item in sublist]
-    df = pd.DataFrame(flat_data)
+    time = (cp_times - previous_cp_times) / 10000.0
 
     ### Correct cp = 0 entries
     # the first entry from each lap should be assigned to the prior lap cause it is the time the car needed to go from the last cp to the start line
     # for lap 1 the time is always 0, so we can drop that
-    df = df.loc[((df["lap"] != 1) | (df["cp"] != 0))].reset_index(drop=True)
+    keep = (lap != 1) | (cp != 0)
+    lap, sector, cp, player_index, time = (
+        values[keep] for values in (lap, sector, cp, player_index, time)
+    )
 
-    # # identify indices where cp equals 0
-    cp_zero_indices = df[df["cp"] == 0].index
+    # identify entries where cp equals 0 and the last entry before them that does not
+    cp_zero = cp == 0
+    positions = np.arange(len(cp))
+    previous = np.maximum.accumulate(np.where(cp_zero, 0, positions))
 
-    for idx in cp_zero_indices:
-        # assign to previous lap
-        df.at[idx, "lap"] -= 1
+    # assign to previous lap
+    lap = lap - cp_zero
 
-        # assign to last sector
-        df.at[idx, "sector"] = df.at[idx - 1, "sector"]
+    # assign to last sector
+    sector = np.where(cp_zero, sector[previous], sector)
 
-        # use last cp number and add 1 as it is really the last cp
-        df.at[idx, "cp"] = df.at[idx - 1, "cp"] + 1
+    # use last cp number and add 1 as it is really the last cp
+    cp = np.where(cp_zero, cp[previous] + positions - previous, cp)
+
+    df = pd.DataFrame(
+        {
+            "lap": lap,
+            "sector": sector,
+            "cp": cp,
+            "player_index": player_index,
+            "time": time,
+        }
+    )
 
     df.sort_values(by=["lap", "cp", "player_index"], ascending=True, inplace=True)
 
     return df
 
 
-def plot_driver_comparison(
-    df,
-    df_track,
-    driver1,
-    driver2,
-    speed_output_path,
-    time_output_path,
-    name_of_track,
-    author,
-):
+# figures of plot_driver_comparison with everything that does not depend on the drivers,
+# by title, track and author, so comparing all pairs of a lobby only recolors the track
+_comparison_figures = {}
+
+
+@lru_cache(maxsize=None)
+def get_font(font_path):
+    return fm.FontProperties(fname=font_path)
+
+
+def get_comparison_figure(df_track, title, name_of_track, author):
+    key = (title, name_of_track, author, df_track[["x", "z"]].to_numpy().tobytes())
+
+    if key in _comparison_figures:
+        return _comparison_figures[key]
+
     # Load the local Impact font
-    font_path = Path("track_coords/04B_09__.ttf")
-    impact_font = fm.FontProperties(fname=font_path)
+    impact_font = get_font(Path("track_coords/04B_09__.ttf"))
 
     # Adjust midpoint for track data
     x_middle_adjusted = df_track["x"]
@@ -227,6 +264,127 @@ def plot_driver_comparison(
     unew = np.linspace(0, 1, 1000)
     x_smooth, z_smooth = splev(unew, tck)
 
+    fig, ax = plt.subplots(figsize=(10, 10), facecolor="dimgray")
+    ax.set_facecolor("dimgray")
+
+    # One collection for all segments of the track, colored per comparison
+    points = np.column_stack((x_smooth, z_smooth))
+    segments = np.stack((points[:-1], points[1:]), axis=1)
+    track = LineCollection(
+        segments,
+        cmap=cm.get_cmap("RdYlBu"),
+        linewidth=8,  # Increased track line width
+        capstyle="projecting",
+    )
+    track.set_array(np.zeros(len(segments)))
+    ax.add_collection(track)
+    ax.autoscale_view()
+
+    # Add start/finish line as a simple black line with reduced width
+    start_x, start_z = x_smooth[0], z_smooth[0]
+    next_x, next_z = x_smooth[1], z_smooth[1]
+    dx, dz = next_x - start_x, next_z - start_z
+    perp_dx, perp_dz = -dz, dx  # Rotate 90 degrees to find perpendicular direction
+    marker_length = 15
+    marker_x = [
+        start_x - perp_dx * marker_length / np.hypot(perp_dx, perp_dz),
+        start_x + perp_dx * marker_length / np.hypot(perp_dx, perp_dz),
+    ]
+    marker_z = [
+        start_z - perp_dz * marker_length / np.hypot(perp_dx, perp_dz),
+        start_z + perp_dz * marker_length / np.hypot(perp_dx, perp_dz),
+    ]
+    ax.plot(marker_x, marker_z, color="black", linewidth=6)  # Reduced line width
+
+    # Set title with shadow effect similar to track name
+    title_x, title_y = 0.5, 1.05
+    # Shadow
+    ax.text(
+        title_x,
+        title_y - 0.003,
+        title,
+        fontsize=28,
+        color="black",
+        fontproperties=impact_font,
+        ha="center",
+        va="top",
+        transform=ax.transAxes,
+    )
+    # Main title
+    ax.text(
+        title_x,
+        title_y,
+        title,
+        fontsize=28,
+        color="white",
+        fontproperties=impact_font,
+        ha="center",
+        va="top",
+        transform=ax.transAxes,
+    )
+    ax.axis("equal")
+    ax.axis("off")
+
+    # Add color bar to represent comparison between drivers
+    cbar = plt.colorbar(track, ax=ax, orientation="vertical", pad=0.02, aspect=25)
+    cbar.ax.tick_params(labelsize=12, colors="white")
+
+    # Add track name and author text at the bottom with more distance
+    text_x, text_y = (
+        ax.get_xlim()[0],
+        ax.get_ylim()[0] - 40,
+    )  # Adjust to place text further at the bottom of the plot
+    ax.text(
+        text_x + 1,
+        text_y - 1,
+        name_of_track.upper(),
+        color="black",
+        fontsize=24,
+        ha="left",
+        fontproperties=impact_font,
+    )
+    ax.text(
+        text_x,
+        text_y,
+        name_of_track.upper(),
+        color="white",
+        fontsize=24,
+        ha="left",
+        fontproperties=impact_font,
+    )
+    ax.text(
+        text_x + 1,
+        text_y - 60,
+        f"by {author}".upper(),
+        color="black",
+        fontsize=17,
+        ha="left",
+        fontproperties=impact_font,
+    )
+    ax.text(
+        text_x,
+        text_y - 59,
+        f"by {author}".upper(),
+        color="#8B0000",
+        fontsize=17,
+        ha="left",
+        fontproperties=impact_font,
+    )
+
+    _comparison_figures[key] = (fig, track, cbar, impact_font)
+    return _comparison_figures[key]
+
+
+def plot_driver_comparison(
+    df,
+    df_track,
+    driver1,
+    driver2,
+    speed_output_path,
+    time_output_path,
+    name_of_track,
+    author,
+):
     # Filter data for each driver to compute metrics
     df_speed = df.groupby(["cp", "name"])["speed_kmh"].median().unstack()
     df_time = df.groupby(["cp", "name"])["time"].min().unstack()
@@ -239,82 +397,29 @@ def plot_driver_comparison(
     speed_diff = df_speed[driver1] - df_speed[driver2]
     time_diff = df_time[driver2] - df_time[driver1]  # Lower time means faster
 
-    # Set colormap
-    cmap = cm.get_cmap("RdYlBu")
-
     # Normalize data for color scaling with symmetric range
     max_abs_speed_diff = max(abs(speed_diff.min()), abs(speed_diff.max()))
     max_abs_time_diff = max(abs(time_diff.min()), abs(time_diff.max()))
     norm_speed = colors.Normalize(vmin=-max_abs_speed_diff, vmax=max_abs_speed_diff)
     norm_time = colors.Normalize(vmin=-max_abs_time_diff, vmax=max_abs_time_diff)
 
-    def plot_colored_track(ax, x_smooth, z_smooth, data_diff, norm, title, unit):
-        # Plot each checkpoint colored by the difference
-        for i in range(len(x_smooth) - 1):
-            cp_index = int(
-                i * len(data_diff) / len(x_smooth)
-            )  # Scale to data_diff length
-            if cp_index in data_diff.index:
-                color_val = norm(data_diff.iloc[cp_index])
-                color = cmap(color_val)
-            else:
-                color = cmap(0.5)  # Neutral color
-            ax.plot(
-                x_smooth[i : i + 2],
-                z_smooth[i : i + 2],
-                color=color,
-                linewidth=8,  # Increased track line width
-            )
-
-        # Add start/finish line as a simple black line with reduced width
-        start_x, start_z = x_smooth[0], z_smooth[0]
-        next_x, next_z = x_smooth[1], z_smooth[1]
-        dx, dz = next_x - start_x, next_z - start_z
-        perp_dx, perp_dz = -dz, dx  # Rotate 90 degrees to find perpendicular direction
-        marker_length = 15
-        marker_x = [
-            start_x - perp_dx * marker_length / np.hypot(perp_dx, perp_dz),
-            start_x + perp_dx * marker_length / np.hypot(perp_dx, perp_dz),
-        ]
-        marker_z = [
-            start_z - perp_dz * marker_length / np.hypot(perp_dx, perp_dz),
-            start_z + perp_dz * marker_length / np.hypot(perp_dx, perp_dz),
-        ]
-        ax.plot(marker_x, marker_z, color="black", linewidth=6)  # Reduced line width
-
-        # Set title with shadow effect similar to track name
-        title_x, title_y = 0.5, 1.05
-        # Shadow
-        ax.text(
-            title_x,
-            title_y - 0.003,
-            title,
-            fontsize=28,
-            color="black",
-            fontproperties=impact_font,
-            ha="center",
-            va="top",
-            transform=ax.transAxes,
+    def plot_colored_track(data_diff, norm, title, output_path):
+        fig, track, cbar, impact_font = get_comparison_figure(
+            df_track, title, name_of_track, author
         )
-        # Main title
-        ax.text(
-            title_x,
-            title_y,
-            title,
-            fontsize=28,
-            color="white",
-            fontproperties=impact_font,
-            ha="center",
-            va="top",
-            transform=ax.transAxes,
-        )
-        ax.axis("equal")
-        ax.axis("off")
 
-        # Add color bar to represent comparison between drivers
-        sm = plt.cm.ScalarMappable(cmap=cmap, norm=norm)
-        sm.set_array([])
-        cbar = plt.colorbar(sm, ax=ax, orientation="vertical", pad=0.02, aspect=25)
+        # Color each segment by the difference at its checkpoint (scaled to data_diff length),
+        # segments without a checkpoint get the neutral color of the middle of the range
+        segment_count = len(track.get_paths())
+        cp_index = np.arange(segment_count) * len(data_diff) // (segment_count + 1)
+        values = np.where(
+            np.isin(cp_index, data_diff.index),
+            data_diff.to_numpy(dtype=np.float64)[cp_index],
+            0.0,
+        )
+        track.set_array(values)
+        track.set_norm(norm)
+        cbar.update_normal(track)
 
         max_driver_name_length = max(len(driver1), len(driver2))
         cbar.ax.set_ylabel(
@@ -324,243 +429,189 @@ def plot_driver_comparison(
             fontproperties=impact_font,
             labelpad=20,
         )
-
         cbar.ax.tick_params(labelsize=12, colors="white")
 
-        # Add track name and author text at the bottom with more distance
-        text_x, text_y = (
-            ax.get_xlim()[0],
-            ax.get_ylim()[0] - 40,
-        )  # Adjust to place text further at the bottom of the plot
-        ax.text(
-            text_x + 1,
-            text_y - 1,
-            name_of_track.upper(),
-            color="black",
-            fontsize=24,
-            ha="left",
-            fontproperties=impact_font,
-        )
-        ax.text(
-            text_x,
-            text_y,
-            name_of_track.upper(),
-            color="white",
-            fontsize=24,
-            ha="left",
-            fontproperties=impact_font,
-        )
-        ax.text(
-            text_x + 1,
-            text_y - 60,
-            f"by {author}".upper(),
-            color="black",
-            fontsize=17,
-            ha="left",
-            fontproperties=impact_font,
-        )
-        ax.text(
-            text_x,
-            text_y - 59,
-            f"by {author}".upper(),
-            color="#8B0000",
-            fontsize=17,
-            ha="left",
-            fontproperties=impact_font,
-        )
+        fig.savefig(
+            output_path, dpi=300, bbox_inches="tight", pad_inches=0.5
+        )  # Added padding to prevent text cropping
 
     # Plot for speed comparison
-    fig, ax = plt.subplots(figsize=(10, 10), facecolor="dimgray")
-    ax.set_facecolor("dimgray")
-    plot_colored_track(
-        ax,
-        x_smooth,
-        z_smooth,
-        speed_diff,
-        norm_speed,
-        "Median Speed Comparison",
-        "km/h",
-    )
-    plt.savefig(
-        speed_output_path, dpi=300, bbox_inches="tight", pad_inches=0.5
-    )  # Added padding to prevent text cropping
+    plot_colored_track(speed_diff, norm_speed, "Median Speed Comparison", speed_output_path)
 
     # Plot for time comparison
-    fig, ax = plt.subplots(figsize=(10, 10), facecolor="dimgray")
-    ax.set_facecolor("dimgray")
-    plot_colored_track(
-        ax,
-        x_smooth,
-        z_smooth,
-        time_diff,
-        norm_time,
-        "Minimum Time Comparison",
-        "seconds",
-    )
-    plt.savefig(
-        time_output_path, dpi=300, bbox_inches="tight", pad_inches=0.5
-    )  # Added padding to prevent text cropping
+    plot_colored_track(time_diff, norm_time, "Minimum Time Comparison", time_output_path)
 
 
-def animate_race(df, df_track, output_path, name_of_track, author):
-    # Load the local Impact font
-    font_path = Path("track_coords/04B_09__.ttf")
-    impact_font = fm.FontProperties(fname=font_path)
+def get_track_spline(track_points, samples=10000):
+    # closed spline through all checkpoints and a lookup table from arc length to (x, z)
+    # returns tck, the lookup table and the arc length of every checkpoint (index cp - 1)
+    x_closed = np.append(track_points["x"], track_points["x"].iloc[0])
+    z_closed = np.append(track_points["z"], track_points["z"].iloc[0])
 
-    # Extract track coordinates for each checkpoint
-    track_points = df_track[["cp", "x", "y", "z"]].set_index("cp")
+    tck, u = splprep([x_closed, z_closed], s=0)
 
-    # Filter to only include the first lap
-    df_first_lap = df[df["lap"] == 1]
+    # u of the checkpoints is their position along the curve, the arc length at u is
+    # summed up over many small straight pieces
+    lookup_u = np.linspace(0, 1, samples)
+    lookup_x, lookup_z = splev(lookup_u, tck)
+    lookup_distance = np.concatenate(
+        ([0.0], np.cumsum(np.hypot(np.diff(lookup_x), np.diff(lookup_z))))
+    )
 
-    # Assign a unique color to each driver
-    driver_names = df_first_lap["name"].unique()[:2]
-    print(driver_names)
-    num_drivers = len(driver_names)
-    colors = plt.cm.get_cmap(
-        "tab20", num_drivers
-    )  # Use tab20 colormap for up to 20 distinct colors
+    lookup = {
+        "distance": lookup_distance,
+        "x": np.asarray(lookup_x),
+        "z": np.asarray(lookup_z),
+        "track_length": lookup_distance[-1],
+    }
+    cp_distances = np.interp(u[:-1], lookup_u, lookup_distance)
 
-    # Prepare the figure
-    fig, ax = plt.subplots(figsize=(10, 10), facecolor="dimgray")
-    ax.set_facecolor("dimgray")
-    ax.axis("equal")
-    ax.axis("off")
+    return tck, lookup, cp_distances
 
-    # Set the title and track name
-    ax.text(
-        0.5,
-        1.05,
-        f"{name_of_track.upper()} - Race Animation",
-        fontsize=24,
-        color="white",
-        fontproperties=impact_font,
-        ha="center",
-        va="top",
-        transform=ax.transAxes,
+
+def get_race_distances(driver_data, cp_distances, track_length):
+    # time since the start and distance along the track (over all laps) at the start and every checkpoint
+    # driver_data: lap, cp and time since the previous checkpoint of one driver, ordered by lap and cp
+    times = np.concatenate(([0.0], np.cumsum(driver_data["time"].to_numpy(dtype=np.float64))))
+
+    # the race starts on the start-finish-line, which is the last checkpoint of a lap
+    lap = driver_data["lap"].to_numpy()
+    cp_idx = np.minimum(driver_data["cp"].to_numpy(), len(cp_distances)) - 1
+    distances = np.concatenate(
+        (
+            [cp_distances[-1] - track_length],
+            (lap - 1) * track_length + cp_distances[cp_idx],
+        )
     )
-    ax.text(
-        0.5,
-        1.02,
-        f"by {author}",
-        fontsize=16,
-        color="#8B0000",
-        fontproperties=impact_font,
-        ha="center",
-        va="top",
-        transform=ax.transAxes,
+
+    return times, distances
+
+
+def get_frame_positions(times, distances, lookup, frame_times):
+    # distance and (x, z) of one driver at every frame time, at constant speed between two checkpoints
+    # along the spline, the driver stays on his last checkpoint when he is done
+    frame_distances = np.interp(frame_times, times, distances)
+    track_distances = np.mod(frame_distances, lookup["track_length"])
+
+    positions = np.column_stack(
+        (
+            np.interp(track_distances, lookup["distance"], lookup["x"]),
+            np.interp(track_distances, lookup["distance"], lookup["z"]),
+        )
     )
 
-    # Smooth the track using splprep and splev
-    x_middle_adjusted = track_points["x"]
-    z_middle_adjusted = track_points["z"]
-    x_closed = np.append(x_middle_adjusted, x_middle_adjusted.iloc[0])
-    z_closed = np.append(z_middle_adjusted, z_middle_adjusted.iloc[0])
+    return frame_distances, positions
 
-    # Interpolate the track for smoothness
-    tck, u = splprep([x_closed, z_closed], s=0)
+
+def animate_race(
+    df,
+    df_track,
+    output_path,
+    name_of_track,
+    author,
+    trace_path=None,
+    workers=None,
+    max_buffer_mb=MAX_BUFFER_MB,
+):
+    # every driver over all laps, moving along the smoothed track
+    # with workers the frames are rendered in parallel processes and piped to ffmpeg (see frame_render.py),
+    # otherwise by FuncAnimation in this process; max_buffer_mb limits the rendered frames waiting for ffmpeg
+    font_path = Path("track_coords/04B_09__.ttf")
+
+    # Extract track coordinates for each checkpoint
+    track_points = df_track[["cp", "x", "y", "z"]].set_index("cp")
+
+    # Drivers of the animation (every driver gets a color of tab20 in draw_race_figure)
+    drivers = df[["player_index", "name"]].drop_duplicates("player_index")
+    driver_names = drivers["name"].to_numpy()
+    print(driver_names)
+
+    # Smooth the track using splprep and splev
+    tck, lookup, cp_distances = get_track_spline(track_points)
     unew = np.linspace(0, 1, 1000)  # Increase the number of points for a smooth curve
     x_smooth, z_smooth = splev(unew, tck)
 
-    # Draw the track
-    ax.plot(x_smooth, z_smooth, color="white", linewidth=2)
+    figure_args = (font_path, name_of_track, author, x_smooth, z_smooth, driver_names)
 
-    # Prepare driver point placeholders and a dictionary to store their positions
-    driver_points = {
-        driver: ax.plot([], [], "o", color=colors(i), markersize=12)[0]
-        for i, driver in enumerate(driver_names)
-    }
-
-    # Berechne die kumulative Zeit für jeden Fahrer basierend auf der Zeit zwischen den Checkpoints
-    cumulative_times = {}
-    for driver in driver_names:
-        driver_data = df_first_lap[df_first_lap["name"] == driver]
-        cumulative_time = 0
-        cumulative_times[driver] = [0]
-        for time in driver_data["time"]:
-            cumulative_time += time
-            cumulative_times[driver].append(cumulative_time)
+    # Zeit seit dem Start und gefahrene Strecke entlang der Spline an jedem Checkpoint, einmal pro Fahrer
+    race_distances = {}
+    for player_index in drivers["player_index"]:
+        driver_data = df[df["player_index"] == player_index].sort_values(["lap", "cp"])
+        race_distances[player_index] = get_race_distances(
+            driver_data, cp_distances, lookup["track_length"]
+        )
 
     # Zeit-Skalierung: 10x schneller als die tatsächliche Zeit
     speed_factor = 10.0
 
-    # Set the animation time range to match the longest cumulative time divided by the speed factor
-    total_time = max(max(times) for times in cumulative_times.values())
+    # Set the animation time range to match the longest race time divided by the speed factor
+    total_time = max(times[-1] for times, _ in race_distances.values())
     frames = int(total_time / speed_factor * 30)  # 30 frames per second
 
-    print(cumulative_times)
-
-    def update(frame):
-        # Berechne die aktuelle Zeit im Rennen (skaliert durch den Geschwindigkeitsfaktor)
-        current_time = frame * speed_factor / 30
-
-        for driver in driver_names:
-            driver_data = df_first_lap[df_first_lap["name"] == driver].reset_index()
-            times = cumulative_times[driver]
-
-            # Finde den aktuellen Abschnitt basierend auf der kumulativen Zeit
-            current_cp_idx = np.searchsorted(times, current_time, side="right") - 1
+    # Positionen aller Frames vorab berechnen: aktuelle Zeit im Rennen je Frame (skaliert durch den Geschwindigkeitsfaktor)
+    frame_times = np.arange(frames) * speed_factor / 30
+    driver_frames = {
+        player_index: get_frame_positions(times, distances, lookup, frame_times)
+        for player_index, (times, distances) in race_distances.items()
+    }
 
-            # Grenzwertprüfung, um sicherzustellen, dass der Index innerhalb der Grenzen liegt
-            if current_cp_idx < 0:
-                continue
+    # Interpolation der Frames nur bei aktiviertem Tracing, gesammelt und am Stück geschrieben
+    tracer = Tracer(trace_path)
+    if tracer.enabled:
+        for player_index, name in zip(drivers["player_index"], driver_names):
+            times, distances = race_distances[player_index]
+            frame_distances, positions = driver_frames[player_index]
+
+            # Nach dem Ziel wird nicht mehr interpoliert, eine Runde beginnt an der Start-Ziel-Linie
+            racing = frame_times < times[-1]
+
+            tracer.add(
+                frame=np.flatnonzero(racing),
+                driver=name,
+                current_time=frame_times[racing],
+                lap=((frame_distances[racing] - distances[0]) // lookup["track_length"]).astype(int) + 1,
+                distance=frame_distances[racing],
+                x=positions[racing, 0],
+                z=positions[racing, 1],
+            )
+        tracer.close()
 
-            # Wenn `current_cp_idx` der letzte Checkpoint ist, setze den Fahrer einfach auf den letzten Punkt
-            if current_cp_idx >= len(driver_data) - 1:
-                last_cp = driver_data.iloc[-1]["cp"]
-                pos = track_points.loc[last_cp][["x", "z"]]
-                driver_points[driver].set_data([pos["x"]], [pos["z"]])
-                continue
+    # Check if output directory is writable
+    output_dir = os.path.dirname(output_path)
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
 
-            # Berechne, wie weit entlang des aktuellen Abschnitts der Fahrer ist (0-1)
-            segment_start_time = times[current_cp_idx]
-            segment_end_time = times[current_cp_idx + 1]
-            fraction = (current_time - segment_start_time) / (
-                segment_end_time - segment_start_time
+    if workers:
+        # (frames, drivers, 2) for the render workers
+        positions = np.stack(
+            [positions for _, positions in driver_frames.values()], axis=1
+        )
+        try:
+            render_animation(
+                figure_args,
+                positions,
+                output_path,
+                dpi=300,
+                workers=workers,
+                max_buffer_mb=max_buffer_mb,
             )
+            print(f"Animation successfully saved to {output_path}")
+        except FileNotFoundError:
+            print(
+                "FFmpeg not found. Please make sure FFmpeg is installed and available in your PATH."
+            )
+        except RuntimeError as e:
+            print(f"An error occurred while saving the animation: {e}")
+        return
 
-            # Interpoliere die Position des Fahrers basierend auf dem aktuellen Abschnitt
-            cp1 = driver_data.iloc[current_cp_idx]["cp"]
-            cp2 = driver_data.iloc[current_cp_idx + 1]["cp"]
-            pos1 = track_points.loc[cp1][["x", "z"]]
-            pos2 = track_points.loc[cp2][["x", "z"]]
-
-            # Lineare Interpolation für die Fahrerposition
-            x = pos1["x"] + fraction * (pos2["x"] - pos1["x"])
-            z = pos1["z"] + fraction * (pos2["z"] - pos1["z"])
+    fig, ax, points = draw_race_figure(*figure_args)
+    driver_points = dict(zip(drivers["player_index"], points))
 
+    def update(frame):
+        for player_index, (_, positions) in driver_frames.items():
             # Aktualisiere die Position des Fahrers
-            driver_points[driver].set_data([x], [z])
-            with open("logfile.txt", "a") as log_file:
-                log_file.write(
-                    "current_time: "
-                    + str(current_time)
-                    + " | current_cp_idx: "
-                    + str(current_cp_idx)
-                    + " | segment_start_time: "
-                    + str(segment_start_time)
-                    + " | segment_end_time: "
-                    + str(segment_end_time)
-                    + " | fraction: "
-                    + str(fraction)
-                    + " | cp1: "
-                    + str(cp1)
-                    + " | cp2: "
-                    + str(cp2)
-                    + " | pos1: (x: "
-                    + str(pos1["x"])
-                    + ", z: "
-                    + str(pos1["z"])
-                    + ") | pos2: (x: "
-                    + str(pos2["x"])
-                    + ", z: "
-                    + str(pos2["z"])
-                    + ") | x: "
-                    + str(x)
-                    + " | z: "
-                    + str(z)
-                    + "\n"
-                )
+            x, z = positions[frame]
+            driver_points[player_index].set_data([x], [z])
 
         return list(driver_points.values())
 
@@ -568,24 +619,6 @@ def animate_race(df, df_track, output_path, name_of_track, author):
     try:
         anim = FuncAnimation(fig, update, frames=frames, blit=True, interval=1000 / 30)
 
-        # Check if output directory is writable
-        output_dir = os.path.dirname(output_path)
-        if not os.path.exists(output_dir):
-            os.makedirs(output_dir)
-
-        # Add legend to the plot
-        legend_handles = [
-            plt.Line2D([0], [0], color=colors(i), lw=4, label=driver)
-            for i, driver in enumerate(driver_names)
-        ]
-        ax.legend(
-            handles=legend_handles,
-            loc="upper right",
-            bbox_to_anchor=(1.15, 1),
-            title="Drivers",
-            prop=impact_font,
-        )
-
         # Save the animation
         anim.save(output_path, writer="ffmpeg", dpi=300)
         print(f"Animation successfully saved to {output_path}")
@@ -0,0 +1,172 @@
+import os
+import sys
+import itertools
+import threading
+from bisect import bisect_left, insort
+from collections import defaultdict
+from sqlalchemy import select, func
+from sqlalchemy.orm import Session
+
+sys.path.append(".")
+from src.tsu_analyzer.db.models import Car, Driver, Event, EventBestLap, Track
+
+# In-process personal best leaderboards for the watcher: every saved file updates the leaderboard of its track
+# and the /broadcast script for the game server is written right away, without querying the database again.
+
+BROADCAST_FILE = "/home/steam/tsu_server/config/Scripts/event_end_generated.src"
+TOP_N = 10
+
+
+def format_seconds_to_time(seconds):
+    minutes = int(seconds // 60)
+    remaining_seconds = seconds % 60
+    return f"{minutes}:{remaining_seconds:06.3f}"
+
+
+def get_top_lines(top):
+    # (driver name, lap time, car name) ordered by position, same lines as broadcast_hotlapping_times.py
+    lines = []
+
+    for i, (name, lap_time, car_name) in enumerate(top, start=1):
+        if i == 1:
+            lines.append(f"/broadcast ### Current Top {TOP_N} ###")
+
+        driver = name + ":"
+        lines.append(
+            f"/broadcast {i}. {driver.ljust(20)} {format_seconds_to_time(lap_time)} ({car_name})"
+        )
+
+    return lines
+
+
+def write_broadcast_file(lines, path=BROADCAST_FILE):
+    # the server may read the script at any time, so it is replaced in one step
+    tmp_path = f"{path}.tmp"
+
+    with open(tmp_path, "w") as f:
+        for line in lines:
+            f.write(line + "\n")
+
+    os.replace(tmp_path, path)
+
+
+class Leaderboard:
+    # personal bests of one event, sorted by lap time, equal times are ordered by who set them first
+    def __init__(self):
+        self.entries = []
+        self.best_laps = {}
+
+    def get_position(self, steam_id):
+        lap_time, order, _, _ = self.best_laps[steam_id]
+        return bisect_left(self.entries, (lap_time, order, steam_id)) + 1
+
+    def add(self, steam_id, name, car_name, lap_time, order):
+        # returns the old position (None for a first lap) and the new one, or None if it is no personal best
+        best_lap = self.best_laps.get(steam_id)
+
+        if best_lap is not None and (best_lap[0], best_lap[1]) <= (lap_time, order):
+            return None
+
+        old_position = None
+        if best_lap is not None:
+            old_position = self.get_position(steam_id)
+            del self.entries[old_position - 1]
+
+        insort(self.entries, (lap_time, order, steam_id))
+        self.best_laps[steam_id] = (lap_time, order, name, car_name)
+
+        return old_position, self.get_position(steam_id)
+
+    def get_top(self, n=TOP_N):
+        top = []
+
+        for _, _, steam_id in self.entries[:n]:
+            lap_time, _, name, car_name = self.best_laps[steam_id]
+            top.append((name, lap_time, car_name))
+
+        return top
+
+
+class Leaderboards:
+    # one leaderboard per track (the saver adds all files of a track to its latest event)
+    def __init__(self):
+        self.leaderboards = defaultdict(Leaderboard)
+        self.order = itertools.count()
+        self.lock = threading.Lock()
+
+    def warm(self, engine):
+        # personal bests of the latest event of every track, laps saved later are added by add_rows
+        with Session(engine) as session:
+            latest_events = (
+                select(Event.id, Event.track_id)
+                .distinct(Event.track_id)
+                .order_by(Event.track_id, Event.created_at.desc())
+                .subquery()
+            )
+
+            rows = session.execute(
+                select(
+                    Track.guid,
+                    Driver.steam_id,
+                    Driver.name,
+                    Car.name,
+                    EventBestLap.lap_time,
+                    EventBestLap.lap_result_id,
+                )
+                .join(latest_events, EventBestLap.event_id == latest_events.c.id)
+                .join(Track, Track.id == latest_events.c.track_id)
+                .join(Driver, Driver.id == EventBestLap.driver_id)
+                .join(Car, Car.id == EventBestLap.car_id)
+            ).all()
+
+            max_lap_result_id = session.scalar(select(func.max(EventBestLap.lap_result_id)))
+
+        with self.lock:
+            for track_guid, steam_id, name, car_name, lap_time, lap_result_id in rows:
+                self.leaderboards[track_guid].add(steam_id, name, car_name, lap_time, lap_result_id)
+
+            # laps added later count as set after all saved ones
+            self.order = itertools.count((max_lap_result_id or 0) + 1)
+
+        print(f"Loaded {len(rows)} personal bests of {len(self.leaderboards)} tracks")
+
+    def add_rows(self, rows):
+        # rows of Saver.get_rows, returns the /broadcast lines with the new personal bests and the top 10
+        best_laps = {}
+
+        for player in rows["players"]:
+            for lap_result in player["lap_results"] or []:
+                steam_id = player["driver"]["id"]
+
+                if steam_id not in best_laps or lap_result["lap_time"] < best_laps[steam_id][2]:
+                    best_laps[steam_id] = (
+                        player["driver"]["name"],
+                        player["car"]["name"],
+                        lap_result["lap_time"],
+                    )
+
+        lines = []
+
+        with self.lock:
+            leaderboard = self.leaderboards[rows["track"]["guid"]]
+
+            # fastest first, so the positions in the lines are the ones after this file
+            for steam_id, (name, car_name, lap_time) in sorted(
+                best_laps.items(), key=lambda item: item[1][2]
+            ):
+                positions = leaderboard.add(steam_id, name, car_name, lap_time, next(self.order))
+
+                if positions is None:
+                    continue
+
+                old_position, new_position = positions
+                line = f"/broadcast New PB: {name} {format_seconds_to_time(lap_time)} ({car_name}), P{new_position}"
+
+                if old_position is not None and old_position != new_position:
+                    line += f" (up from P{old_position})"
+
+                lines.append(line)
+
+            lines.extend(get_top_lines(leaderboard.get_top()))
+
+        return lines
@@ -0,0 +1,123 @@
+import io
+import json
+from contextlib import contextmanager
+
+# ijson is optional (pdm install -G stream), without it files are loaded with json.load
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+
+# raceStats.playerStats holds every checkpoint time of every player, the rest of an eventstats file is small
+PLAYER_STATS_PREFIX = "raceStats.playerStats"
+PLAYER_STATS_ITEM_PREFIX = f"{PLAYER_STATS_PREFIX}.item"
+
+# keys that have to be known before the first player stats can be processed
+# (utcStartTimeTicks identifies the file in the ledger, which the Saver claims before writing the players)
+REQUIRED_EVENT_KEYS = ("utcStartTimeTicks", "utcStartTime", "level", "players")
+
+
+@contextmanager
+def _open(source):
+    # bytes (file content), a path or an already opened binary file
+    if isinstance(source, (bytes, bytearray)):
+        yield io.BytesIO(source)
+    elif hasattr(source, "read"):
+        yield source
+    else:
+        with open(source, "rb") as file:
+            yield file
+
+
+def _iter_loaded_event(data, player_stats=True):
+    # same output as the streaming parser, the player stats list of the event stays empty
+    all_player_stats = data.get("raceStats", {}).get("playerStats")
+    if all_player_stats is not None:
+        data["raceStats"]["playerStats"] = []
+
+    yield "event", data
+
+    if player_stats:
+        for i, player_stat in enumerate(all_player_stats or []):
+            yield "player_stats", (i, player_stat)
+
+
+def _is_event_complete(event):
+    return all(key in event for key in REQUIRED_EVENT_KEYS) and (
+        "checkpoints" in event.get("raceStats", {})
+    )
+
+
+def iter_event(source, player_stats=True):
+    # Single pass over an eventstats file, yields
+    # - ("event", event) once, the document without the items of raceStats.playerStats
+    # - ("player_stats", (player_index, player_stat)) for every item of raceStats.playerStats
+    # so only the checkpoint times of one player are in memory at a time.
+    # The event dict is completed while iterating (keys after playerStats), it is final once the generator is exhausted.
+    with _open(source) as file:
+        if ijson is None:
+            yield from _iter_loaded_event(
+                json.loads(file.read().decode("utf-8")), player_stats
+            )
+            return
+
+        event_builder = ijson.ObjectBuilder()
+        player_stat_builder = None
+        player_index = 0
+        event_yielded = False
+
+        for prefix, event, value in ijson.parse(file, use_float=True):
+            if prefix.startswith(PLAYER_STATS_ITEM_PREFIX):
+                if not player_stats:
+                    continue
+
+                if prefix == PLAYER_STATS_ITEM_PREFIX and event == "start_map":
+                    player_stat_builder = ijson.ObjectBuilder()
+
+                player_stat_builder.event(event, value)
+
+                if prefix == PLAYER_STATS_ITEM_PREFIX and event == "end_map":
+                    yield "player_stats", (player_index, player_stat_builder.value)
+                    player_stat_builder = None
+                    player_index += 1
+
+                continue
+
+            # the player stats list itself stays empty in the event
+            event_builder.event(event, value)
+
+            if prefix == PLAYER_STATS_PREFIX and event == "start_array":
+                if not _is_event_complete(event_builder.value):
+                    # unusual key order, players and checkpoints come after the player stats
+                    file.seek(0)
+                    yield from _iter_loaded_event(
+                        json.loads(file.read().decode("utf-8")), player_stats
+                    )
+                    return
+
+                yield "event", event_builder.value
+                event_yielded = True
+
+        if not event_yielded:
+            yield "event", event_builder.value
+
+
+def load_event(source):
+    # eventstats file without the checkpoint times (raceStats.playerStats stays empty), enough for elo updates
+    for kind, value in iter_event(source, player_stats=False):
+        if kind == "event":
+            event = value
+
+    return event
+
+
+def iter_dbjson(source, key):
+    # Items of "players" or "events" of a Whiplash java tool export, one at a time (teams are never parsed).
+    # Every call is a separate pass over the file, so a path has to be given for more than one pass.
+    with _open(source) as file:
+        if ijson is None:
+            yield from json.loads(file.read().decode("utf-8")).get(key, [])
+            return
+
+        yield from ijson.items(file, f"{key}.item", use_float=True)
@@ -0,0 +1,73 @@
+import os
+import pandas as pd
+
+# pyarrow is optional (pdm install -G cache), without it traces can only be written as csv
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+# Opt-in tracing of the animation's interpolation, replaces the debug line appended to logfile.txt
+# for every driver on every frame. Off unless a path is passed or TSU_TRACE_FILE is set,
+# records are buffered as columns and written in bulk (parquet, or csv for a .csv path).
+
+
+class Tracer:
+    def __init__(self, path=None, flush_rows=100000):
+        self.path = path or os.environ.get("TSU_TRACE_FILE") or None
+        self.flush_rows = flush_rows
+        self.buffer = []
+        self.buffered_rows = 0
+        self.writer = None
+        self.written_rows = 0
+
+        if self.enabled and not self.path.endswith(".csv") and pa is None:
+            raise RuntimeError(
+                "pyarrow is not installed (pdm install -G cache), use a .csv path for the trace file"
+            )
+
+    @property
+    def enabled(self):
+        return self.path is not None
+
+    def add(self, **columns):
+        # one call per batch of records, e.g. all frames of one driver: column name -> array or scalar
+        if not self.enabled:
+            return
+
+        part = pd.DataFrame(columns)
+        self.buffer.append(part)
+        self.buffered_rows += len(part)
+
+        if self.buffered_rows >= self.flush_rows:
+            self.flush()
+
+    def flush(self):
+        if not self.enabled or not self.buffer:
+            return
+
+        df = pd.concat(self.buffer, ignore_index=True)
+        self.buffer = []
+        self.buffered_rows = 0
+
+        if self.path.endswith(".csv"):
+            first = self.written_rows == 0
+            df.to_csv(self.path, mode="w" if first else "a", header=first, index=False)
+        else:
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            if self.writer is None:
+                self.writer = pq.ParquetWriter(self.path, table.schema)
+            self.writer.write_table(table)
+
+        self.written_rows += len(df)
+
+    def close(self):
+        self.flush()
+
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+        if self.enabled:
+            print(f"Wrote {self.written_rows} trace records to {self.path}")
@@ -0,0 +1,321 @@
+import os
+import sys
+import time
+import queue
+import select
+import signal
+import struct
+import argparse
+import threading
+import ctypes
+import ctypes.util
+from sqlalchemy import text
+
+sys.path.append(".")
+from src.tsu_analyzer.db.Saver import Saver
+from src.tsu_analyzer.db.engine import get_engine
+from src.tsu_analyzer.db.identity_cache import identity_cache
+from src.tsu_analyzer.leaderboard import BROADCAST_FILE, Leaderboards, write_broadcast_file
+from src.tsu_analyzer.elo_heat.check_for_stats_files_and_update import (
+    update_elo_heat,
+    move_to_processed,
+)
+
+# Long running replacement for the cron job running elo_heat/check_for_stats_files_and_update.py:
+# new event files in ~/stat_files (moved there by move_stat_files.sh) are picked up right away,
+# saved to the database, used for the elo heat update and moved to processed/.
+
+EVENT_FILE_SUFFIX = "_event.json"
+
+# inotify constants from <sys/inotify.h>
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_Q_OVERFLOW = 0x00004000
+IN_CLOEXEC = 0o2000000
+
+INOTIFY_EVENT = struct.Struct("iIII")
+
+
+class InotifyWatcher:
+    # file names closed after writing or moved into the directory, using inotify through libc
+    def __init__(self, path):
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        libc.inotify_init1.argtypes = [ctypes.c_int]
+        libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+
+        self.fd = libc.inotify_init1(IN_CLOEXEC)
+        if self.fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+
+        if libc.inotify_add_watch(self.fd, os.fsencode(path), IN_CLOSE_WRITE | IN_MOVED_TO) < 0:
+            errno = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(errno, os.strerror(errno), path)
+
+        self.path = path
+
+    def get_new_file_names(self, timeout):
+        # returns None if events were lost and the directory has to be scanned again
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return []
+
+        data = os.read(self.fd, 64 * 1024)
+        file_names = []
+        offset = 0
+
+        while offset < len(data):
+            _, mask, _, length = INOTIFY_EVENT.unpack_from(data, offset)
+            offset += INOTIFY_EVENT.size
+
+            if mask & IN_Q_OVERFLOW:
+                return None
+
+            file_names.append(os.fsdecode(data[offset : offset + length].rstrip(b"\0")))
+            offset += length
+
+        return file_names
+
+    def close(self):
+        os.close(self.fd)
+
+
+class PollingWatcher:
+    # fallback where inotify is not available, lists the directory every poll interval
+    # and reports files once their size did not change between two listings (copying is done)
+    def __init__(self, path, poll_interval):
+        self.path = path
+        self.poll_interval = poll_interval
+        self.reported_file_names = set(os.listdir(path))
+        self.sizes = {}
+
+    def get_sizes(self):
+        sizes = {}
+
+        for entry in os.scandir(self.path):
+            try:
+                sizes[entry.name] = entry.stat().st_size
+            except FileNotFoundError:
+                pass
+
+        return sizes
+
+    def get_new_file_names(self, timeout):
+        time.sleep(min(timeout, self.poll_interval))
+
+        previous_sizes, self.sizes = self.sizes, self.get_sizes()
+
+        new_file_names = sorted(
+            file_name
+            for file_name, size in self.sizes.items()
+            if file_name not in self.reported_file_names
+            and previous_sizes.get(file_name) == size
+        )
+
+        self.reported_file_names = (self.reported_file_names & set(self.sizes)) | set(new_file_names)
+
+        return new_file_names
+
+    def close(self):
+        pass
+
+
+def get_watcher(path, polling=False, poll_interval=1.0):
+    if not polling:
+        try:
+            return InotifyWatcher(path)
+        except (OSError, AttributeError, TypeError) as e:
+            print(f"inotify is not available ({e}), polling {path} every {poll_interval}s")
+
+    return PollingWatcher(path, poll_interval)
+
+
+def process_file(engine, file_path, processed_dir, elo_lock, leaderboards=None, broadcast_file=None):
+    start = time.time()
+
+    try:
+        rows = Saver(file_path).run_bulk(engine=engine)
+    except Exception as e:
+        rows = None
+        print(f"Error saving {file_path}:", e)
+
+    # new personal bests are announced as soon as they are saved
+    if leaderboards is not None and rows is not None:
+        try:
+            write_broadcast_file(leaderboards.add_rows(rows), broadcast_file)
+        except Exception as e:
+            print(f"Error writing {broadcast_file}:", e)
+
+    try:
+        # elo heat depends on the previous ratings, so only one update runs at a time
+        with elo_lock:
+            update_elo_heat(engine, file_path)
+    except Exception as e:
+        print(f"Error updating elo heat with {file_path}:", e)
+
+    # like the cron job, the file is moved even if something failed (the ledger prevents double updates)
+    try:
+        move_to_processed(file_path, processed_dir)
+    except Exception as e:
+        print(f"Error moving {file_path}:", e)
+
+    print(f"Processed {file_path} in {time.time() - start:.2f}s")
+
+
+def run_worker(
+    engine, work_queue, processed_dir, elo_lock, queued_file_paths, leaderboards, broadcast_file
+):
+    while True:
+        file_path = work_queue.get()
+
+        try:
+            if file_path is None:
+                return
+
+            process_file(engine, file_path, processed_dir, elo_lock, leaderboards, broadcast_file)
+        finally:
+            queued_file_paths.discard(file_path)
+            work_queue.task_done()
+
+
+def watch(
+    base_dir,
+    workers=2,
+    queue_size=100,
+    polling=False,
+    poll_interval=1.0,
+    broadcast_file=None,
+):
+    base_dir = os.path.expanduser(base_dir)
+    processed_dir = os.path.join(base_dir, "processed")
+    os.makedirs(processed_dir, exist_ok=True)
+
+    # one engine for the whole lifetime, with a connection per worker kept open
+    engine = get_engine(pool_size=workers)
+
+    with engine.connect() as connection:
+        connection.execute(text("SELECT 1"))
+    identity_cache.warm(engine)
+
+    # the leaderboards start from the saved personal bests and are only updated in memory afterwards
+    leaderboards = None
+    if broadcast_file:
+        leaderboards = Leaderboards()
+        leaderboards.warm(engine)
+
+    work_queue = queue.Queue(maxsize=queue_size)
+    elo_lock = threading.Lock()
+    queued_file_paths = set()
+
+    threads = [
+        threading.Thread(
+            target=run_worker,
+            args=(
+                engine,
+                work_queue,
+                processed_dir,
+                elo_lock,
+                queued_file_paths,
+                leaderboards,
+                broadcast_file,
+            ),
+            daemon=True,
+        )
+        for _ in range(workers)
+    ]
+    for thread in threads:
+        thread.start()
+
+    stop = threading.Event()
+
+    def enqueue(file_names):
+        for file_name in file_names:
+            file_path = os.path.join(base_dir, file_name)
+
+            if not file_name.endswith(EVENT_FILE_SUFFIX) or file_path in queued_file_paths:
+                continue
+            if not os.path.isfile(file_path):
+                continue
+
+            queued_file_paths.add(file_path)
+
+            # waits while the workers are busy, new files wait in the inotify queue meanwhile;
+            # on a stop the remaining files stay in the directory for the next start
+            while True:
+                if stop.is_set():
+                    queued_file_paths.discard(file_path)
+                    return
+                try:
+                    work_queue.put(file_path, timeout=1.0)
+                    break
+                except queue.Full:
+                    pass
+
+    def request_stop(signum, frame):
+        print("Stopping after the files that are already queued")
+        stop.set()
+
+    signal.signal(signal.SIGTERM, request_stop)
+    signal.signal(signal.SIGINT, request_stop)
+
+    # watch first, then pick up the files that arrived while the watcher was not running
+    watcher = get_watcher(base_dir, polling, poll_interval)
+    enqueue(sorted(os.listdir(base_dir)))
+
+    print(f"Watching {base_dir} with {workers} workers")
+
+    try:
+        while not stop.is_set():
+            file_names = watcher.get_new_file_names(timeout=1.0)
+
+            if file_names is None:
+                print("Missed some file events, scanning the directory again")
+                file_names = sorted(os.listdir(base_dir))
+
+            enqueue(file_names)
+    finally:
+        watcher.close()
+
+        for _ in threads:
+            work_queue.put(None)
+        for thread in threads:
+            thread.join()
+
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        usage="pdm run python src/tsu_analyzer/watcher.py [<directory>] [--workers N] [--queue-size N] [--polling] [--broadcast-file [<path>]]"
+    )
+    parser.add_argument(
+        "directory", nargs="?", default="~/stat_files", help="directory the event files are moved to"
+    )
+    parser.add_argument("--workers", type=int, default=2, help="files processed in parallel")
+    parser.add_argument(
+        "--queue-size", type=int, default=100, help="files waiting for a worker at most"
+    )
+    parser.add_argument(
+        "--polling", action="store_true", help="list the directory instead of using inotify"
+    )
+    parser.add_argument(
+        "--poll-interval", type=float, default=1.0, help="seconds between directory listings"
+    )
+    parser.add_argument(
+        "--broadcast-file",
+        nargs="?",
+        const=BROADCAST_FILE,
+        default=None,
+        help=f"write new personal bests and the top 10 to this /broadcast script after every file (default {BROADCAST_FILE})",
+    )
+    args = parser.parse_args()
+
+    watch(
+        args.directory,
+        args.workers,
+        args.queue_size,
+        args.polling,
+        args.poll_interval,
+        args.broadcast_file,
+    )
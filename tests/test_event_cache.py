@@ -0,0 +1,84 @@
+import sys
+import copy
+import glob
+import json
+import pandas as pd
+import pytest
+
+sys.path.append(".")
+from src.tsu_analyzer import event_cache, helpers
+from src.tsu_analyzer.event_cache import get_event_tables, get_players_table, load_event_tables
+
+EVENT_FILES = [
+    path
+    for path in sorted(glob.glob("examples/*.json"))
+    if not path.endswith("_session.json")
+]
+
+# the example with the most players
+MULTIPLAYER_FILE = "examples/20240406_212628_MacauGPv1.0.json"
+
+
+def load(path):
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def test_players_table_fewer_player_stats():
+    result_dict = load(MULTIPLAYER_FILE)
+    player_stats = result_dict["raceStats"]["playerStats"]
+    del player_stats[2:]
+
+    players = get_players_table(result_dict)
+
+    assert len(players) == len(result_dict["players"])
+    assert players["start_time"].dtype == "Int64"
+    assert players["start_time"].iloc[:2].tolist() == [
+        player_stat["startTime"] for player_stat in player_stats
+    ]
+    assert players["start_time"].iloc[2:].isna().all()
+
+
+def test_players_table_empty_player_stats():
+    # what the stream parser leaves in the event dict
+    result_dict = load(MULTIPLAYER_FILE)
+    result_dict["raceStats"]["playerStats"] = []
+
+    players = get_players_table(result_dict)
+
+    assert len(players) == len(result_dict["players"])
+    assert players["start_time"].isna().all()
+
+
+def test_results_df_with_missing_player_stats():
+    # the players without stats have no checkpoint times, the others give the same results as before
+    result_dict = load(MULTIPLAYER_FILE)
+    truncated = copy.deepcopy(result_dict)
+    del truncated["raceStats"]["playerStats"][2:]
+
+    expected = helpers.get_results_df(result_dict)
+    expected = expected[expected["player_index"] < 2]
+
+    pd.testing.assert_frame_equal(helpers.get_results_df(get_event_tables(truncated)), expected)
+
+
+@pytest.mark.parametrize("path", EVENT_FILES)
+def test_results_df_from_tables(path):
+    result_dict = load(path)
+
+    pd.testing.assert_frame_equal(
+        helpers.get_results_df(get_event_tables(result_dict)),
+        helpers.get_results_df(result_dict),
+    )
+
+
+def test_load_event_tables_cache(tmp_path):
+    if event_cache.pyarrow is None:
+        pytest.skip("pyarrow is not installed")
+
+    tables = load_event_tables(MULTIPLAYER_FILE, cache_dir=tmp_path)
+    cached_tables = load_event_tables(MULTIPLAYER_FILE, cache_dir=tmp_path)
+
+    assert list(tmp_path.iterdir()) == [tmp_path / f"v{event_cache.CACHE_VERSION}"]
+    for table in event_cache.TABLES:
+        pd.testing.assert_frame_equal(cached_tables[table], tables[table])
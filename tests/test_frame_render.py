@@ -0,0 +1,104 @@
+import os
+import sys
+import numpy as np
+import matplotlib
+
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt
+
+sys.path.append(".")
+from src.tsu_analyzer import frame_render
+
+FONT_PATH = "track_coords/Impact.ttf"
+DPI = 20
+
+
+def get_figure_args():
+    angles = np.linspace(0, 2 * np.pi, 200)
+    x_smooth = 300 * np.cos(angles)
+    z_smooth = 200 * np.sin(angles)
+
+    return (FONT_PATH, "Test Track", "Tester", x_smooth, z_smooth, ["A", "B", "C"])
+
+
+def get_positions(frames=6, drivers=3):
+    # (frames, drivers, 2), the drivers move along the track with a small gap
+    angles = np.linspace(0, np.pi, frames)[:, None] - 0.2 * np.arange(drivers)[None, :]
+    return np.stack([300 * np.cos(angles), 200 * np.sin(angles)], axis=-1)
+
+
+def render_full_frame(figure_args, positions):
+    # the whole figure drawn for one frame, what the FuncAnimation without blitting does
+    fig, _, driver_points = frame_render.draw_race_figure(*figure_args)
+    fig.set_dpi(DPI)
+
+    for point, (x, z) in zip(driver_points, positions):
+        point.set_data([x], [z])
+
+    fig.canvas.draw()
+    frame = np.asarray(fig.canvas.buffer_rgba())[:, :, :3].copy()
+    plt.close(fig)
+
+    return frame
+
+
+def test_blitted_frames_match_full_redraw():
+    figure_args = get_figure_args()
+    positions = get_positions()
+
+    frame_render.init_worker(figure_args, positions, DPI)
+    width, height = frame_render.get_frame_size(figure_args, DPI)
+
+    try:
+        frames = np.frombuffer(
+            frame_render.render_frames(0, len(positions)), dtype=np.uint8
+        ).reshape(len(positions), height, width, 3)
+    finally:
+        plt.close(frame_render._worker["fig"])
+        frame_render._worker.clear()
+
+    # the driver points are visible at this dpi, so the frames differ
+    assert not np.array_equal(frames[0], frames[-1])
+
+    for frame, frame_positions in zip(frames, positions):
+        np.testing.assert_array_equal(frame, render_full_frame(figure_args, frame_positions))
+
+
+def test_get_ffmpeg_command_frame_size():
+    command = frame_render.get_ffmpeg_command("out.mp4", 200, 100)
+
+    assert command[command.index("-s") + 1] == "200x100"
+    assert command[command.index("-r") + 1] == str(frame_render.FPS)
+    assert command[-1] == "out.mp4"
+
+
+def test_get_frames_in_flight():
+    frame_bytes = 3000 * 3000 * 3  # dpi 300
+
+    # 2 frames per worker within the budget, never more than the budget, at least one frame
+    assert frame_render.get_frames_in_flight(4, frame_bytes) == 8
+    assert frame_render.get_frames_in_flight(16, frame_bytes) == 32
+    assert frame_render.get_frames_in_flight(64, frame_bytes) == 39
+    assert frame_render.get_frames_in_flight(16, frame_bytes, max_buffer_mb=1) == 1
+
+
+def test_render_animation_writes_frames_in_order(tmp_path, monkeypatch):
+    # a stand-in for ffmpeg that stores the raw frames it gets on stdin
+    raw_path = tmp_path / "frames.raw"
+    ffmpeg_path = tmp_path / "ffmpeg"
+    ffmpeg_path.write_text(f"#!/bin/sh\ncat > {raw_path}\n")
+    os.chmod(ffmpeg_path, 0o755)
+    monkeypatch.setitem(matplotlib.rcParams, "animation.ffmpeg_path", str(ffmpeg_path))
+
+    figure_args = get_figure_args()
+    positions = get_positions(frames=10)
+    width, height = frame_render.get_frame_size(figure_args, DPI)
+
+    # a budget of a single frame, every frame is written before the next one is rendered
+    frame_render.render_animation(
+        figure_args, positions, str(tmp_path / "out.mp4"), dpi=DPI, workers=2, max_buffer_mb=0.01
+    )
+
+    frames = np.fromfile(raw_path, dtype=np.uint8).reshape(len(positions), height, width, 3)
+    for frame, frame_positions in zip(frames, positions):
+        np.testing.assert_array_equal(frame, render_full_frame(figure_args, frame_positions))
@@ -0,0 +1,183 @@
+import sys
+import glob
+import json
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.append(".")
+from src.tsu_analyzer import helpers
+
+TRACK_FILE = "track_coords/laguna_seca_cyber.csv"
+
+# eventstats files of the examples (the session file has no race stats)
+EVENT_FILES = [
+    path
+    for path in sorted(glob.glob("examples/*.json"))
+    if not path.endswith("_session.json")
+]
+
+
+def load(path):
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def get_results_df_loop(result_dict):
+    # the row by row implementation get_results_df replaced, kept as reference
+    race_stats = result_dict.get("raceStats", [])
+
+    indices_of_sector_checkpoints = race_stats["checkpoints"]["sectorToCheckpoint"][1:]
+
+    result_time_data = []
+
+    for player_index, player_stat in enumerate(race_stats["playerStats"], start=0):
+        player_data = []
+
+        start_time = player_stat["startTime"]
+        last_cp_time = None
+
+        for lap, lap_data in enumerate(player_stat["checkpointTimes"], start=1):
+            sector = 1
+
+            for cp, cp_time in enumerate(lap_data["times"], start=0):
+                if cp in indices_of_sector_checkpoints:
+                    sector += 1
+
+                player_data.append(
+                    {
+                        "lap": lap,
+                        "sector": sector,
+                        "cp": cp,
+                        "player_index": player_index,
+                        "time": (
+                            (cp_time - start_time) / 10000.0
+                            if last_cp_time is None
+                            else (cp_time - last_cp_time) / 10000.0
+                        ),
+                    }
+                )
+
+                last_cp_time = cp_time
+
+        result_time_data.append(player_data)
+
+    flat_data = [item for sublist in result_time_data for item in sublist]
+    df = pd.DataFrame(flat_data)
+
+    df = df.loc[((df["lap"] != 1) | (df["cp"] != 0))].reset_index(drop=True)
+
+    cp_zero_indices = df[df["cp"] == 0].index
+
+    for idx in cp_zero_indices:
+        df.at[idx, "lap"] -= 1
+        df.at[idx, "sector"] = df.at[idx - 1, "sector"]
+        df.at[idx, "cp"] = df.at[idx - 1, "cp"] + 1
+
+    df.sort_values(by=["lap", "cp", "player_index"], ascending=True, inplace=True)
+
+    return df
+
+
+@pytest.mark.parametrize("path", EVENT_FILES)
+def test_get_results_df_matches_loop(path):
+    result_dict = load(path)
+
+    if not any(
+        lap_data["times"]
+        for player_stat in result_dict["raceStats"]["playerStats"]
+        for lap_data in player_stat["checkpointTimes"]
+    ):
+        # nobody crossed a checkpoint, the loop could not even build its columns
+        df = helpers.get_results_df(result_dict)
+        assert df.empty
+        assert list(df.columns) == ["lap", "sector", "cp", "player_index", "time"]
+        return
+
+    pd.testing.assert_frame_equal(
+        helpers.get_results_df(result_dict), get_results_df_loop(result_dict)
+    )
+
+
+def test_get_results_df_consecutive_cp_zero():
+    # laps with only the finish line time follow each other, every cp 0 entry continues the previous lap
+    result_dict = {
+        "raceStats": {
+            "checkpoints": {"sectorToCheckpoint": [0, 2]},
+            "playerStats": [
+                {
+                    "startTime": 100,
+                    "checkpointTimes": [
+                        {"times": [100, 200, 300, 400]},
+                        {"times": [500]},
+                        {"times": [600]},
+                    ],
+                },
+                {
+                    "startTime": 100,
+                    "checkpointTimes": [
+                        {"times": [110, 220, 330, 440]},
+                        {"times": [550, 660, 770, 880]},
+                        {"times": [990]},
+                    ],
+                },
+            ],
+        }
+    }
+
+    pd.testing.assert_frame_equal(
+        helpers.get_results_df(result_dict), get_results_df_loop(result_dict)
+    )
+
+
+def get_track_data_loop(path):
+    # the row by row implementation get_track_data replaced, kept as reference
+    df = pd.read_csv(path)
+
+    df = pd.concat([df.iloc[1:], df.iloc[:1]], ignore_index=True)
+
+    df["distance_to_last"] = [
+        (
+            helpers._calculate_distance(df.iloc[i], df.iloc[i - 1])
+            if i > 0
+            else helpers._calculate_distance(df.iloc[i], df.iloc[-1])
+        )
+        for i in range(len(df))
+    ]
+
+    df["cp"] = range(1, len(df) + 1)
+
+    df["sector"] = None
+    df["sector_ends"] = False
+
+    sector = 1
+
+    for i in range(len(df)):
+        df.at[i, "sector"] = sector
+
+        if df.at[i, "Type"] == "Sector":
+            sector += 1
+            df.at[i, "sector_ends"] = True
+
+    df.at[len(df) - 1, "sector_ends"] = True
+
+    return df[["cp", "sector", "sector_ends", "x", "y", "z", "distance_to_last"]]
+
+
+def test_get_track_data_matches_loop():
+    expected = get_track_data_loop(TRACK_FILE)
+
+    # the sector numbers used to be an object column
+    expected = expected.astype({"sector": np.int64})
+
+    pd.testing.assert_frame_equal(helpers.get_track_data(TRACK_FILE), expected)
+
+
+def test_get_track_data_cumulative_distance():
+    df = helpers.get_track_data(TRACK_FILE, cumulative_distance=True)
+
+    distances = get_track_data_loop(TRACK_FILE)["distance_to_last"]
+    np.testing.assert_allclose(df["cumulative_distance"], np.cumsum(distances))
+
+    # the last checkpoint is the start-finish-line, so the track length is the sum of all distances
+    assert df["cumulative_distance"].iloc[-1] == pytest.approx(df["distance_to_last"].sum())
@@ -0,0 +1,159 @@
+import sys
+import glob
+import random
+import pytest
+
+sys.path.append(".")
+from src.tsu_analyzer.db.Saver import Saver
+from src.tsu_analyzer.leaderboard import (
+    Leaderboard,
+    Leaderboards,
+    get_top_lines,
+    format_seconds_to_time,
+)
+
+EVENT_FILES = [
+    path
+    for path in sorted(glob.glob("examples/*.json"))
+    if not path.endswith("_session.json")
+]
+
+
+def get_sorted_best_laps(laps):
+    # laps: (steam_id, lap_time) in the order they were set, personal bests ordered like the leaderboard
+    best_laps = {}
+
+    for order, (steam_id, lap_time) in enumerate(laps):
+        if steam_id not in best_laps or lap_time < best_laps[steam_id][0]:
+            best_laps[steam_id] = (lap_time, order)
+
+    return [
+        (steam_id, lap_time)
+        for steam_id, (lap_time, _) in sorted(best_laps.items(), key=lambda item: item[1])
+    ]
+
+
+def test_leaderboard_positions():
+    leaderboard = Leaderboard()
+
+    assert leaderboard.add(1, "A", "Car", 80.0, 0) == (None, 1)
+    assert leaderboard.add(2, "B", "Car", 79.0, 1) == (None, 1)
+    assert leaderboard.add(3, "C", "Car", 81.0, 2) == (None, 3)
+
+    # slower and equal laps are no personal best
+    assert leaderboard.add(1, "A", "Car", 80.5, 3) is None
+    assert leaderboard.add(1, "A", "Car", 80.0, 4) is None
+
+    # improvement from P3 to P2
+    assert leaderboard.add(3, "C", "Car", 79.5, 5) == (3, 2)
+    assert leaderboard.add(3, "C", "Car", 79.4, 6) == (2, 2)
+
+    assert leaderboard.get_top() == [
+        ("B", 79.0, "Car"),
+        ("C", 79.4, "Car"),
+        ("A", 80.0, "Car"),
+    ]
+
+
+def test_leaderboard_ties():
+    # equal times are ordered by who set them first
+    leaderboard = Leaderboard()
+
+    leaderboard.add(1, "A", "Car", 80.0, 10)
+    assert leaderboard.add(2, "B", "Car", 80.0, 11) == (None, 2)
+    assert leaderboard.add(3, "C", "Car", 80.0, 5) == (None, 1)
+
+    assert [name for name, _, _ in leaderboard.get_top()] == ["C", "A", "B"]
+
+
+def test_leaderboard_random_laps():
+    rng = random.Random(0)
+    laps = [
+        (rng.randrange(30), rng.choice([78.0, 78.5, 79.0, 79.5, 80.0])) for _ in range(500)
+    ]
+
+    leaderboard = Leaderboard()
+    for order, (steam_id, lap_time) in enumerate(laps):
+        leaderboard.add(steam_id, str(steam_id), "Car", lap_time, order)
+
+    expected = get_sorted_best_laps(laps)
+
+    assert [(steam_id, lap_time) for lap_time, _, steam_id in leaderboard.entries] == expected
+    assert leaderboard.get_top(5) == [
+        (str(steam_id), lap_time, "Car") for steam_id, lap_time in expected[:5]
+    ]
+
+    for position, (steam_id, _) in enumerate(expected, start=1):
+        assert leaderboard.get_position(steam_id) == position
+
+
+def test_leaderboards_add_rows():
+    # every example file in order, the leaderboard of each track is the same as sorting all of its laps
+    leaderboards = Leaderboards()
+    laps_by_track = {}
+    names = {}
+
+    for path in EVENT_FILES:
+        rows = Saver(path).get_rows()
+        lines = leaderboards.add_rows(rows)
+
+        laps = laps_by_track.setdefault(rows["track"]["guid"], [])
+        file_laps = []
+        for player in rows["players"]:
+            steam_id = player["driver"]["id"]
+            names[steam_id] = (player["driver"]["name"], player["car"]["name"])
+
+            for lap_result in player["lap_results"] or []:
+                file_laps.append((steam_id, lap_result["lap_time"]))
+
+        # the best lap of every driver in a file counts from the file, fastest first
+        laps.extend(sorted(get_sorted_best_laps(file_laps), key=lambda lap: lap[1]))
+
+        expected = get_sorted_best_laps(laps)
+        top_lines = get_top_lines(
+            [
+                (names[steam_id][0], lap_time, names[steam_id][1])
+                for steam_id, lap_time in expected[:10]
+            ]
+        )
+
+        assert lines[len(lines) - len(top_lines) :] == top_lines
+
+        for line in lines[: len(lines) - len(top_lines)]:
+            assert line.startswith("/broadcast New PB: ")
+
+
+def test_leaderboards_add_rows_lines():
+    leaderboards = Leaderboards()
+
+    def get_rows(lap_times):
+        return {
+            "track": {"guid": "track"},
+            "players": [
+                {
+                    "driver": {"id": steam_id, "name": f"Driver {steam_id}"},
+                    "car": {"name": "Car"},
+                    "lap_results": [{"lap_time": lap_time} for lap_time in times],
+                }
+                for steam_id, times in lap_times.items()
+            ],
+        }
+
+    lines = leaderboards.add_rows(get_rows({1: [81.0, 80.0], 2: [79.0]}))
+    assert lines[:2] == [
+        f"/broadcast New PB: Driver 2 {format_seconds_to_time(79.0)} (Car), P1",
+        f"/broadcast New PB: Driver 1 {format_seconds_to_time(80.0)} (Car), P2",
+    ]
+
+    lines = leaderboards.add_rows(get_rows({1: [78.0], 2: [79.5]}))
+    assert lines[0] == (
+        f"/broadcast New PB: Driver 1 {format_seconds_to_time(78.0)} (Car), P1 (up from P2)"
+    )
+    assert lines[1] == "/broadcast ### Current Top 10 ###"
+
+
+@pytest.mark.parametrize(
+    "seconds, text", [(83.456, "1:23.456"), (5.0, "0:05.000"), (600.25, "10:00.250")]
+)
+def test_format_seconds_to_time(seconds, text):
+    assert format_seconds_to_time(seconds) == text
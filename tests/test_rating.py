@@ -0,0 +1,104 @@
+import sys
+import glob
+import json
+from collections import defaultdict
+import numpy as np
+import pytest
+
+sys.path.append(".")
+from src.tsu_analyzer.elo import rating
+
+
+def calc_expected_score(driver_elo, opponent_elo, D=400):
+    return 1.0 / (1 + np.power(10.0, (opponent_elo - driver_elo) / D))
+
+
+def calc_elo_changes_loop(elo_values, positions, k_factor=rating.K_FACTOR):
+    # the per pair loop the elo scripts used before rating.calc_elo_changes, kept as reference
+    overall_players = len(elo_values)
+    opponents = overall_players - 1
+
+    changes = np.zeros(overall_players)
+
+    for i in range(overall_players):
+        expected_score_nominator = 0.0
+
+        for j in range(overall_players):
+            if i != j:
+                expected_score_nominator += calc_expected_score(
+                    elo_values[i], elo_values[j], D=400
+                )
+
+        expected_score = expected_score_nominator / (overall_players * opponents / 2.0)
+        scoring = (overall_players - positions[i]) / (overall_players * opponents / 2.0)
+
+        changes[i] = k_factor * opponents * (scoring - expected_score)
+
+    return changes
+
+
+def get_race_positions():
+    # finishing positions of every race in examples/ and whiplash_java_tool_exports/ with at least two drivers
+    races = []
+
+    for path in sorted(glob.glob("examples/*.json")):
+        with open(path, encoding="utf-8-sig") as f:
+            data = json.load(f)
+
+        entries = data.get("raceStats", {}).get("raceRanking", {}).get("entries", [])
+        races.append((path, list(range(1, len(entries) + 1))))
+
+    for path in sorted(glob.glob("whiplash_java_tool_exports/*.dbjson")):
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+
+        positions_by_event = defaultdict(list)
+        for player in data["players"]:
+            for player_event in player.get("events", []):
+                if player_event.get("position"):
+                    positions_by_event[player_event["eventIndex"]].append(
+                        player_event["position"]
+                    )
+
+        for event_index, positions in sorted(positions_by_event.items()):
+            races.append((f"{path}#{event_index}", sorted(positions)))
+
+    return [(name, positions) for name, positions in races if len(positions) >= 2]
+
+
+RACES = get_race_positions()
+
+
+@pytest.mark.parametrize("name, positions", RACES, ids=[name for name, _ in RACES])
+def test_calc_elo_changes_matches_loop(name, positions):
+    rng = np.random.default_rng(len(positions))
+
+    for elo_values in (
+        np.full(len(positions), rating.START_ELO),
+        rng.uniform(rating.MIN_ELO, 2500, len(positions)),
+    ):
+        np.testing.assert_allclose(
+            rating.calc_elo_changes(elo_values, positions),
+            calc_elo_changes_loop(elo_values, positions),
+            rtol=0,
+            atol=1e-9,
+        )
+
+
+def test_calc_elo_changes_sum_to_zero():
+    # every point one driver wins is lost by the others
+    elo_values = [1000.0, 1200.0, 900.0, 1500.0]
+
+    assert rating.calc_elo_changes(elo_values, [2, 1, 4, 3]).sum() == pytest.approx(0.0)
+
+
+def test_calc_elo_changes_single_driver():
+    np.testing.assert_array_equal(rating.calc_elo_changes([1000.0], [1]), [0.0])
+    assert len(rating.calc_elo_changes([], [])) == 0
+
+
+def test_calc_new_elo_values_min_elo():
+    new_values = rating.calc_new_elo_values([rating.MIN_ELO, 2500.0], [2, 1], k_factor=400)
+
+    assert new_values[0] == rating.MIN_ELO
+    assert new_values[1] > 2500.0
@@ -0,0 +1,190 @@
+import os
+import sys
+import glob
+import json
+from datetime import datetime
+import pytest
+from sqlalchemy import select, func, text
+from sqlalchemy.orm import Session
+
+sys.path.append(".")
+from src.tsu_analyzer import stream_parser
+from src.tsu_analyzer.db import engine as engine_module
+from src.tsu_analyzer.db.models import Base, LapResult, CheckpointResult, SectorResult
+from src.tsu_analyzer.db.Saver import Saver
+from src.tsu_analyzer.db.identity_cache import identity_cache
+from src.tsu_analyzer.db.ledger import get_file_hash
+
+EVENT_FILES = [
+    path
+    for path in sorted(glob.glob("examples/*.json"))
+    if not path.endswith("_session.json")
+]
+
+
+def load(path):
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def get_rows_loaded(path):
+    # rows of a file from the whole document, what get_rows streams player by player
+    data = load(path)
+
+    number_checkpoints = len(data["raceStats"]["checkpoints"]["checkpointToSector"])
+    if data["level"]["levelType"] == "SpecialStage":
+        number_checkpoints -= 1
+
+    indices_sectors = data["raceStats"]["checkpoints"]["sectorToCheckpoint"]
+
+    players = [
+        {"driver": player["player"], "car": player["vehicle"], "lap_results": None}
+        for player in data["players"]
+    ]
+
+    for i, player_stat in enumerate(data["raceStats"]["playerStats"][: len(players)]):
+        players[i]["lap_results"] = Saver.get_lap_results(
+            player_stat["checkpointTimes"], number_checkpoints, indices_sectors
+        )
+
+    with open(path, "rb") as f:
+        file_hash = get_file_hash(f.read())
+
+    return {
+        "ingested_file": {
+            "file_name": path,
+            "file_hash": file_hash,
+            "utc_start_time_ticks": data["utcStartTimeTicks"],
+            "level_guid": data["level"]["guid"],
+        },
+        "track": data["level"],
+        "driven_at": datetime.strptime(data["utcStartTime"], "%Y-%m-%dT%H:%M:%S%z"),
+        "players": players,
+    }
+
+
+@pytest.mark.parametrize("use_ijson", [True, False])
+@pytest.mark.parametrize("path", EVENT_FILES)
+def test_get_rows_matches_loaded_file(path, use_ijson, monkeypatch):
+    if not use_ijson:
+        monkeypatch.setattr(stream_parser, "ijson", None)
+    elif stream_parser.ijson is None:
+        pytest.skip("ijson is not installed")
+
+    assert Saver(path).get_rows() == get_rows_loaded(path)
+
+
+@pytest.mark.parametrize("path", EVENT_FILES)
+def test_iter_rows_event_before_players(path):
+    kinds = [kind for kind, _ in Saver(path).iter_rows()]
+
+    assert kinds[0] == "event"
+    assert kinds[1:] == ["player"] * (len(kinds) - 1)
+
+
+def test_get_checkpoint_hash():
+    cp_times = [100, 250, 400]
+    indices_sectors = [0, 1]
+
+    checkpoint_hash = Saver.get_checkpoint_hash(cp_times, 560, indices_sectors)
+
+    assert checkpoint_hash == Saver.get_checkpoint_hash(list(cp_times), 560, [0, 1])
+
+    # any value the checkpoint and sector results are derived from changes the hash
+    assert checkpoint_hash != Saver.get_checkpoint_hash([100, 251, 400], 560, indices_sectors)
+    assert checkpoint_hash != Saver.get_checkpoint_hash(cp_times, 561, indices_sectors)
+    assert checkpoint_hash != Saver.get_checkpoint_hash(cp_times, 560, [0, 2])
+
+
+@pytest.mark.parametrize("path", EVENT_FILES)
+def test_lap_results_checkpoint_hash(path):
+    # the hash of every lap is the one of its raw checkpoint times, so an unchanged lap is skipped on reingest
+    data = load(path)
+    indices_sectors = data["raceStats"]["checkpoints"]["sectorToCheckpoint"]
+    rows = Saver(path).get_rows()
+
+    for i, player in enumerate(rows["players"]):
+        if not player["lap_results"]:
+            continue
+
+        hashes = {lap_result["checkpoint_hash"] for lap_result in player["lap_results"]}
+        all_checkpoint_times = data["raceStats"]["playerStats"][i]["checkpointTimes"]
+
+        expected = {
+            Saver.get_checkpoint_hash(
+                all_checkpoint_times[j]["times"],
+                all_checkpoint_times[j + 1]["times"][0],
+                indices_sectors,
+            )
+            for j in range(len(all_checkpoint_times) - 1)
+        }
+
+        assert hashes <= expected
+        assert len(hashes) == len(player["lap_results"])
+
+
+@pytest.fixture
+def test_engine(monkeypatch):
+    # TSU_TEST_POSTGRES_URL has to point to a throwaway database, its tsu schema is created from scratch
+    url = os.environ.get("TSU_TEST_POSTGRES_URL")
+    if not url:
+        pytest.skip("TSU_TEST_POSTGRES_URL is not set")
+
+    monkeypatch.setenv("TSU_HOTLAPPING_POSTGRES_URL", url)
+    monkeypatch.setattr(engine_module, "_engines", {})
+    identity_cache.clear()
+
+    engine = engine_module.get_engine()
+    with engine.begin() as connection:
+        connection.execute(text("DROP SCHEMA IF EXISTS tsu CASCADE"))
+        connection.execute(text("CREATE SCHEMA tsu"))
+    Base.metadata.create_all(engine)
+
+    yield engine
+
+    identity_cache.clear()
+    engine.dispose()
+
+
+def count(session, model, *conditions):
+    return session.scalar(select(func.count(model.id)).where(*conditions))
+
+
+def test_run_failed_lap_keeps_checkpoint_hash_unset(test_engine, monkeypatch):
+    path = "examples/eventstats_laguna.json"
+
+    bulk_insert_mappings = Session.bulk_insert_mappings
+
+    def fail_sector_results(session, mapper, mappings, *args, **kwargs):
+        if mapper is SectorResult:
+            raise RuntimeError("insert failed")
+        return bulk_insert_mappings(session, mapper, mappings, *args, **kwargs)
+
+    # the sector results of every lap fail after its checkpoint results were written
+    with monkeypatch.context() as patch:
+        patch.setattr(Session, "bulk_insert_mappings", fail_sector_results)
+        Saver(path).run()
+
+    # the laps are saved, their checkpoint and sector results and hash are not
+    with Session(test_engine) as session:
+        assert count(session, LapResult) > 0
+        assert count(session, LapResult, LapResult.checkpoint_hash.is_not(None)) == 0
+        assert count(session, CheckpointResult) == 0
+        assert count(session, SectorResult) == 0
+
+    # so the next reingest does not skip them
+    Saver(path).run(force=True)
+
+    rows = Saver(path).get_rows()
+    lap_results = [
+        lap_result for player in rows["players"] for lap_result in player["lap_results"] or []
+    ]
+
+    with Session(test_engine) as session:
+        assert count(session, LapResult, LapResult.checkpoint_hash.is_(None)) == 0
+        assert count(session, CheckpointResult) == sum(
+            len(lap_result["cp_results"]) for lap_result in lap_results
+        )
+        assert count(session, SectorResult) == sum(
+            len(lap_result["sector_results"]) for lap_result in lap_results
+        )
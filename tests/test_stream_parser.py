@@ -0,0 +1,114 @@
+import sys
+import glob
+import json
+import pytest
+
+sys.path.append(".")
+from src.tsu_analyzer import stream_parser
+from src.tsu_analyzer.stream_parser import iter_event, load_event, iter_dbjson
+from src.tsu_analyzer.db.ledger import get_file_hash, get_path_hash
+
+EVENT_FILES = [
+    path
+    for path in sorted(glob.glob("examples/*.json"))
+    if not path.endswith("_session.json")
+]
+DBJSON_FILES = sorted(glob.glob("whiplash_java_tool_exports/*.dbjson"))
+
+
+def load(path):
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def read_bytes(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+@pytest.fixture(params=["ijson", "json"])
+def parser(request, monkeypatch):
+    # every test runs with ijson and with the json.load fallback
+    if request.param == "json":
+        monkeypatch.setattr(stream_parser, "ijson", None)
+    elif stream_parser.ijson is None:
+        pytest.skip("ijson is not installed")
+
+    return request.param
+
+
+def split_event(events):
+    # the event dict and the list of player stats of iter_event
+    player_stats = []
+
+    for kind, value in events:
+        if kind == "event":
+            event = value
+        else:
+            player_index, player_stat = value
+            assert player_index == len(player_stats)
+            player_stats.append(player_stat)
+
+    return event, player_stats
+
+
+def without_player_stats(data):
+    data["raceStats"]["playerStats"] = []
+    return data
+
+
+@pytest.mark.parametrize("path", EVENT_FILES)
+def test_iter_event_matches_json_load(path, parser):
+    data = load(path)
+    expected_player_stats = data["raceStats"]["playerStats"]
+
+    with open(path, "rb") as file:
+        sources = [path, read_bytes(path), file]
+
+        for source in sources:
+            event, player_stats = split_event(iter_event(source))
+
+            assert player_stats == expected_player_stats
+            assert event == without_player_stats(load(path))
+
+
+@pytest.mark.parametrize("path", EVENT_FILES)
+def test_iter_event_yields_event_first(path, parser):
+    kinds = [kind for kind, _ in iter_event(path)]
+
+    assert kinds[0] == "event"
+    assert kinds.count("event") == 1
+
+
+@pytest.mark.parametrize("path", EVENT_FILES)
+def test_load_event_matches_json_load(path, parser):
+    assert load_event(path) == without_player_stats(load(path))
+
+
+def test_iter_event_player_stats_before_players(parser):
+    # players and checkpoints after the player stats, the file is parsed again as a whole
+    data = load(EVENT_FILES[0])
+    race_stats = data.pop("raceStats")
+    reordered = {"raceStats": race_stats, **data}
+    content = json.dumps(reordered).encode("utf-8")
+
+    event, player_stats = split_event(iter_event(content))
+
+    assert player_stats == race_stats["playerStats"]
+    assert event == without_player_stats(json.loads(content))
+
+
+@pytest.mark.parametrize("path", DBJSON_FILES)
+@pytest.mark.parametrize("key", ["players", "events"])
+def test_iter_dbjson_matches_json_load(path, key, parser):
+    assert list(iter_dbjson(path, key)) == load(path)[key]
+
+
+def test_iter_dbjson_missing_key(parser):
+    assert list(iter_dbjson(b'{"players": []}', "events")) == []
+
+
+@pytest.mark.parametrize("path", EVENT_FILES + DBJSON_FILES)
+def test_get_path_hash_matches_file_hash(path):
+    # chunks smaller than the files, so the hash is built from several updates
+    assert get_path_hash(path, chunk_size=4096) == get_file_hash(read_bytes(path))